@@ -0,0 +1,63 @@
+"""
+Замер экспорта в Markdown от числа процессов: первый экспорт (пишутся все страницы) и повторный (страницы не менялись).
+
+    python -m benchmarks.bench_export_workers --rows 100000 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.exporters import MarkdownExporter
+from src.scanner import DBStorage, LibraryStorage, hash_to_blob
+
+
+def fill_db(db_path, count_rows):
+    db = DBStorage(db_path)
+    with db.bulk_mode():
+        db.cu.executemany(
+            DBStorage.SQL_INSERT_ROW,
+            (
+                (hash_to_blob(f'{number:064x}'), f'directory{number % 1000:03}', f'file{number:07}.pdf')
+                for number in range(count_rows)
+            ),
+        )
+
+    db.close()
+
+
+def measure(db_path, storage_structure, workers):
+    with LibraryStorage() as lib_storage:
+        lib_storage.set_db(DBStorage(db_path))
+        exporter = MarkdownExporter(storage_structure, '/library')
+        started_at = time.perf_counter()
+        report = lib_storage.export_db(exporter, workers=workers)
+        return time.perf_counter() - started_at, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        fill_db(db_path, args.rows)
+        with LibraryStorage() as lib_storage:
+            lib_storage.set_db(DBStorage(db_path))
+            print(f'cpus={os.cpu_count()} get_export_workers()={lib_storage.get_export_workers()}')
+
+        for workers in args.workers:
+            storage_structure = os.path.join(tmp_dir, f'export{workers}')
+            os.makedirs(storage_structure)
+            for label in ('first', 'repeat'):
+                elapsed, report = measure(db_path, storage_structure, workers)
+                print(
+                    f'workers={workers:<3} {label:<6} {elapsed:8.3f} s {args.rows / elapsed:10.0f} rows/s '
+                    f'rewritten={report["rewritten"]} skipped={report["skipped"]}'
+                )
+
+
+if __name__ == '__main__':
+    main()
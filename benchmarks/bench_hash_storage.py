@@ -0,0 +1,78 @@
+"""
+Размер базы и скорость поиска по хешу: шестнадцатеричная строка (прежняя схема) против 32 байт.
+
+    python -m benchmarks.bench_hash_storage --rows 1000000 --lookups 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from src.scanner import DBStorage, hash_to_blob
+
+SQL_CREATE_HEX_TABLE = '''
+    CREATE TABLE files (
+        hash VARCHAR(64) UNIQUE,
+        id INTEGER PRIMARY KEY,
+        directory VARCHAR(255),
+        filename VARCHAR(255),
+        is_deleted INT NOT NULL DEFAULT 0
+    )'''
+
+
+def make_hash(number):
+    return random.Random(number).randbytes(32).hex()
+
+
+def iter_rows(count_rows, convert_hash):
+    for number in range(count_rows):
+        yield convert_hash(make_hash(number)), f'directory{number % 1000:03}', f'file{number:07}.pdf'
+
+
+def fill_hex_db(db_path, count_rows):
+    connection = sqlite3.connect(db_path)
+    connection.execute(SQL_CREATE_HEX_TABLE)
+    connection.executemany(DBStorage.SQL_INSERT_ROW, iter_rows(count_rows, str))
+    connection.commit()
+    connection.close()
+
+
+def fill_blob_db(db_path, count_rows):
+    connection = sqlite3.connect(db_path)
+    connection.executescript(DBStorage.SQL_CREATE_TABLE)
+    connection.executemany(DBStorage.SQL_INSERT_ROW, iter_rows(count_rows, hash_to_blob))
+    connection.commit()
+    connection.close()
+
+
+def measure_lookups(db_path, hashes):
+    connection = sqlite3.connect(db_path)
+    started_at = time.perf_counter()
+    for file_hash in hashes:
+        connection.execute(DBStorage.SQL_SELECT_FILE, (file_hash,)).fetchone()
+
+    elapsed = time.perf_counter() - started_at
+    connection.close()
+    return len(hashes) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000, help='строк в синтетической базе')
+    parser.add_argument('--lookups', type=int, default=100_000, help='поисков по хешу')
+    args = parser.parse_args()
+
+    numbers = random.Random(0).choices(range(args.rows), k=args.lookups)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, fill_db, convert_hash in (('hex', fill_hex_db, str), ('blob', fill_blob_db, hash_to_blob)):
+            db_path = os.path.join(tmp_dir, f'{name}.db')
+            fill_db(db_path, args.rows)
+            size_mb = os.path.getsize(db_path) / 2 ** 20
+            lookups_per_second = measure_lookups(db_path, [convert_hash(make_hash(number)) for number in numbers])
+            print(f'{name:<5} {size_mb:10.1f} MB {lookups_per_second:12.0f} lookups/s')
+
+
+if __name__ == '__main__':
+    main()
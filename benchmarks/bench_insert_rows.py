@@ -0,0 +1,104 @@
+"""
+Замер скорости DBStorage.insert_rows на синтетической базе: построчный алгоритм против пакетного.
+
+    python -m benchmarks.bench_insert_rows --rows 1000000 --batch 30 1000 5000 --existing 0 50 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.scanner import DBStorage, exclusive_write_method, hash_to_blob
+
+
+class RowByRowDBStorage(DBStorage):
+    """Прежний алгоритм: SELECT и INSERT/UPDATE на каждую строку порции и строка индекса на каждую новую строку"""
+    @exclusive_write_method
+    def insert_rows(self, with_id: bool = True, func=None):
+        sql_insert = self.SQL_INSERT_ROW_WITH_ID if with_id else self.SQL_INSERT_ROW
+        for sql_params in self.seq_sql_params:
+            file_hash = hash_to_blob(sql_params[0])
+            row = self.cu.execute(self.SQL_SELECT_FILE, (file_hash,)).fetchone()
+            inserted_directory, inserted_filename = sql_params[2 if with_id else 1:]
+            if row:
+                existed_directory, existed_filename = row
+                self.set_is_not_deleted(sql_params[0])
+            else:
+                self.cu.execute(sql_insert, (file_hash, *sql_params[1:]))
+                if self.has_fts:
+                    self.cu.execute(self.SQL_INSERT_FTS_ROW, (self.cu.lastrowid, inserted_directory, inserted_filename))
+                existed_directory, existed_filename = None, None
+
+            if func:
+                func(inserted_directory, inserted_filename, existed_directory, existed_filename, sql_params[0])
+
+        self.seq_sql_params.clear()
+
+
+def make_hash(number):
+    return f'{number:064x}'
+
+
+def fill_db(db_path, count_rows):
+    db = DBStorage(db_path)
+    with db.bulk_mode():
+        db.cu.executemany(
+            DBStorage.SQL_INSERT_ROW,
+            (
+                (hash_to_blob(make_hash(number)), f'directory{number % 1000:03}', f'file{number:07}.pdf')
+                for number in range(count_rows)
+            ),
+        )
+
+    db.close()
+
+
+def measure(db_class, db_path, count_rows, batch_size, existing_percent):
+    """Вставляет count_rows строк, из которых existing_percent процентов уже есть в базе"""
+    db = db_class(db_path, count_rows_for_insert=batch_size)
+    started_at = time.perf_counter()
+    for number in range(count_rows):
+        file_number = number if number % 100 < existing_percent else number + 10 ** 9
+        db.append_row((make_hash(file_number), 'directory', f'file{file_number}.pdf'))
+        if db.is_ready_for_insert():
+            db.insert_rows(with_id=False, func=lambda *args: None)
+
+    db.insert_rows(with_id=False, func=lambda *args: None)
+    elapsed = time.perf_counter() - started_at
+    db.close()
+    return count_rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000, help='строк в синтетической базе')
+    parser.add_argument('--insert', type=int, default=100_000, help='вставляемых строк')
+    parser.add_argument('--batch', type=int, nargs='+', default=[30, 1000, 5000])
+    parser.add_argument(
+        '--existing', type=int, nargs='+', default=[0, 50, 100],
+        help='процент вставляемых строк, уже известных базе (100 - повторное сканирование)',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_path = os.path.join(tmp_dir, 'template.db')
+        fill_db(template_path, args.rows)
+        with open(template_path, 'rb') as template_file:
+            template = template_file.read()
+
+        for existing_percent in args.existing:
+            for batch_size in args.batch:
+                for db_class in (RowByRowDBStorage, DBStorage):
+                    db_path = os.path.join(tmp_dir, 'bench.db')
+                    with open(db_path, 'wb') as db_file:
+                        db_file.write(template)
+
+                    rows_per_second = measure(db_class, db_path, args.insert, batch_size, existing_percent)
+                    print(
+                        f'existing={existing_percent:<3}% {db_class.__name__:<18} batch={batch_size:<6} '
+                        f'{rows_per_second:12.0f} rows/s'
+                    )
+
+
+if __name__ == '__main__':
+    main()
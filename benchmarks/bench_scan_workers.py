@@ -0,0 +1,45 @@
+"""
+Замер масштабирования хеширования в scan_to_db от числа потоков.
+
+    python -m benchmarks.bench_scan_workers --files 400 --size-kib 2048 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.scanner import DBStorage, LibraryStorage
+
+
+def create_library(library_path, count_files, size):
+    for number in range(count_files):
+        directory = os.path.join(library_path, f'directory{number % 10:02}')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'file{number:06}.bin'), 'wb') as afile:
+            afile.write(os.urandom(size))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=400)
+    parser.add_argument('--size-kib', type=int, default=2048)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    size = args.size_kib * 1024
+    total_mib = args.files * size / 1024 / 1024
+    with tempfile.TemporaryDirectory() as library_path:
+        create_library(library_path, args.files, size)
+        for workers in args.workers:
+            with LibraryStorage() as lib_storage:
+                lib_storage.set_db(DBStorage(':memory:'))
+                started_at = time.perf_counter()
+                lib_storage.scan_to_db(library_path, 'original', full_rehash=True, workers=workers)
+                elapsed = time.perf_counter() - started_at
+
+            print(f'workers={workers:<3} {elapsed:8.3f} s {total_mib / elapsed:10.1f} MiB/s')
+
+
+
+if __name__ == '__main__':
+    main()
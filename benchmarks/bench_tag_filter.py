@@ -0,0 +1,100 @@
+"""
+Скорость отбора файлов по тегам: прежнее соединение с GROUP BY против полусоединений TagFilter.
+
+    python -m benchmarks.bench_tag_filter --rows 1000000 --assignments 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from src.scanner import DBStorage, TagFilter, hash_to_blob
+
+COUNT_ROOT_TAGS = 20
+COUNT_CHILD_TAGS = 9
+
+SQL_LEGACY_SELECT = '''
+    SELECT files.hash, files.id, files.directory, files.filename FROM files
+    JOIN file_tag ON files.id = file_tag.file_id
+    WHERE file_tag.tag_id IN ({}) GROUP BY files.id ORDER BY files.filename, files.id LIMIT ?'''
+SQL_LEGACY_COUNT = '''
+    SELECT COUNT(DISTINCT files.id) FROM files
+    JOIN file_tag ON files.id = file_tag.file_id WHERE file_tag.tag_id IN ({})'''
+
+
+def fill_db(db_path, count_rows, count_assignments):
+    db = DBStorage(db_path)
+    tag_rows = []
+    for root_number in range(COUNT_ROOT_TAGS):
+        root_id = len(tag_rows) + 1
+        tag_rows.append((root_id, f'tag{root_id}', 0))
+        for _ in range(COUNT_CHILD_TAGS):
+            tag_rows.append((len(tag_rows) + 1, f'tag{len(tag_rows) + 1}', root_id))
+
+    generator = random.Random(0)
+    assignments = set()
+    while len(assignments) < count_assignments:
+        assignments.add((generator.randrange(1, count_rows + 1), generator.randrange(1, len(tag_rows) + 1)))
+
+    with db.bulk_mode():
+        db.cu.executemany(
+            DBStorage.SQL_INSERT_ROW,
+            (
+                (hash_to_blob(f'{number:064x}'), f'directory{number % 1000:03}', f'file{number:07}.pdf')
+                for number in range(count_rows)
+            ),
+        )
+        db.cu.executemany(DBStorage.SQL_IMPORT_TAG, tag_rows)
+        db.cu.executemany(DBStorage.SQL_IMPORT_TAG_TO_FILE, sorted(assignments))
+
+    db.close()
+
+
+def measure(func, repeat=5):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+
+    return (time.perf_counter() - started_at) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000, help='файлов в синтетической базе')
+    parser.add_argument('--assignments', type=int, default=100_000, help='привязок тегов к файлам')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'tags.db')
+        fill_db(db_path, args.rows, args.assignments)
+        db = DBStorage(db_path)
+        first_root, second_root = 1, COUNT_CHILD_TAGS + 2
+        legacy_tags = [2, 3]
+        cases = (
+            ('legacy: 2 теги, любой', None, legacy_tags),
+            ('filter: 2 теги, любой', TagFilter(any_of=legacy_tags, with_descendants=False), None),
+            ('filter: A с потомками', TagFilter(all_of=[first_root]), None),
+            ('filter: A и B с потомками', TagFilter(all_of=[first_root, second_root]), None),
+            ('filter: A и B, кроме C', TagFilter(all_of=[first_root, second_root], none_of=[2]), None),
+        )
+        for name, tag_filter, legacy in cases:
+            if legacy:
+                placeholders = ', '.join('?' * len(legacy))
+                page_ms, rows = measure(lambda: db.cu.execute(
+                    SQL_LEGACY_SELECT.format(placeholders), [*legacy, DBStorage.COUNT_ROWS_ON_PAGE],
+                ).fetchall())
+                count_ms, count_files = measure(
+                    lambda: db.cu.execute(SQL_LEGACY_COUNT.format(placeholders), legacy).fetchone()[0],
+                )
+            else:
+                page_ms, rows = measure(lambda: list(zip(range(DBStorage.COUNT_ROWS_ON_PAGE), db.select_rows(tag_filter))))
+                count_ms, count_files = measure(lambda: db.select_count(tag_filter))
+
+            print(f'{name:<28} {count_files:8} файлов  страница {page_ms:8.1f} мс  количество {count_ms:8.1f} мс')
+
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Скорость обхода хранилища без хеширования: прежний os.walk с os.chdir и os.stat на файл против Walker.
+
+    python -m benchmarks.bench_walk --files 1000000 --per-directory 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.scanner import LIBRARY_IGNORE_EXTENSIONS, LIBRARY_IGNORE_PATTERNS
+from src.walker import Walker
+
+
+def create_library(library_path, count_files, count_per_directory):
+    for number in range(count_files):
+        directory = os.path.join(library_path, f'directory{number // count_per_directory:05}')
+        if number % count_per_directory == 0:
+            os.makedirs(directory)
+
+        open(os.path.join(directory, f'file{number:07}.pdf'), 'wb').close()
+
+
+def legacy_walk(library_path):
+    cwd = os.getcwd()
+    os.chdir(library_path)
+    try:
+        for directory, _, filenames in os.walk('./'):
+            directory = directory[2:]
+            for filename in filenames:
+                if filename.split('.')[-1] in LIBRARY_IGNORE_EXTENSIONS:
+                    continue
+
+                full_path = os.path.join(directory, filename)
+                yield directory, filename, full_path, os.stat(full_path)
+    finally:
+        os.chdir(cwd)
+
+
+def measure(walk, library_path):
+    started_at = time.perf_counter()
+    count_files = sum(1 for _ in walk(library_path))
+    return time.perf_counter() - started_at, count_files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1_000_000, help='файлов в синтетическом хранилище')
+    parser.add_argument('--per-directory', type=int, default=1000, help='файлов в одной директории')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as library_path:
+        create_library(library_path, args.files, args.per_directory)
+        walker = Walker(LIBRARY_IGNORE_PATTERNS)
+        for name, walk in (('os.walk + os.stat', legacy_walk), ('Walker', walker.walk)):
+            elapsed, count_files = measure(walk, library_path)
+            print(f'{name:<18} {count_files:8} файлов {elapsed:8.2f} с {count_files / elapsed:12.0f} файлов/с')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 import json
+import os
 import sys
+from collections import Counter
 from pathlib import Path
+from queue import Empty, SimpleQueue
 from threading import Thread, current_thread
 
 import gi
@@ -11,7 +14,7 @@ from gi.repository import GLib, Gio, Gtk, GObject, Gdk
 from src.window_builder import WindowBuilder
 from src.scanner import (
     DBStorage, LibraryStorage, STATUS_NEW, STATUS_MOVED, STATUS_RENAMED, STATUS_MOVED_AND_RENAMED,
-    STATUS_UNTOUCHED, STATUS_DELETED, STATUS_DUPLICATE,
+    STATUS_UNTOUCHED, STATUS_DELETED, STATUS_DUPLICATE, LazyRows, Progress, TagFilter,
 )
 from src.exporters import MarkdownExporter
 from src.config import BASE_DIR, config
@@ -77,6 +80,56 @@ class Book(GObject.Object):  # TODO: Rename to File
         return self._title
 
 
+class BookListModel(GObject.Object, Gio.ListModel):
+    """
+    Модель списка файлов для Gtk.ListView: строки читаются из базы окнами, только когда их показывают.
+    Если файлы удалены после подсчёта, то вместо пропавших строк до обновления показываются пустые,
+    а в главном цикле строки пересчитываются и список получает items-changed.
+    """
+    __gtype_name__ = 'BookListModel'
+
+    def __init__(self, rows=()):
+        super().__init__()
+        self.rows = rows
+        # длина, о которой знает ListView: меняется только вместе с items-changed
+        self.count_items = len(rows)
+        self.is_refresh_scheduled = False
+
+    def do_get_item_type(self):
+        return Book
+
+    def do_get_n_items(self):
+        return self.count_items
+
+    def do_get_item(self, position):
+        if position >= self.count_items:
+            return None
+
+        item = self.rows[position] if position < len(self.rows) else None
+        if item is None:
+            if not self.is_refresh_scheduled:
+                self.is_refresh_scheduled = True
+                GLib.idle_add(self.refresh)
+
+            return Book(0, '', '')
+
+        return item
+
+    def refresh(self):
+        self.is_refresh_scheduled = False
+        count_removed = self.count_items
+        self.rows.reset()
+        self.count_items = len(self.rows)
+        self.items_changed(0, count_removed, self.count_items)
+        return GLib.SOURCE_REMOVE
+
+
+def make_book(row):
+    file_hash, book_id, directory, filename = row
+    path = Path(directory) / filename
+    return Book(book_id, path.name, path.parent)
+
+
 class Tag(GObject.Object):
     __gtype_name__ = 'Tag'
     
@@ -114,61 +167,110 @@ class Tag(GObject.Object):
         return self._children
 
 
+class TagChips:
+    """
+    Чипы тегов в строках списка файлов.
+    Теги файлов читаются заранее, одним запросом на каждое прочитанное окно списка, и берутся из кеша DBStorage,
+    а виджеты чипов строки переиспользуются при каждой привязке: меняются подписи, лишние чипы скрываются.
+    """
+    def __init__(self, lib_storage, func_delete_tag):
+        self.lib_storage = lib_storage
+        self.func_delete_tag = func_delete_tag
+
+    def prefetch(self, rows):
+        self.lib_storage.db.get_tags_by_files([row[1] for row in rows])
+
+    def show(self, tags_box, book):
+        chips = tags_box._chips
+        file_tags = self.lib_storage.db.get_tags_by_files([book.book_id])[book.book_id]
+        while len(chips) < len(file_tags):
+            chips.append(self.create_chip(tags_box))
+
+        for chip, (tag_name, tag_id) in zip(chips, file_tags):
+            chip.label.props.label = tag_name
+            chip.target = (book, tag_id)
+            chip.props.visible = True
+
+        for chip in chips[len(file_tags):]:
+            chip.target = None
+            chip.props.visible = False
+
+    def create_chip(self, tags_box):
+        chip = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        chip.props.margin_end = 6
+        chip.target = None
+        chip.label = Gtk.Label()
+        button = Gtk.Button(label='x')
+        button.connect('clicked', self.click_delete, chip)
+        chip.append(chip.label)
+        chip.append(button)
+        tags_box.append(chip)
+        return chip
+
+    def click_delete(self, _, chip):
+        if chip.target:
+            self.func_delete_tag(*chip.target)
+
+
 class BookListView:
     def _on_factory_setup(self, factory, list_item):
         builder = WindowBuilder(XML_DIR / 'item_book.xml', {})
         cell = builder.root_widget
         cell.builder = builder
+        cell.item = None
 
         builder.title.props.margin_bottom = 10
         builder.title._binding = None
         builder.path._binding = None
+        builder.tags._chips = []
         list_item.set_child(cell)
 
         builder.root_widget.set_name('item-file')
         builder.title.set_name('item-file-title')
+
+        # обработчики подключаются один раз и берут файл, привязанный к строке сейчас
+        builder.button_open_file.connect('clicked', lambda _: cell.item and self.open_file(cell.item))
+        builder.button_open_directory.connect('clicked', lambda _: cell.item and self.open_directory(cell.item))
+
+        controller = Gtk.GestureClick.new()
+        controller.connect('pressed', self.open_file_window, cell)
+        builder.title.add_controller(controller)
+
+        # https://pygobject.gnome.org/tutorials/gtk4/drag-and-drop.html
+        # https://www.opennet.ru/docs/RUS/gtk-reference/gtk-Drag-and-Drop.html
+        # https://docs.gtk.org/gtk4/drag-and-drop.html
+        drop_controller = Gtk.DropTarget.new(
+            type=GObject.TYPE_NONE, actions=Gdk.DragAction.COPY
+        )
+        drop_controller.set_gtypes([Tag])
+        drop_controller.connect("drop", self.on_drop, cell)
+        cell.add_controller(drop_controller)
     
-    def open_file(self, _, item: Book):
+    def open_file(self, item: Book):
         open_file_with_default_program(config.storage_books / item.path / item.title)
 
-    def open_directory(self, _, item: Book):
+    def open_directory(self, item: Book):
         open_file_with_default_program(config.storage_books / item.path)
 
-    def open_file_window(self, gesture, count, x, y, item):
-        if count == 2:
-            window = FileWindow(self.lib_storage, item, transient_for=self.parent, title='Файл', modal=True)
+    def open_file_window(self, gesture, count, x, y, cell):
+        if count == 2 and cell.item:
+            window = FileWindow(self.lib_storage, cell.item, transient_for=self.parent, title='Файл', modal=True)
             window.present()
 
     def _on_factory_bind(self, factory, list_item):
         cell = list_item.get_child()
         item = list_item.get_item()
+        cell.item = item
         cell.builder.title._binding = item.bind_property('title', cell.builder.title, 'label', GObject.BindingFlags.SYNC_CREATE)
         cell.builder.path._binding = item.bind_property('path', cell.builder.path, 'label', GObject.BindingFlags.SYNC_CREATE)
-        
-        cell.builder.button_open_file.connect('clicked', self.open_file, item)
-        cell.builder.button_open_directory.connect('clicked', self.open_directory, item)
-
-        controller = Gtk.GestureClick.new()
-        controller.connect('pressed', self.open_file_window, item)
-        cell.builder.title.add_controller(controller)
 
         self.book_widgets[item.book_id] = cell
         self.populate_tags(item)
 
-        # https://pygobject.gnome.org/tutorials/gtk4/drag-and-drop.html
-        # https://www.opennet.ru/docs/RUS/gtk-reference/gtk-Drag-and-Drop.html
-        # https://docs.gtk.org/gtk4/drag-and-drop.html
-        drop_controller = Gtk.DropTarget.new(
-            type=GObject.TYPE_NONE, actions=Gdk.DragAction.COPY
-        )
-        drop_controller.set_gtypes([Tag])
-        drop_controller.connect("drop", self.on_drop, item)
-        cell.add_controller(drop_controller)
-
-    def on_drop(self, _ctrl, value, _x, _y, file_item):
-        if isinstance(value, Tag):
-            self.lib_storage.db.assign_tag(value.tag_id, file_item.book_id)
-            self.populate_tags(file_item)
+    def on_drop(self, _ctrl, value, _x, _y, cell):
+        if isinstance(value, Tag) and cell.item:
+            self.lib_storage.db.assign_tag(value.tag_id, cell.item.book_id)
+            self.populate_tags(cell.item)
             self.update_tag_count(value.tag_id)
 
     def _on_factory_unbind(self, factory, list_item):
@@ -181,6 +283,11 @@ class BookListView:
             cell.builder.path._binding.unbind()
             cell.builder.path._binding = None
 
+        if cell.item and self.book_widgets.get(cell.item.book_id) is cell:
+            del self.book_widgets[cell.item.book_id]
+
+        cell.item = None
+
     def _on_factory_teardown(self, factory, list_item):
         cell = list_item.get_child()
         #cell._binding = None
@@ -189,50 +296,37 @@ class BookListView:
         self.lib_storage = lib_storage
         self.update_tag_count = update_tag_count
         self.parent = parent
+        self.tag_chips = TagChips(lib_storage, self.delete_tag)
         factory = Gtk.SignalListItemFactory()
         factory.connect('setup', self._on_factory_setup)
         factory.connect('bind', self._on_factory_bind)
         factory.connect('unbind', self._on_factory_unbind)
         factory.connect("teardown", self._on_factory_teardown)
 
-        self.list_store = Gio.ListStore(item_type=Book)
-        selection = Gtk.SingleSelection(model=self.list_store)
-        self.view = Gtk.ListView(model=selection, factory=factory)
+        self.selection = Gtk.SingleSelection(model=BookListModel())
+        self.view = Gtk.ListView(model=self.selection, factory=factory)
         #self.view.connect('activate', self.on_activate_item)
         self.view.set_name('books_list')
 
         self.book_widgets = {}
 
-    def append(self, book_id, book_path):
-        path = Path(book_path)
-        item = Book(book_id, path.name, path.parent)
-        self.list_store.append(item)
+    def set_rows(self, rows):
+        """Показывает файлы запроса; строки читаются по мере прокрутки"""
+        self.book_widgets.clear()
+        self.selection.set_model(BookListModel(rows))
     
-    def delete_tag(self, _, book, tag_id):
+    def delete_tag(self, book, tag_id):
         self.lib_storage.db.unassign_tag(tag_id, book.book_id)
         self.populate_tags(book)
         self.update_tag_count(tag_id)
 
     def populate_tags(self, book):
-        tags = self.book_widgets[book.book_id].builder.tags
-        while tags.get_first_child():
-            tags.remove(tags.get_first_child())
-
-        for tag_name, tag_id in self.lib_storage.db.select_tags_by_file(book.book_id):
-            box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-            box.props.margin_end = 6
-
-            label = Gtk.Label(label=tag_name)
-            button = Gtk.Button(label='x')
-            button.connect('clicked', self.delete_tag, book, tag_id)
-            
-            box.append(label)
-            box.append(button)
-            tags.append(box)
+        cell = self.book_widgets.get(book.book_id)
+        if cell:
+            self.tag_chips.show(cell.builder.tags, book)
 
     def clear(self):
-        self.list_store.remove_all()
-        self.book_widgets.clear()
+        self.set_rows(())
 
 
 class TagNameColumnBuilder:
@@ -402,7 +496,11 @@ class TagCountColumnBuilder:
 
     def update_count(self, label, tag_id):
         count_files = self.lib_storage.db.select_count_files_by_tag(tag_id)
-        label.props.label = str(count_files)
+        count_files_with_children = self.lib_storage.db.select_count_files_by_tag(tag_id, with_descendants=True)
+        if count_files_with_children != count_files:
+            label.props.label = f'{count_files} ({count_files_with_children})'
+        else:
+            label.props.label = str(count_files)
 
 
 class TagTreeView:    
@@ -434,12 +532,17 @@ class TagTreeView:
         self.view.append_column(column_count_builder.column)
 
     def update_tag_count(self, tag_id):
-        self.update_count_funces[tag_id]()
+        # количество с дочерними тегами меняется и у всех предков
+        while tag_id:
+            if tag_id in self.update_count_funces:
+                self.update_count_funces[tag_id]()
 
-    def append(self, tag_id, name, checked, parent_id=None):
+            tag_id = self.tags[tag_id].parent_id
+
+    def append(self, tag_id, name, checked, parent_id=None, level=None):
         if parent_id:
             parent_tag = self.tags[parent_id]
-            level = parent_tag.level + 1
+            level = parent_tag.level + 1 if level is None else level
             list_store = parent_tag._children
         else:
             parent_id = 0
@@ -492,7 +595,24 @@ class TagTreeView:
                 self.lib_storage.db.delete_tag(tag_id)
                 
 
+class ScanResult(GObject.Object):
+    __gtype_name__ = 'ScanResult'
+
+    def __init__(self, status, existed_filepath, inserted_filepath, file_hash):
+        super().__init__()
+        self.status = status
+        self.existed_filepath = existed_filepath
+        self.inserted_filepath = inserted_filepath
+        self.file_hash = file_hash
+        self.is_processed = False
+
+
 class ScanWindow(Gtk.ApplicationWindow):
+    """
+    Окно сканирования. Поток сканирования только кладёт результаты в очередь, а таймер в главном потоке
+    раз в UPDATE_INTERVAL мс переносит их порциями в Gio.ListStore и обновляет счётчики.
+    Карточки результатов создаёт Gtk.ListView только для видимых строк и переиспользует их при прокрутке.
+    """
     task_item_widgets = {
         STATUS_NEW: 'task_new.xml',
         STATUS_MOVED: 'task_moved.xml',
@@ -502,6 +622,12 @@ class ScanWindow(Gtk.ApplicationWindow):
         STATUS_DELETED: 'task_deleted.xml',
         STATUS_DUPLICATE: 'task_duplicate.xml',
     }
+    FILTER_STATUSES = (
+        None, STATUS_NEW, STATUS_MOVED, STATUS_RENAMED, STATUS_MOVED_AND_RENAMED, STATUS_DELETED, STATUS_DUPLICATE,
+    )
+    ACTION_BUTTONS = ('button_delete', 'button_inserted', 'button_existed')
+    UPDATE_INTERVAL = 250
+    COUNT_RESULTS_IN_BATCH = 5000
     
     @GObject.Signal(arg_types=())
     def scan_end(self):
@@ -514,71 +640,153 @@ class ScanWindow(Gtk.ApplicationWindow):
 
         self.builder = WindowBuilder(XML_DIR / 'scan.xml', {})
         self.set_child(self.builder.root_widget)
- 
-        self.count_new = 0
 
+        self.results_queue = SimpleQueue()
+        self.results = Gio.ListStore(item_type=ScanResult)
+        self.selected_status = None
+        self.status_filter = Gtk.CustomFilter.new(self.filter_result)
+        factory = Gtk.SignalListItemFactory()
+        factory.connect('setup', self._on_factory_setup)
+        factory.connect('bind', self._on_factory_bind)
+        factory.connect('unbind', self._on_factory_unbind)
+        filtered_results = Gtk.FilterListModel(model=self.results, filter=self.status_filter)
+        view = Gtk.ListView(model=Gtk.NoSelection(model=filtered_results), factory=factory)
+        self.builder.scrolled_books.set_child(view)
+
+        status_names = ['Все', *self.FILTER_STATUSES[1:]]
+        status_dropdown = Gtk.DropDown.new_from_strings(status_names)
+        status_dropdown.connect('notify::selected', self.select_status)
+        self.builder.status_filter.append(status_dropdown)
+
+        # пишутся потоком сканирования, а показываются таймером
+        self.scan_progress = None
+        self.is_scan_finished = False
+        self.count_by_status = Counter()
+
+        GLib.timeout_add(self.UPDATE_INTERVAL, self.update_results)
         run_func_in_thread(self.fg_scan)
 
-    def progress_count_scanned_files(self, count_scanned_files):
-        self.builder.count_scanned_files.props.label = str(count_scanned_files)
-        
-    def progress_current_file(self, full_path):
-        self.builder.current_file.props.label = str(full_path)
-
-    def action_delete_duplicate(self, _, builder, inserted_filepath):
-        try:
-            (config.storage_books / inserted_filepath).unlink()
-            builder.button_inserted.props.sensitive = False
-            builder.button_existed.props.sensitive = False
-        except Exception as error:
-            print(error)
-
-    def action_delete_duplicate_from_base(self, _, builder, inserted_filepath, existed_filepath, file_hash):
-        try:
-            import os.path
-            (config.storage_books / existed_filepath).unlink()
-            dirname, basename = os.path.split(inserted_filepath)
-            self.lib_storage.db.update(file_hash, dirname, basename)
-            builder.button_inserted.props.sensitive = False
-            builder.button_existed.props.sensitive = False
-        except Exception as error:
-            print(error)
-
-    def action_delete_from_database(self, _, builder, file_hash):
-        self.lib_storage.db.delete_file(file_hash)
-        builder.button_delete.props.sensitive = False
-
-    def action_delete_new_file(self, _, builder, inserted_filepath, file_hash):
-        try:
-            (config.storage_books / inserted_filepath).unlink()
-            self.lib_storage.db.delete_file(file_hash)
-            builder.button_delete.props.sensitive = False        
-        except Exception as error:
-            print(error)
+    def progress_scan(self, progress):
+        self.scan_progress = (progress.as_dict(), progress.format())
 
     def add_file_item(self, status, existed_filepath, inserted_filepath, file_hash):
-        if status == STATUS_UNTOUCHED:
-            return
+        if status != STATUS_UNTOUCHED:
+            self.results_queue.put((status, existed_filepath, inserted_filepath, file_hash))
+
+    def update_results(self):
+        """Переносит накопившиеся результаты в список и обновляет счётчики; вызывается таймером в главном потоке"""
+        items = []
+        while len(items) < self.COUNT_RESULTS_IN_BATCH:
+            try:
+                result = self.results_queue.get_nowait()
+            except Empty:
+                break
+
+            items.append(ScanResult(*result))
+            self.count_by_status[result[0]] += 1
+
+        if items:
+            self.results.splice(self.results.get_n_items(), 0, items)
+
+        if self.scan_progress:
+            progress, progress_text = self.scan_progress
+            self.builder.count_scanned_files.props.label = str(progress['count_done'])
+            self.builder.current_file.props.label = progress['current'] or ''
+            self.builder.scan_speed.props.label = progress_text
+
+        self.builder.count_new_files.props.label = str(self.count_by_status[STATUS_NEW])
+        self.builder.count_by_status.props.label = ', '.join(
+            f'{status}: {count}' for status, count in self.count_by_status.items()
+        )
+        if self.is_scan_finished and self.results_queue.empty():
+            self.emit('scan_end')
+            return GLib.SOURCE_REMOVE
+
+        return GLib.SOURCE_CONTINUE
+
+    def filter_result(self, item):
+        return self.selected_status is None or item.status == self.selected_status
+
+    def select_status(self, dropdown, _):
+        self.selected_status = self.FILTER_STATUSES[dropdown.props.selected]
+        self.status_filter.changed(Gtk.FilterChange.DIFFERENT)
 
-        builder = WindowBuilder(XML_DIR / self.task_item_widgets[status], {})
-        if hasattr(builder, 'inserted_path'):
-            builder.inserted_path.props.label = inserted_filepath
-
-        if hasattr(builder, 'existed_path'):
-            builder.existed_path.props.label = existed_filepath
-
-        if status == STATUS_DUPLICATE:
-            builder.button_inserted.connect('clicked', self.action_delete_duplicate, builder, inserted_filepath)
-            builder.button_existed.connect('clicked', self.action_delete_duplicate_from_base, builder, inserted_filepath, existed_filepath, file_hash)
-        elif status == STATUS_DELETED:
-            builder.button_delete.connect('clicked', self.action_delete_from_database, builder, file_hash)
-        elif status == STATUS_NEW:
-            self.count_new += 1
-            self.builder.count_new_files.props.label = str(self.count_new)
-            builder.button_delete.connect('clicked', self.action_delete_new_file, builder, inserted_filepath, file_hash)
-
-        builder.root_widget.set_name('item-task')
-        self.builder.books.append(builder.root_widget)
+    def _on_factory_setup(self, factory, list_item):
+        cell = Gtk.Box()
+        cell.item = None
+        cell.cards = {}
+        list_item.set_child(cell)
+
+    def _on_factory_bind(self, factory, list_item):
+        cell = list_item.get_child()
+        item = list_item.get_item()
+        cell.item = item
+        xml_name = self.task_item_widgets[item.status]
+        if xml_name not in cell.cards:
+            cell.cards[xml_name] = self.create_card(cell, xml_name)
+
+        for card_xml_name, card in cell.cards.items():
+            card.root_widget.props.visible = card_xml_name == xml_name
+
+        card = cell.cards[xml_name]
+        if hasattr(card, 'inserted_path'):
+            card.inserted_path.props.label = item.inserted_filepath or ''
+
+        if hasattr(card, 'existed_path'):
+            card.existed_path.props.label = item.existed_filepath or ''
+
+        if hasattr(card, 'title'):
+            card.title.set_markup(f'<b>{item.status}</b>')
+
+        self.set_actions_sensitive(card, not item.is_processed)
+
+    def _on_factory_unbind(self, factory, list_item):
+        list_item.get_child().item = None
+
+    def create_card(self, cell, xml_name):
+        """Создаёт карточку результата; кнопки действий подключаются один раз и работают с текущим файлом строки"""
+        card = WindowBuilder(XML_DIR / xml_name, {})
+        card.root_widget.set_name('item-task')
+        for button_name, action in zip(
+                self.ACTION_BUTTONS,
+                (self.action_delete, self.action_delete_duplicate, self.action_delete_duplicate_from_base),
+        ):
+            if hasattr(card, button_name):
+                getattr(card, button_name).connect('clicked', self.click_action, cell, card, action)
+
+        cell.append(card.root_widget)
+        return card
+
+    def set_actions_sensitive(self, card, is_sensitive):
+        for button_name in self.ACTION_BUTTONS:
+            if hasattr(card, button_name):
+                getattr(card, button_name).props.sensitive = is_sensitive
+
+    def click_action(self, _, cell, card, action):
+        item = cell.item
+        if item and not item.is_processed:
+            try:
+                action(item)
+            except Exception as error:
+                print(error)
+                return
+
+            item.is_processed = True
+            self.set_actions_sensitive(card, False)
+
+    def action_delete(self, item):
+        if item.status == STATUS_NEW:
+            (config.storage_books / item.inserted_filepath).unlink()
+
+        self.lib_storage.db.delete_file(item.file_hash)
+
+    def action_delete_duplicate(self, item):
+        (config.storage_books / item.inserted_filepath).unlink()
+
+    def action_delete_duplicate_from_base(self, item):
+        (config.storage_books / item.existed_filepath).unlink()
+        dirname, basename = os.path.split(item.inserted_filepath)
+        self.lib_storage.db.update(item.file_hash, dirname, basename)
     
     def func_finished(self):
         print('Сканирование завершено')
@@ -587,12 +795,15 @@ class ScanWindow(Gtk.ApplicationWindow):
         self.lib_storage.scan_to_db(
             config.storage_books,
             'original',
-            progress_count_scanned_files=self.progress_count_scanned_files,
-            progress_current_file=self.progress_current_file,
             func_finished=self.func_finished,
             func=self.add_file_item,
+            progress=Progress(self.progress_scan),
+            prewalk=True,
+            scan_archives=config.scan_archives,
+            ignore_patterns=config.ignore_patterns,
+            ignore_directories=config.ignore_directories,
         )
-        self.emit('scan_end')
+        self.is_scan_finished = True
 
 
 class FileWindow(Gtk.ApplicationWindow):
@@ -641,18 +852,30 @@ class ExportWindow(Gtk.ApplicationWindow):
 
         run_func_in_thread(self.fg_export)
 
-    def progress_count_exported_files(self, index_of_current_row, count_rows, current_page):
-        self.builder.index_of_current_row.props.label = str(index_of_current_row)
-        self.builder.count_rows.props.label = str(count_rows)
-        self.builder.current_page.props.label = str(current_page)
+    def progress_export(self, progress):
+        # вызывается потоком экспорта, поэтому виджеты обновляются в главном потоке
+        GLib.idle_add(self.show_progress, progress.as_dict(), progress.format())
+
+    def show_progress(self, progress, progress_text):
+        self.builder.index_of_current_row.props.label = str(progress['count_done'])
+        self.builder.count_rows.props.label = str(progress['count_total'])
+        self.builder.current_page.props.label = progress['current'] or ''
+        self.builder.export_speed.props.label = progress_text
+        return GLib.SOURCE_REMOVE
 
     def fg_export(self):
         exporter = MarkdownExporter(config.storage_notes, config.storage_books)
 
-        self.lib_storage.export_db(
+        report = self.lib_storage.export_db(
             exporter,
-            self.progress_count_exported_files,
+            workers=self.lib_storage.get_export_workers(),
+            progress=Progress(self.progress_export),
         )
+        GLib.idle_add(self.show_report, report)
+
+    def show_report(self, report):
+        self.builder.export_report.props.label = '{rewritten} / {skipped} / {deleted}'.format(**report)
+        return GLib.SOURCE_REMOVE
 
 
 # Source: https://stackoverflow.com/questions/65807310/how-to-get-total-screen-size-in-python-gtk-without-using-deprecated-gdk-screen
@@ -685,7 +908,7 @@ class AppWindow(Gtk.ApplicationWindow):
 
         self.builder.button_scan.connect('clicked', self.on_scan)
         self.builder.button_export.connect('clicked', self.on_export)
-        self.lib_storage.set_db(DBStorage(config.db_path))
+        self.lib_storage.set_db(DBStorage(config.db_path, pragmas=config.db_pragmas))
 
         #builder.button_show_meeting.connect('clicked', self.on_show_entities, Meeting, db.Meeting)
         
@@ -700,6 +923,7 @@ class AppWindow(Gtk.ApplicationWindow):
         self.builder.button_add_child_tag.connect('clicked', self.tag_tree.action_new_child_tag)
         self.builder.button_delete_tag.connect('clicked', self.tag_tree.action_delete_tag)
         self.builder.search_button.connect('clicked', lambda x: self.update_book_list())
+        self.builder.tags_match_any.connect('toggled', lambda x: self.toggled_tag())
 
         self.build_tags()
         
@@ -711,31 +935,34 @@ class AppWindow(Gtk.ApplicationWindow):
         self.book_list = BookListView(self, self.lib_storage, self.tag_tree.update_tag_count)
         self.builder.books.append(self.book_list.view)
         
-        self.tags = []
+        self.tags = TagFilter()
         
         self.update_book_list()
  
-    def toggled_tag(self, tag_id, all_tags):
-        self.tags = [str(key) for key, value in all_tags.items() if value]
+    def toggled_tag(self, tag_id=None, all_tags=None):
+        all_tags = self.tag_tree.tag_binded_values if all_tags is None else all_tags
+        checked_tags = [key for key, value in all_tags.items() if value]
+        # отмеченный тег включает и своих потомков
+        if self.builder.tags_match_any.props.active:
+            self.tags = TagFilter(any_of=checked_tags)
+        else:
+            self.tags = TagFilter(all_of=checked_tags)
+
         self.update_book_list()
  
     def update_book_list(self, _=None, tags=None):
         search = self.builder.search_entry.props.text if self.builder.search_entry.props.text else None
         tags = self.tags if self.tags else None
-        self.book_list.clear()
-        for book_hash, book_id, directory, filename in self.lib_storage.db.select_rows(tags, search=search):
-            self.book_list.append(book_id, Path(directory) / filename)
-        
-        self.builder.count_files_found.props.label = str(self.lib_storage.db.select_count(tags, search=search))
-
-    def build_tags(self, parent_id=None):
-        parents = []
-        for tag_id, tag_name in self.lib_storage.db.select_tags(parent_id):
-            self.tag_tree.append(tag_id, tag_name, False, parent_id)
-            parents.append(tag_id)
+        rows = LazyRows(
+            self.lib_storage.db, tags, search=search, make_item=make_book, on_fetch=self.book_list.tag_chips.prefetch,
+        )
+        self.book_list.set_rows(rows)
+        self.builder.count_files_found.props.label = str(len(rows))
 
-        for next_parent in parents:
-            self.build_tags(next_parent)
+    def build_tags(self):
+        # родитель идёт раньше потомков, поэтому его элемент уже создан к моменту добавления дочерних
+        for tag_id, tag_name, parent_id, depth in self.lib_storage.db.get_tag_tree():
+            self.tag_tree.append(tag_id, tag_name, False, parent_id, depth)
 
     def on_scan(self, action):
         window = ScanWindow(self.lib_storage, transient_for=self, title='Сканирование', modal=True)
@@ -775,8 +1002,9 @@ class MyApplication(Gtk.Application):
         window.present()
 
 
-with LibraryStorage() as lib_storage:
-    app = MyApplication(lib_storage)
-    exit_status = app.run(sys.argv)
+if __name__ == '__main__':  # процессы экспорта импортируют этот модуль заново
+    with LibraryStorage() as lib_storage:
+        app = MyApplication(lib_storage)
+        exit_status = app.run(sys.argv)
 
-sys.exit(exit_status)
\ No newline at end of file
+    sys.exit(exit_status)
\ No newline at end of file
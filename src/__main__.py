@@ -0,0 +1,184 @@
+"""
+Консольный запуск без GTK: сканирование, экспорт, импорт и статистика хранилища, например из cron.
+
+    python -m src scan --library ~/books --workers 4 --only-changed
+    python -m src export --format md --output ~/notes/книги_список_всех
+    python -m src import --input ~/backup/csv --db ~/books/sqlite3.db
+    python -m src stats
+
+События выводятся в stdout строками JSON: {"event": "file", "status": ..., "existed_path": ..., "inserted_path": ...,
+"hash": ...} на каждый файл при сканировании, {"event": "progress", ...} при --progress, {"event": "error", ...}
+при ошибке и последним - {"event": "summary", "command": ..., "elapsed": ...} с итогами и временем выполнения.
+Если --library не передан, путь хранилища, настройки базы и не заданные аргументами настройки сканирования
+(scan_archives, ignore_patterns, ignore_directories) берутся из config.json, как у GUI. Модули GUI (gi, jinja2) не загружаются.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+
+from src.exporters import CSVExporter, MarkdownExporter
+from src.scanner import STATUS_UNTOUCHED, DBStorage, LibraryStorage, Progress
+from src.walker import IGNORE_DIRECTORIES
+
+EXPORTERS = {'csv': CSVExporter, 'md': MarkdownExporter}
+# настройки сканирования, не заданные аргументами: берутся из config.json, а при --library - эти
+SCAN_DEFAULTS = {'scan_archives': False, 'ignore_patterns': [], 'ignore_directories': list(IGNORE_DIRECTORIES)}
+
+
+def emit(event, **fields):
+    sys.stdout.write(json.dumps({'event': event, **fields}, ensure_ascii=False) + '\n')
+
+
+def emit_progress(progress):
+    emit('progress', **progress.as_dict())
+
+
+def get_config():
+    # config.json читается, только если путь не передан аргументом
+    from src.config import config
+
+    return config
+
+
+def open_db(args):
+    """
+    Возвращает (путь хранилища, база); база по умолчанию лежит в корне хранилища, как у GUI.
+    Заодно дополняет args не заданными настройками сканирования.
+    """
+    library_path = args.library
+    pragmas = {}
+    defaults = SCAN_DEFAULTS
+    if library_path is None:
+        config = get_config()
+        library_path = config.storage_books
+        pragmas = config.db_pragmas
+        defaults = {name: getattr(config, name) for name in SCAN_DEFAULTS}
+
+    for name, value in defaults.items():
+        if getattr(args, name, False) is None:
+            setattr(args, name, value)
+
+    db_path = args.db or Path(library_path) / 'sqlite3.db'
+    return Path(library_path), DBStorage(db_path, pragmas=pragmas)
+
+
+def command_scan(args, lib_storage, library_path):
+    def emit_file_status(status, existed_path, inserted_path, file_hash):
+        count_by_status[status] += 1
+        if not (args.only_changed and status == STATUS_UNTOUCHED):
+            emit('file', status=status, existed_path=existed_path, inserted_path=inserted_path, hash=file_hash)
+
+    count_by_status = Counter()
+    progress = Progress(emit_progress if args.progress else None)
+    lib_storage.scan_to_db(
+        library_path,
+        args.process_dublicate,
+        func=emit_file_status,
+        full_rehash=args.full_rehash,
+        workers=args.workers,
+        quick_hash=args.quick_hash,
+        progress=progress,
+        prewalk=args.prewalk,
+        scan_archives=args.scan_archives,
+        ignore_patterns=args.ignore_patterns,
+        ignore_directories=args.ignore_directories,
+    )
+    return {'count_by_status': dict(count_by_status), 'progress': progress.as_dict()}
+
+
+def command_export(args, lib_storage, library_path):
+    output = args.output
+    if output is None:
+        if args.format == 'csv':
+            raise Exception('Для экспорта в CSV укажите директорию --output')
+
+        output = get_config().storage_notes
+
+    progress = Progress(emit_progress if args.progress else None)
+    workers = args.workers or lib_storage.get_export_workers()
+    report = lib_storage.export_db(EXPORTERS[args.format](output, library_path), workers=workers, progress=progress)
+    return {'pages': report, 'progress': progress.as_dict()}
+
+
+def command_import(args, lib_storage, library_path):
+    def emit_imported_rows(count_imported_rows, rows_per_second):
+        if args.progress:
+            emit('progress', count_done=count_imported_rows, rows_per_second=round(rows_per_second, 1))
+
+    lib_storage.import_csv_to_db(args.input, emit_imported_rows)
+    return {'count_files': lib_storage.db.get_count_rows()}
+
+
+def command_stats(args, lib_storage, library_path):
+    db = lib_storage.db
+    return {
+        'count_files': db.get_count_rows(),
+        'count_deleted': db.select_count(only_deleted=True),
+        'count_tags': len(list(db.select_all_tags())),
+        'db_size': os.path.getsize(db.db_path) if os.path.exists(db.db_path) else None,
+    }
+
+
+COMMANDS = {'scan': command_scan, 'export': command_export, 'import': command_import, 'stats': command_stats}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m src', description='Сканер хранилища книг без GUI')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--library', help='директория хранилища (по умолчанию storage_books из config.json)')
+    common.add_argument('--db', help='файл базы (по умолчанию sqlite3.db в директории хранилища)')
+    common.add_argument('--progress', action='store_true', help='выводить события хода выполнения')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', parents=[common], help='сканировать хранилище в базу')
+    scan.add_argument('--workers', type=int, default=1, help='потоков хеширования')
+    scan.add_argument('--full-rehash', action='store_true', help='пересчитать хеши всех файлов')
+    scan.add_argument('--quick-hash', action='store_true', help='не перечитывать целиком перемещённые файлы')
+    scan.add_argument('--prewalk', action='store_true', help='обойти хранилище заранее ради оценки времени')
+    scan.add_argument(
+        '--scan-archives', action=argparse.BooleanOptionalAction, help='сканировать zip-архивы как директории',
+    )
+    scan.add_argument('--ignore', action='append', dest='ignore_patterns', metavar='GLOB', help='не сканировать файлы')
+    scan.add_argument(
+        '--ignore-directory', action='append', dest='ignore_directories', metavar='GLOB', help='не обходить директории',
+    )
+    scan.add_argument('--process-dublicate', choices=('original', 'copy'), default='original')
+    scan.add_argument('--only-changed', action='store_true', help='не выводить нетронутые файлы')
+
+    export = subparsers.add_parser('export', parents=[common], help='экспортировать базу постранично')
+    export.add_argument('--format', choices=EXPORTERS, default='md')
+    export.add_argument('--output', help='директория экспорта (для md по умолчанию storage_notes из config.json)')
+    export.add_argument(
+        '--workers', type=int, default=1, help='процессов записи страниц (0 - подобрать по числу ядер и размеру базы)',
+    )
+
+    import_ = subparsers.add_parser('import', parents=[common], help='импортировать экспорт в CSV')
+    import_.add_argument('--input', required=True, help='директория экспорта в CSV')
+
+    subparsers.add_parser('stats', parents=[common], help='показать статистику базы')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    started_at = perf_counter()
+    try:
+        library_path, db = open_db(args)
+        with LibraryStorage() as lib_storage:
+            lib_storage.set_db(db)
+            summary = COMMANDS[args.command](args, lib_storage, library_path)
+    except Exception as error:
+        emit('error', command=args.command, message=str(error))
+        emit('summary', command=args.command, elapsed=round(perf_counter() - started_at, 3), is_ok=False)
+        return 1
+
+    emit('summary', command=args.command, elapsed=round(perf_counter() - started_at, 3), is_ok=True, **summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
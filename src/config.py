@@ -1,6 +1,8 @@
 import json
 from pathlib import Path
 
+from src.walker import IGNORE_DIRECTORIES
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 EXAMPLE_CONFIG_PATH = BASE_DIR / 'config.example.json'
 
@@ -18,6 +20,10 @@ class Config:
         self.storage_books = None
         self.storage_notes = None
         self.db_path = None
+        self.db_pragmas = {}
+        self.scan_archives = False
+        self.ignore_patterns = []
+        self.ignore_directories = list(IGNORE_DIRECTORIES)
         self.config_path = BASE_DIR / 'config.json'
 
         if not self.config_path.exists():
@@ -34,6 +40,13 @@ class Config:
             data = json.load(fjson)
             self.storage_books = Path(data['storage_books']).resolve()
             self.storage_notes = Path(data['storage_notes']).resolve()
+            # например {"cache_size": -64000, "mmap_size": 1073741824}, см. DBStorage.PRAGMAS
+            self.db_pragmas = data.get('db_pragmas', {})
+            # сканировать ли zip-архивы как директории
+            self.scan_archives = data.get('scan_archives', False)
+            # glob-шаблоны имён файлов и директорий, которые не сканируются, например ["*.tmp"] и [".git", "@eaDir"]
+            self.ignore_patterns = data.get('ignore_patterns', [])
+            self.ignore_directories = data.get('ignore_directories', list(IGNORE_DIRECTORIES))
 
         self.db_path = self.storage_books / 'sqlite3.db'
 
@@ -1,27 +1,69 @@
 import os
 import csv
+import hashlib
+import json
+from io import StringIO
 from urllib.parse import quote
 
+MANIFEST_FILE_NAME = '.export_manifest.json'
+
+
+def write_file_atomically(file_path, content):
+    """Пишет файл рядом во временный и подменяет им старый, чтобы читатели не видели недописанную страницу"""
+    tmp_path = '{}.tmp'.format(file_path)
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as tmp_file:
+        tmp_file.write(content)
+
+    os.replace(tmp_path, file_path)
+
+
+def write_file_if_changed(file_path, content, old_digest=None):
+    """
+    Записывает файл, только если его содержимое отличается от записанного при прошлом экспорте.
+    :return: (дайджест содержимого, был ли файл перезаписан)
+    """
+    digest = hashlib.blake2s(content.encode('utf-8')).hexdigest()
+    if digest == old_digest and os.path.exists(file_path):
+        return digest, False
+
+    write_file_atomically(file_path, content)
+    return digest, True
+
+
+def load_manifest(storage_structure):
+    """Возвращает {имя файла: дайджест содержимого} файлов, записанных прошлым экспортом"""
+    manifest_path = os.path.join(storage_structure, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(storage_structure, manifest):
+    write_file_atomically(
+        os.path.join(storage_structure, MANIFEST_FILE_NAME),
+        json.dumps(manifest, ensure_ascii=False, indent=0, sort_keys=True),
+    )
+
 
 class CSVExporter:
     def __init__(self, storage_structure, storage_directory):
-        self.csv_writer = None
-        self.csv_file = None
         self.storage_structure = storage_structure
         if not os.path.exists(self.storage_structure):
             os.makedirs(self.storage_structure, exist_ok=True)
 
-    def open_new_page(self, current_page):
-        csv_full_path = os.path.join(self.storage_structure, '{}.csv'.format(str(current_page)))
-        self.csv_file = open(csv_full_path, 'w', encoding='utf-8', newline='\n')
-        self.csv_writer = csv.writer(self.csv_file)
+    def get_page_path(self, current_page):
+        return os.path.join(self.storage_structure, '{}.csv'.format(str(current_page)))
 
-    def write_row(self, row):
-        self.csv_writer.writerow(row)
+    def render_page(self, current_page, rows, is_last_page):
+        page = StringIO()
+        csv.writer(page).writerows(rows)
+        return page.getvalue()
 
-    def close(self, is_last_page):
-        if self.csv_file:
-            self.csv_file.close()
+    def write_page(self, current_page, rows, is_last_page, old_digest=None):
+        page_path = self.get_page_path(current_page)
+        return write_file_if_changed(page_path, self.render_page(current_page, rows, is_last_page), old_digest)
 
 
 class MarkdownExporter:
@@ -33,38 +75,43 @@ class MarkdownExporter:
     TABLE_ROW = '{id} | [{hash}](книга_{id}) | [{name}](file://{relative_storage_pathdir}{pathdir}/{filename})\n'
     PREV_PAGE = '[<< Предыдщая страница](список_книг_{})'
     NEXT_PAGE = '[Следующая страница >>](список_книг_{})'
+    NAME_TRANSLATION = str.maketrans('', '', '[]()')
 
     def __init__(self, storage_structure, storage_directory):
         self.storage_structure = storage_structure
-        self.csv_file = None
-        self.current_page = None
         self.storage_directory = storage_directory
         if not os.path.exists(self.storage_structure):
             os.makedirs(self.storage_structure, exist_ok=True)
 
-    def open_new_page(self, current_page):
-        csv_full_path = os.path.join(self.storage_structure, 'список_книг_{}.md'.format(str(current_page)))
-        self.csv_file = open(csv_full_path, 'w', encoding='utf-8')
-        self.csv_file.write(self.TABLE_HEADER)
-        self.current_page = current_page
-
-    def write_row(self, row):
         relpath = os.path.relpath(self.storage_directory, self.storage_structure).replace('\\', '/')
-        self.csv_file.write(
-            self.TABLE_ROW.format(
-                id=row[1],
-                hash=row[0],
-                name=row[3].replace('[', '').replace(']', '').replace('(', '').replace(')', ''),
-                relative_storage_pathdir=quote(relpath),
-                pathdir=quote('/{}'.format(row[2])) if row[2] else '',
-                filename=quote(row[3]),
+        self.relative_storage_pathdir = quote(relpath)
+
+    def get_page_path(self, current_page):
+        return os.path.join(self.storage_structure, 'список_книг_{}.md'.format(str(current_page)))
+
+    def render_page(self, current_page, rows, is_last_page):
+        page = [self.TABLE_HEADER]
+        quoted_pathdirs = {}
+        for file_hash, file_id, directory, filename in rows:
+            if directory not in quoted_pathdirs:
+                quoted_pathdirs[directory] = quote('/{}'.format(directory)) if directory else ''
+
+            page.append(
+                self.TABLE_ROW.format(
+                    id=file_id,
+                    hash=file_hash,
+                    name=filename.translate(self.NAME_TRANSLATION),
+                    relative_storage_pathdir=self.relative_storage_pathdir,
+                    pathdir=quoted_pathdirs[directory],
+                    filename=quote(filename),
+                )
             )
-        )
 
-    def close(self, is_last_page):
-        prev_page = self.PREV_PAGE.format(self.current_page - 1) if self.current_page > 1 else ''
-        next_page = self.NEXT_PAGE.format(self.current_page + 1) if not is_last_page else ''
-        self.csv_file.write(f'\n{prev_page} | {self.current_page} | {next_page}\n--- | --- | ---\n')
+        prev_page = self.PREV_PAGE.format(current_page - 1) if current_page > 1 else ''
+        next_page = self.NEXT_PAGE.format(current_page + 1) if not is_last_page else ''
+        page.append(f'\n{prev_page} | {current_page} | {next_page}\n--- | --- | ---\n')
+        return ''.join(page)
 
-        if self.csv_file:
-            self.csv_file.close()
+    def write_page(self, current_page, rows, is_last_page, old_digest=None):
+        page_path = self.get_page_path(current_page)
+        return write_file_if_changed(page_path, self.render_page(current_page, rows, is_last_page), old_digest)
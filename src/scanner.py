@@ -1,11 +1,23 @@
 import csv
 import hashlib
 import os
+import re
 import sqlite3
 import zipfile
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import wraps
 from io import TextIOWrapper, StringIO
+from itertools import groupby
 from pathlib import Path
-from threading import current_thread
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, RLock, Thread, current_thread, local
+from time import perf_counter
+
+from src.exporters import load_manifest, save_manifest, write_file_if_changed
+from src.walker import IGNORE_DIRECTORIES, Walker
 
 STATUS_NEW = 'Новый'
 STATUS_MOVED = 'Переместили'
@@ -14,31 +26,564 @@ STATUS_MOVED_AND_RENAMED = 'Переместили и переименовали
 STATUS_UNTOUCHED = 'Не тронут'
 STATUS_DELETED = 'Удалён'
 STATUS_DUPLICATE = 'Дубликат'
-LIBRARY_IGNORE_EXTENSIONS = ['db', 'db-journal']
+LIBRARY_IGNORE_EXTENSIONS = ['db', 'db-journal', 'db-wal', 'db-shm']
+LIBRARY_IGNORE_PATTERNS = [f'*.{extension}' for extension in LIBRARY_IGNORE_EXTENSIONS]
+ARCHIVE_EXTENSIONS = {'zip'}
+ARCHIVE_SEPARATOR = '!'
+# ошибки чтения повреждённого архива, зашифрованного файла или файла, сжатого неподдерживаемым методом
+ARCHIVE_READ_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, EOFError, zlib.error)
+ZIP_FLAG_ENCRYPTED = 0x1
+PARTIAL_HASH_BLOCKSIZE = 65536
+
+
+def get_partial_hash(size, head, tail):
+    """Хеширует размер файла, его первые и последние PARTIAL_HASH_BLOCKSIZE байт"""
+    hasher = hashlib.blake2s(person=b'partial')
+    hasher.update(size.to_bytes(8, 'little'))
+    hasher.update(head)
+    hasher.update(tail)
+    return hasher.hexdigest()
+
+
+def get_file_partial_hash(file_path):
+    with open(file_path, 'rb') as afile:
+        size = os.fstat(afile.fileno()).st_size
+        head = afile.read(PARTIAL_HASH_BLOCKSIZE)
+        afile.seek(max(size - PARTIAL_HASH_BLOCKSIZE, 0))
+        return get_partial_hash(size, head, afile.read(PARTIAL_HASH_BLOCKSIZE))
+
+
+def get_file_hashes(file_path):
+    """Возвращает (полный хеш, частичный хеш) файла, прочитав его один раз"""
+    hasher = hashlib.blake2s()
+    with open(file_path, 'rb') as afile:
+        size = os.fstat(afile.fileno()).st_size
+        head = last = buf = afile.read(PARTIAL_HASH_BLOCKSIZE)
+        previous = b''
+        while buf:
+            hasher.update(buf)
+            buf = afile.read(PARTIAL_HASH_BLOCKSIZE)
+            if buf:
+                previous, last = last, buf
+
+    return hasher.hexdigest(), get_partial_hash(size, head, (previous + last)[-PARTIAL_HASH_BLOCKSIZE:])
+
+
+def get_quick_file_hashes(file_path, size, known_hashes=()):
+    """
+    Возвращает (полный хеш, частичный хеш, прочитано байт) файла для быстрого сканирования.
+    :param known_hashes: [(полный хеш, частичный хеш)] пропавших файлов с теми же атрибутами; если частичный хеш
+    совпал с одним из них, то файл перемещён, и полный хеш берётся оттуда без чтения всего файла
+    """
+    if known_hashes:
+        partial_hash = get_file_partial_hash(file_path)
+        for file_hash, known_partial_hash in known_hashes:
+            if known_partial_hash == partial_hash:
+                return file_hash, partial_hash, min(size, 2 * PARTIAL_HASH_BLOCKSIZE)
+
+    return (*get_file_hashes(file_path), size)
 
 
 def get_file_hash(file_path):
+    with open(file_path, 'rb') as afile:
+        return get_stream_hash(afile)
+
+
+def get_stream_hash(afile):
     BLOCKSIZE = 65536
     hasher = hashlib.blake2s()
-    with open(file_path, 'rb') as afile:
+    buf = afile.read(BLOCKSIZE)
+    while len(buf) > 0:
+        hasher.update(buf)
         buf = afile.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = afile.read(BLOCKSIZE)
 
     return hasher.hexdigest()
 
 
+def is_archive(filename):
+    return filename.rsplit('.', 1)[-1].lower() in ARCHIVE_EXTENSIONS
+
+
+def get_archive_path(directory, filename):
+    """Путь архива, от которого строятся виртуальные директории его файлов"""
+    return f'{directory}/{filename}' if directory else filename
+
+
+def get_archive_member_path(archive_path, member_name):
+    """
+    Возвращает (directory, filename) файла из архива: файл sub/file.pdf архива books/bundle.zip
+    записывается в виртуальную директорию books/bundle.zip!/sub
+    """
+    member_directory, _, member_filename = member_name.rpartition('/')
+    directory = f'{archive_path}{ARCHIVE_SEPARATOR}'
+    return (f'{directory}/{member_directory}' if member_directory else directory), member_filename
+
+
+def get_archive_member_name(archive_path, directory, filename):
+    """Обратная к get_archive_member_path: возвращает имя файла внутри архива, например sub/file.pdf"""
+    member_directory = directory[len(archive_path) + len(ARCHIVE_SEPARATOR) + 1:]
+    return f'{member_directory}/{filename}' if member_directory else filename
+
+
+def get_directory_archive_path(directory):
+    """Возвращает путь архива, если directory - виртуальная директория внутри него, иначе None"""
+    archive_path, separator, member_directory = directory.partition(ARCHIVE_SEPARATOR)
+    if separator and is_archive(archive_path) and (not member_directory or member_directory.startswith('/')):
+        return archive_path
+
+    return None
+
+
+def get_archive_member_hash(archive, member_name):
+    """:return: хеш файла архива или None, если файл не прочитать (повреждён, зашифрован, сжат неизвестным методом)"""
+    try:
+        with archive.open(member_name) as afile:
+            return get_stream_hash(afile)
+    except ARCHIVE_READ_ERRORS:
+        return None
+
+
+def get_archive_members_hashes(archive_full_path, member_names) -> list:
+    """
+    Хеширует файлы архива, читая их потоком из ZipFile.open, без распаковки на диск.
+    Вместо хешей файлов, которые не удалось прочитать, возвращается None.
+    """
+    try:
+        with zipfile.ZipFile(archive_full_path) as archive:
+            return [get_archive_member_hash(archive, member_name) for member_name in member_names]
+    except ARCHIVE_READ_ERRORS:
+        # архив испортился после чтения его оглавления
+        return [None] * len(member_names)
+
+
+class ArchiveMemberHash:
+    """Хеш файла архива из общей задачи, которая хеширует все файлы архива"""
+    def __init__(self, hashes_future, index):
+        self.hashes_future = hashes_future
+        self.index = index
+
+    def result(self):
+        return self.hashes_future.result()[self.index]
+
+
+def hash_to_blob(file_hash):
+    """Хеши хранятся в базе 32 байтами, а наружу отдаются шестнадцатеричной строкой"""
+    return bytes.fromhex(file_hash) if file_hash is not None else None
+
+
+def hash_to_hex(file_hash):
+    return file_hash.hex() if file_hash is not None else None
+
+
+class Progress:
+    """
+    Ход долгой операции (сканирования, экспорта): обработано файлов и байт, скорость и оценка оставшегося времени.
+    Счётчики обновляются на каждый файл, а func(progress) вызывается не чаще раза в interval секунд
+    и не раньше, чем наберётся step новых файлов; при finish() func вызывается всегда.
+    func вызывается в потоке операции: окно переносит значения в виджеты из своего потока, консоль печатает сразу.
+    """
+    INTERVAL = 0.25
+
+    def __init__(self, func=None, interval=None, step=1, clock=perf_counter) -> None:
+        self.func = func
+        self.interval = self.INTERVAL if interval is None else interval
+        self.step = step
+        self.clock = clock
+        self.started_at = clock()
+        self.notified_at = None
+        self.count_since_notify = 0
+        self.count_done = 0
+        self.count_total = None
+        self.bytes_done = 0
+        self.bytes_hashed = 0
+        self.bytes_total = None
+        self.current = None
+        self.queue_depths = {}
+        self.is_finished = False
+
+    def set_total(self, count_total=None, bytes_total=None) -> None:
+        self.count_total = count_total
+        self.bytes_total = bytes_total
+
+    def set_queue_depth(self, name, depth) -> None:
+        self.queue_depths[name] = depth
+
+    def add_bytes(self, size, hashed_size=None) -> None:
+        """
+        Учитывает размер обработанного файла.
+        :param hashed_size: сколько байт файла прочитано при хешировании (по умолчанию - весь файл, 0 - хеш из кеша)
+        """
+        self.bytes_done += size
+        self.bytes_hashed += size if hashed_size is None else hashed_size
+
+    def advance(self, count=1, current=None) -> None:
+        self.count_done += count
+        self.count_since_notify += count
+        if current is not None:
+            self.current = current
+
+        if self.count_since_notify >= self.step:
+            now = self.clock()
+            if self.notified_at is None or now - self.notified_at >= self.interval:
+                self.notify(now)
+
+    def finish(self) -> None:
+        self.is_finished = True
+        self.notify(self.clock())
+
+    def notify(self, now) -> None:
+        self.notified_at = now
+        self.count_since_notify = 0
+        if self.func:
+            self.func(self)
+
+    @property
+    def elapsed(self) -> float:
+        return max(self.clock() - self.started_at, 1e-6)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.count_done / self.elapsed
+
+    @property
+    def mb_per_second(self) -> float:
+        """Скорость чтения файлов при хешировании"""
+        return self.bytes_hashed / 2 ** 20 / self.elapsed
+
+    @property
+    def eta(self):
+        """Оставшееся время в секундах: по байтам, если их общий объём известен, иначе по файлам; None - неизвестно"""
+        if self.is_finished:
+            return 0.0
+
+        if self.bytes_total and self.bytes_done:
+            return (self.bytes_total - self.bytes_done) * self.elapsed / self.bytes_done
+
+        if self.count_total and self.count_done:
+            return (self.count_total - self.count_done) * self.elapsed / self.count_done
+
+        return None
+
+    def as_dict(self) -> dict:
+        """Снимок состояния, который можно передать в другой поток или вывести в JSON"""
+        return {
+            'count_done': self.count_done,
+            'count_total': self.count_total,
+            'bytes_done': self.bytes_done,
+            'bytes_hashed': self.bytes_hashed,
+            'bytes_total': self.bytes_total,
+            'files_per_second': round(self.files_per_second, 1),
+            'mb_per_second': round(self.mb_per_second, 2),
+            'eta': None if self.eta is None else round(self.eta, 1),
+            'queue_depths': dict(self.queue_depths),
+            'current': None if self.current is None else str(self.current),
+            'is_finished': self.is_finished,
+        }
+
+    def format(self) -> str:
+        count_total = '' if self.count_total is None else f'/{self.count_total}'
+        eta = '' if self.eta is None else ', осталось {:.0f} с'.format(self.eta)
+        speed = f', {self.mb_per_second:.1f} МБ/с' if self.bytes_hashed else ''
+        return f'{self.count_done}{count_total} файлов, {self.files_per_second:.0f} файлов/с{speed}{eta}'
+
+
+def write_method(method):
+    """Выполняет метод DBStorage в потоке записи, транзакцию фиксирует поток записи"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.writer.execute(method, self, *args, **kwargs)
+
+    return wrapper
+
+
+def exclusive_write_method(method):
+    """
+    Выполняет метод DBStorage в вызывающем потоке, заняв соединение записи на всё время метода.
+    Нужно методам, которые вызывают колбэки: колбэки не должны выполняться в потоке записи.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.writer.lease():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class DBWriter:
+    """
+    Единственное соединение, через которое изменяется база.
+    Задания из очереди выполняет отдельный поток: он забирает все накопившиеся задания,
+    выполняет каждое в своей точке сохранения и фиксирует их одной транзакцией.
+    Без потока (база в памяти) задания выполняются в вызывающем потоке под блокировкой.
+    """
+    MAX_JOBS_PER_COMMIT = 64
+
+    def __init__(self, connection: sqlite3.Connection, is_threaded: bool = True) -> None:
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.queue = SimpleQueue()
+        self.lock = RLock()
+        self.owner = None
+        self.thread = None
+        if is_threaded:
+            self.thread = self.owner = Thread(target=self.run, name='DBWriter', daemon=True)
+            self.thread.start()
+
+    def execute(self, func, *args, exclusive=False, **kwargs):
+        """
+        Выполняет func и возвращает её результат после фиксации транзакции.
+        :param exclusive: func сама управляет транзакцией, поэтому выполняется вне точки сохранения
+        """
+        if current_thread() is self.owner:
+            return func(*args, **kwargs)
+
+        future = Future()
+        job = (future, func, args, kwargs, exclusive)
+        if self.thread:
+            self.queue.put(job)
+        else:
+            with self.lock:
+                self.owner = current_thread()
+                try:
+                    self.run_jobs([job])
+                finally:
+                    self.owner = None
+
+        return future.result()
+
+    @contextmanager
+    def lease(self):
+        """
+        Отдаёт соединение записи вызывающему потоку на время блока, поток записи в это время ждёт.
+        В конце блока транзакция фиксируется, при исключении - откатывается.
+        """
+        caller = current_thread()
+        if caller is self.owner:
+            yield
+            return
+
+        def wait_for_release():
+            self.owner = caller
+            is_leased.set()
+            is_released.wait()
+            self.owner = self.thread
+
+        if not self.thread:
+            with self.lock:
+                self.owner = caller
+                try:
+                    yield from self._run_leased()
+                finally:
+                    self.owner = None
+
+            return
+
+        is_leased, is_released = Event(), Event()
+        future = Future()
+        self.queue.put((future, wait_for_release, (), {}, True))
+        is_leased.wait()
+        try:
+            yield from self._run_leased()
+        finally:
+            is_released.set()
+            future.result()
+
+    def _run_leased(self):
+        try:
+            yield
+        except BaseException:
+            self.connection.rollback()
+            raise
+
+        self.connection.commit()
+
+    def run(self):
+        while True:
+            jobs = [self.queue.get()]
+            while len(jobs) < self.MAX_JOBS_PER_COMMIT:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            is_closed = None in jobs
+            self.run_jobs(jobs[:jobs.index(None)] if is_closed else jobs)
+            if is_closed:
+                return
+
+    def run_jobs(self, jobs):
+        completed = []
+        for future, func, args, kwargs, exclusive in jobs:
+            if exclusive:
+                self.commit(completed)
+                completed = []
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except Exception as exception:
+                    future.set_exception(exception)
+
+                continue
+
+            if not self.connection.in_transaction:
+                self.cursor.execute('BEGIN')
+
+            self.cursor.execute('SAVEPOINT write_job')
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exception:
+                self.cursor.execute('ROLLBACK TO write_job')
+                self.cursor.execute('RELEASE write_job')
+                future.set_exception(exception)
+                continue
+
+            self.cursor.execute('RELEASE write_job')
+            completed.append((future, result))
+
+        self.commit(completed)
+
+    def commit(self, completed):
+        """Фиксирует транзакцию и только после этого отдаёт результаты ожидающим заданиям"""
+        try:
+            if self.connection.in_transaction:
+                self.connection.commit()
+        except Exception as exception:
+            self.connection.rollback()
+            for future, _ in completed:
+                future.set_exception(exception)
+
+            return
+
+        for future, result in completed:
+            future.set_result(result)
+
+    def close(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+
+        self.connection.close()
+
+
+class TagTree:
+    """
+    Иерархия тегов, построенная по одному списку (id, name, parent_id).
+    Теги пронумерованы в порядке обхода в глубину: потомки тега занимают в нём непрерывный отрезок
+    [tin, tout), поэтому проверка "предок ли" выполняется за O(1), а потомки и предки перечисляются
+    за O(1) на каждый тег. Тег с несуществующим родителем считается корневым.
+    """
+    def __init__(self, rows) -> None:
+        self.names = {}
+        self.parents = {}
+        self.children = defaultdict(list)
+        for tag_id, name, parent_id in rows:
+            self.names[tag_id] = name
+            self.parents[tag_id] = parent_id
+
+        for tag_id, parent_id in self.parents.items():
+            self.children[parent_id if parent_id in self.names else None].append(tag_id)
+
+        self.preorder = []
+        self.depths = {}
+        self.tin = {}
+        self.tout = {}
+        stack = [(tag_id, 0, False) for tag_id in reversed(self.children[None])]
+        while stack:
+            tag_id, depth, is_exit = stack.pop()
+            if is_exit:
+                self.tout[tag_id] = len(self.preorder)
+                continue
+
+            self.tin[tag_id] = len(self.preorder)
+            self.depths[tag_id] = depth
+            self.preorder.append(tag_id)
+            stack.append((tag_id, depth, True))
+            stack.extend((child_id, depth + 1, False) for child_id in reversed(self.children[tag_id]))
+
+    def __iter__(self):
+        """Перебирает (id, name, parent_id, depth) так, что родитель идёт раньше своих потомков"""
+        for tag_id in self.preorder:
+            parent_id = self.parents[tag_id]
+            yield tag_id, self.names[tag_id], parent_id if parent_id in self.names else None, self.depths[tag_id]
+
+    def __len__(self):
+        return len(self.preorder)
+
+    def __contains__(self, tag_id):
+        return tag_id in self.tin
+
+    def get_depth(self, tag_id) -> int:
+        return self.depths[tag_id]
+
+    def is_ancestor(self, ancestor_id, tag_id) -> bool:
+        """Является ли ancestor_id предком tag_id (сам тег своим предком не считается)"""
+        return self.tin[ancestor_id] < self.tin[tag_id] < self.tout[ancestor_id]
+
+    def get_ancestors(self, tag_id) -> list:
+        """Возвращает предков тега от родителя к корню"""
+        ancestors = []
+        parent_id = self.parents[tag_id]
+        while parent_id in self.names:
+            ancestors.append(parent_id)
+            parent_id = self.parents[parent_id]
+
+        return ancestors
+
+    def get_descendants(self, tag_id) -> list:
+        """Возвращает всех потомков тега в порядке обхода в глубину"""
+        return self.preorder[self.tin[tag_id] + 1:self.tout[tag_id]]
+
+
+class TagFilter:
+    """
+    Отбор файлов по тегам: у файла должны быть все теги из all_of, хотя бы один тег из any_of
+    и ни одного тега из none_of. При with_descendants тег считается присвоенным файлу и тогда,
+    когда файлу присвоен любой из потомков тега.
+    """
+    def __init__(self, all_of=(), any_of=(), none_of=(), with_descendants=True) -> None:
+        self.all_of = [int(tag_id) for tag_id in all_of]
+        self.any_of = [int(tag_id) for tag_id in any_of]
+        self.none_of = [int(tag_id) for tag_id in none_of]
+        self.with_descendants = with_descendants
+
+    def __bool__(self):
+        return bool(self.all_of or self.any_of or self.none_of)
+
+    def expand(self, tag_id, tag_tree: TagTree) -> list:
+        """Возвращает тег вместе с потомками, если они учитываются"""
+        if self.with_descendants and tag_id in tag_tree:
+            return [tag_id, *tag_tree.get_descendants(tag_id)]
+
+        return [tag_id]
+
+    def get_groups(self, tag_tree: TagTree):
+        """
+        Возвращает условия в виде множеств тегов: (required, excluded).
+        Каждое множество из required должно пересекаться с тегами файла, а excluded - не пересекаться.
+        """
+        required = [self.expand(tag_id, tag_tree) for tag_id in self.all_of]
+        if self.any_of:
+            required.append([expanded_id for tag_id in self.any_of for expanded_id in self.expand(tag_id, tag_tree)])
+
+        excluded = [expanded_id for tag_id in self.none_of for expanded_id in self.expand(tag_id, tag_tree)]
+        return required, excluded
+
+
 class DBStorage:
-    COUNT_ROWS_FOR_INSERT = 30
-    COUNT_ROWS_ON_PAGE = 10
+    COUNT_ROWS_FOR_INSERT = 1000
+    COUNT_ROWS_ON_PAGE = 1000
+    COUNT_FILES_IN_TAGS_QUERY = 500
+    FILE_TAGS_CACHE_SIZE = 10000
+    PRAGMAS = {'busy_timeout': 5000, 'cache_size': -16000, 'mmap_size': 268435456, 'temp_store': 'MEMORY'}
+    WRITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+    ORDER_BY_COLUMNS = {'files.hash': 0, 'files.id': 1, 'files.directory': 2, 'files.filename': 3}
     SQL_INSERT_ROW = 'INSERT INTO files (hash, directory, filename) VALUES (?, ?, ?)'
     SQL_INSERT_ROW_WITH_ID = 'INSERT INTO files (hash, id, directory, filename) VALUES (?, ?, ?, ?)'
     SQL_SELECT_FILE = 'SELECT directory, filename FROM files WHERE hash=?'
     SQL_SELECT_COUNT_ROWS = 'SELECT COUNT(id) FROM files'
+    SQL_SELECT_MAX_ID = 'SELECT MAX(id) FROM files'
     SQL_CREATE_TABLE = '''
         CREATE TABLE IF NOT EXISTS files (
-            hash VARCHAR(64) UNIQUE,
+            hash BLOB(32) UNIQUE,
             id INTEGER PRIMARY KEY,
             directory VARCHAR(255),
             filename VARCHAR(255),
@@ -51,13 +596,190 @@ class DBStorage:
         );
         CREATE TABLE IF NOT EXISTS file_tag (
             file_id INTEGER NOT NULL,
-            tag_id INTEGER NOT NULL
-        );'''
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (file_id, tag_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS file_stats (
+            directory VARCHAR(255) NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            hash BLOB(32) NOT NULL,
+            partial_hash BLOB(32),
+            PRIMARY KEY (directory, filename)
+        );
+        CREATE INDEX IF NOT EXISTS file_tag_tag_id ON file_tag (tag_id, file_id);
+        CREATE INDEX IF NOT EXISTS tags_parent_id ON tags (parent_id, name);
+        CREATE INDEX IF NOT EXISTS files_filename ON files (filename, id, directory, hash);
+        CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+        CREATE INDEX IF NOT EXISTS files_deleted ON files (filename) WHERE is_deleted = 1;'''
+    # MIGRATIONS[n] - метод, переводящий схему из версии n в n + 1
+    MIGRATIONS = ('migrate_hashes_to_blob', 'migrate_file_tag_and_indexes')
+    SQL_CHECK_FILES_TABLE = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='files'"
+    SQL_CREATE_FTS = '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+            directory,
+            filename,
+            content='files',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 0'
+        );
+        CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+            INSERT INTO files_fts (files_fts, rowid, directory, filename)
+            VALUES ('delete', old.id, old.directory, old.filename);
+        END;
+        CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF directory, filename ON files BEGIN
+            INSERT INTO files_fts (files_fts, rowid, directory, filename)
+            VALUES ('delete', old.id, old.directory, old.filename);
+            INSERT INTO files_fts (rowid, directory, filename) VALUES (new.id, new.directory, new.filename);
+        END;'''
+    # новые файлы попадают в индекс порцией в insert_rows: триггер на каждую строку вдвое замедлял вставку
+    SQL_DROP_FTS_INSERT_TRIGGER = 'DROP TRIGGER IF EXISTS files_fts_insert'
+    SQL_DROP_FTS_TRIGGERS = (
+        'DROP TRIGGER IF EXISTS files_fts_delete',
+        'DROP TRIGGER IF EXISTS files_fts_update',
+    )
+    SQL_SELECT_HASH_COLUMN_TYPE = "SELECT type FROM pragma_table_info(?) WHERE name='hash'"
+    SQL_MIGRATE_FILES_HASHES_TO_BLOB = (
+        '''CREATE TABLE files_blob (
+            hash BLOB(32) UNIQUE,
+            id INTEGER PRIMARY KEY,
+            directory VARCHAR(255),
+            filename VARCHAR(255),
+            is_deleted INT NOT NULL DEFAULT 0
+        )''',
+        'INSERT INTO files_blob SELECT hash_to_blob(hash), id, directory, filename, is_deleted FROM files',
+        'DROP TABLE files',
+        'ALTER TABLE files_blob RENAME TO files',
+    )
+    SQL_CREATE_FILE_STATS_BLOB = '''
+        CREATE TABLE file_stats_blob (
+            directory VARCHAR(255) NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            hash BLOB(32) NOT NULL,
+            partial_hash BLOB(32),
+            PRIMARY KEY (directory, filename)
+        )'''
+    SQL_MIGRATE_FILE_STATS_HASHES_TO_BLOB = (
+        'INSERT INTO file_stats_blob SELECT directory, filename, size, mtime_ns, inode, '
+        'hash_to_blob(hash), hash_to_blob(partial_hash) FROM file_stats',
+        'DROP TABLE file_stats',
+    )
+    SQL_RENAME_FILE_STATS_BLOB = 'ALTER TABLE file_stats_blob RENAME TO file_stats'
+    SQL_MIGRATE_FILE_TAG_AND_INDEXES = (
+        '''CREATE TABLE file_tag_pk (
+            file_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (file_id, tag_id)
+        ) WITHOUT ROWID''',
+        'INSERT OR IGNORE INTO file_tag_pk SELECT file_id, tag_id FROM file_tag',
+        'DROP TABLE file_tag',
+        'ALTER TABLE file_tag_pk RENAME TO file_tag',
+        'CREATE INDEX file_tag_tag_id ON file_tag (tag_id, file_id)',
+        'CREATE INDEX tags_parent_id ON tags (parent_id, name)',
+        'CREATE INDEX files_filename ON files (filename, id, directory, hash)',
+        'CREATE INDEX files_directory ON files (directory)',
+        'CREATE INDEX files_deleted ON files (filename) WHERE is_deleted = 1',
+    )
+    SQL_CHECK_FTS = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='files_fts'"
+    SQL_REBUILD_FTS = "INSERT INTO files_fts (files_fts) VALUES ('rebuild')"
+    SQL_INSERT_FTS_ROW = 'INSERT INTO files_fts (rowid, directory, filename) VALUES (?, ?, ?)'
+    SQL_INSERT_FTS_ROWS_AFTER_ID = (
+        'INSERT INTO files_fts (rowid, directory, filename) SELECT id, directory, filename FROM files WHERE id > ?'
+    )
     SQL_DELETE_FILE = 'DELETE FROM files WHERE hash=?'
     SQL_DELETE_FILES = 'DELETE FROM files WHERE id IN (%s)'
     SQL_UPDATE_SET_IS_DELETED_FOR_ALL = 'UPDATE files SET is_deleted=1'
     SQL_UPDATE_SET_IS_DELETED = 'UPDATE files SET is_deleted=0 WHERE hash=?'
     SQL_UPDATE_FILE = 'UPDATE files SET directory=?, filename=? WHERE hash=?'
+    SQL_CREATE_TEMP_IMPORT_TABLES = (
+        'CREATE TEMP TABLE import_files (hash BLOB(32), id INTEGER, directory VARCHAR(255), filename VARCHAR(255))',
+        'CREATE TEMP TABLE import_tags (id INTEGER, name VARCHAR(255), parent_id INTEGER)',
+        'CREATE TEMP TABLE import_file_tag (file_id INTEGER, tag_id INTEGER)',
+    )
+    SQL_DROP_TEMP_IMPORT_TABLES = (
+        'DROP TABLE IF EXISTS temp.import_files',
+        'DROP TABLE IF EXISTS temp.import_tags',
+        'DROP TABLE IF EXISTS temp.import_file_tag',
+    )
+    SQL_INSERT_IMPORT_FILE = 'INSERT INTO temp.import_files (hash, id, directory, filename) VALUES (?, ?, ?, ?)'
+    SQL_INSERT_IMPORT_TAG = "INSERT INTO temp.import_tags (id, name, parent_id) VALUES (?, ?, NULLIF(?, ''))"
+    SQL_INSERT_IMPORT_TAG_FILE = 'INSERT INTO temp.import_file_tag (file_id, tag_id) VALUES (?, ?)'
+    SQL_CREATE_TEMP_IMPORT_FILES_INDEX = 'CREATE INDEX temp.import_files_hash ON import_files (hash)'
+    SQL_SELECT_IMPORT_CONFLICT = (
+        'SELECT imported.directory, imported.filename, files.directory, files.filename '
+        'FROM temp.import_files AS imported JOIN files ON files.hash = imported.hash '
+        'WHERE (files.directory, files.filename) IS NOT (imported.directory, imported.filename) '
+        'UNION ALL '
+        'SELECT imported.directory, imported.filename, files.directory, files.filename '
+        'FROM temp.import_files AS imported JOIN files ON files.id = imported.id '
+        'WHERE files.hash <> imported.hash '
+        'UNION ALL '
+        'SELECT imported.directory, imported.filename, other.directory, other.filename '
+        'FROM temp.import_files AS imported JOIN temp.import_files AS other '
+        'ON other.hash = imported.hash AND other.rowid < imported.rowid '
+        'WHERE (other.directory, other.filename) IS NOT (imported.directory, imported.filename) '
+        'LIMIT 1'
+    )
+    SQL_SELECT_IMPORT_TAG_CONFLICT = (
+        'SELECT imported.id, imported.name, tags.name '
+        'FROM temp.import_tags AS imported JOIN tags ON tags.id = imported.id '
+        'WHERE (tags.name, tags.parent_id) IS NOT (imported.name, imported.parent_id) '
+        'UNION ALL '
+        'SELECT imported.id, imported.name, other.name '
+        'FROM temp.import_tags AS imported JOIN temp.import_tags AS other '
+        'ON other.id = imported.id AND other.rowid < imported.rowid '
+        'WHERE (other.name, other.parent_id) IS NOT (imported.name, imported.parent_id) '
+        'LIMIT 1'
+    )
+    SQL_APPLY_IMPORT = (
+        'INSERT OR IGNORE INTO files (hash, id, directory, filename) '
+        'SELECT hash, id, directory, filename FROM temp.import_files ORDER BY id',
+        'INSERT OR IGNORE INTO tags (id, name, parent_id) SELECT id, name, parent_id FROM temp.import_tags',
+        'INSERT OR IGNORE INTO file_tag (file_id, tag_id) SELECT file_id, tag_id FROM temp.import_file_tag',
+    )
+    SQL_SELECT_IMPORT_DANGLING_TAG = (
+        'SELECT imported.id, imported.parent_id FROM temp.import_tags AS imported '
+        'WHERE imported.parent_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM tags WHERE tags.id = imported.parent_id) '
+        'LIMIT 1'
+    )
+    SQL_SELECT_IMPORT_DANGLING_TAG_FILE = (
+        'SELECT imported.file_id, imported.tag_id FROM temp.import_file_tag AS imported '
+        'WHERE NOT EXISTS (SELECT 1 FROM files WHERE files.id = imported.file_id) '
+        'OR NOT EXISTS (SELECT 1 FROM tags WHERE tags.id = imported.tag_id) '
+        'LIMIT 1'
+    )
+
+    SQL_CREATE_TEMP_PENDING_HASHES = 'CREATE TEMP TABLE IF NOT EXISTS pending_hashes (hash BLOB(32) PRIMARY KEY)'
+    SQL_INSERT_PENDING_HASH = 'INSERT OR IGNORE INTO temp.pending_hashes (hash) VALUES (?)'
+    SQL_SELECT_PENDING_EXISTED_FILES = (
+        'SELECT files.hash, files.directory, files.filename '
+        'FROM temp.pending_hashes JOIN files ON files.hash = pending_hashes.hash'
+    )
+    SQL_UPDATE_SET_IS_NOT_DELETED_FOR_PENDING = (
+        'UPDATE files SET is_deleted=0 WHERE is_deleted=1 AND hash IN (SELECT hash FROM temp.pending_hashes)'
+    )
+    SQL_DELETE_PENDING_HASHES = 'DELETE FROM temp.pending_hashes'
+    SQL_CREATE_TEMP_SEEN_FILES = 'CREATE TEMP TABLE IF NOT EXISTS seen_files (id INTEGER PRIMARY KEY)'
+    SQL_INSERT_SEEN_PENDING_FILES = (
+        'INSERT OR IGNORE INTO temp.seen_files (id) '
+        'SELECT files.id FROM temp.pending_hashes JOIN files ON files.hash = pending_hashes.hash'
+    )
+    SQL_UPDATE_SET_IS_DELETED_FOR_UNSEEN = (
+        'UPDATE files SET is_deleted=1 WHERE is_deleted=0 AND id NOT IN (SELECT id FROM temp.seen_files)'
+    )
+    SQL_DROP_SEEN_FILES = 'DROP TABLE IF EXISTS temp.seen_files'
+
+    SQL_SELECT_ALL_FILE_STATS = 'SELECT directory, filename, size, mtime_ns, inode, hash, partial_hash FROM file_stats'
+    SQL_REPLACE_FILE_STAT = (
+        'INSERT OR REPLACE INTO file_stats (directory, filename, size, mtime_ns, inode, hash, partial_hash) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)'
+    )
+    SQL_DELETE_FILE_STAT = 'DELETE FROM file_stats WHERE directory=? AND filename=?'
 
     SQL_INSERT_TAG = 'INSERT INTO tags (name, parent_id) VALUES (?, ?)'
     SQL_IMPORT_TAG = 'INSERT INTO tags (id, name, parent_id) VALUES (?, ?, ?)'
@@ -70,129 +792,412 @@ class DBStorage:
 
     SQL_SELECT_ALL_TAG_FILE = 'SELECT file_id, tag_id FROM file_tag'
     SQL_SELECT_COUNT_FILES_FOR_TAG = 'SELECT COUNT(file_id) FROM file_tag WHERE tag_id=?'
+    SQL_SELECT_COUNT_FILES_FOR_TAGS = 'SELECT tag_id, COUNT(file_id) FROM file_tag GROUP BY tag_id'
+    SQL_SELECT_COUNT_FILES_FOR_TAG_TREE = '''
+        WITH RECURSIVE subtree (id) AS (
+            SELECT ?
+            UNION
+            SELECT tags.id FROM tags JOIN subtree ON tags.parent_id = subtree.id
+        )
+        SELECT COUNT(DISTINCT file_tag.file_id) FROM subtree JOIN file_tag ON file_tag.tag_id = subtree.id'''
+    SQL_SELECT_ALL_TAG_FILE_BY_FILE = 'SELECT file_id, tag_id FROM file_tag ORDER BY file_id'
+    SQL_SELECT_FILE_IDS_BY_TAGS = 'SELECT file_id FROM file_tag WHERE tag_id IN ({})'
+    SQL_SELECT_TAGS_OF_FILE_BY_HASH = 'SELECT tag_id FROM file_tag WHERE file_id = (SELECT id FROM files WHERE hash=?)'
+    SQL_DELETE_TAGS_OF_FILE_BY_HASH = 'DELETE FROM file_tag WHERE file_id = (SELECT id FROM files WHERE hash=?)'
     SQL_SELECT_COUNT_CHILD_TAGS = 'SELECT COUNT(id) FROM tags WHERE parent_id=?'
     
     SQL_SELECT_TAGS_BY_FILE = 'SELECT tags.name, tags.id FROM file_tag INNER JOIN tags ON file_tag.tag_id = tags.id WHERE file_tag.file_id=? ORDER BY tags.name'
+    SQL_SELECT_TAGS_BY_FILES = '''
+        SELECT file_tag.file_id, tags.name, tags.id FROM file_tag INNER JOIN tags ON file_tag.tag_id = tags.id
+        WHERE file_tag.file_id IN ({}) ORDER BY file_tag.file_id, tags.name'''
     SQL_INSERT_TAG_TO_FILE = 'INSERT INTO file_tag (file_id, tag_id) VALUES (?, ?)'
     SQL_IMPORT_TAG_TO_FILE = 'INSERT INTO file_tag (file_id, tag_id) VALUES (?, ?)'
     SQL_CHECK_TAG_FILE = 'SELECT 1 FROM file_tag WHERE file_id=? AND tag_id=? LIMIT 1'
     SQL_DELETE_TAG_FROM_FILE = 'DELETE FROM file_tag WHERE file_id=? AND tag_id=?'
 
+    @write_method
     def insert_tag(self, name, parent_id=None):
-        self.smart_reopen()
         self.cu.execute(self.SQL_INSERT_TAG, (name, parent_id))
         tag_id = self.cu.lastrowid
-        self.c.commit()
+        self.invalidate_tag_tree()
         return tag_id
 
+    @write_method
     def import_tag(self, tag_id, name, parent_id):
-        self.smart_reopen()
         self.cu.execute(self.SQL_IMPORT_TAG, (tag_id, name, parent_id))
-        self.c.commit()
+        with self.tag_caches_lock:
+            self.rolled_up_tag_counts = None
+
+        self.invalidate_tag_tree()
 
     def select_tags(self, parent_id=None):
-        self.smart_reopen()
         sql = self.SQL_SELECT_TAGS if parent_id else self.SQL_SELECT_TAGS_NULL
         params = (parent_id,) if parent_id else ()
         for row in self.cu.execute(sql, params).fetchall():
             yield row
 
+    @write_method
     def update_tag(self, tag_id, new_name):
-        self.smart_reopen()
         self.cu.execute(self.SQL_UPDATE_TAG, (new_name, tag_id))
-        self.c.commit()
+        self.invalidate_tag_tree()
+        self.reset_file_tags()
+
+    def get_tag_tree(self) -> TagTree:
+        """Возвращает иерархию всех тегов, прочитанную одним запросом и закешированную до изменения тегов"""
+        tag_tree = self.tag_tree
+        if tag_tree is None:
+            version = self.tag_tree_version
+            tag_tree = TagTree(self.cu.execute(self.SQL_SELECT_ALL_TAGS).fetchall())
+            with self.tag_caches_lock:
+                # теги могли измениться, пока дерево читалось, тогда оно не кешируется
+                if version == self.tag_tree_version:
+                    self.tag_tree = tag_tree
+
+        return tag_tree
+
+    def invalidate_tag_tree(self) -> None:
+        with self.tag_caches_lock:
+            self.tag_tree = None
+            self.tag_tree_version += 1
 
     def select_all_tags(self):
-        self.smart_reopen()
         for row in self.cu.execute(self.SQL_SELECT_ALL_TAGS).fetchall():
             yield row
 
     def select_tag(self, tag_id):
-        self.smart_reopen()
         return self.cu.execute(self.SQL_SELECT_TAG, (tag_id,)).fetchone()
 
     def select_tags_by_file(self, file_id):
-        self.smart_reopen()
-        for row in self.cu.execute(self.SQL_SELECT_TAGS_BY_FILE, (file_id,)).fetchall():
+        for row in self.get_tags_by_files([file_id])[file_id]:
             yield row
 
+    def get_tags_by_files(self, file_ids) -> dict:
+        """
+        Возвращает {идентификатор файла: ((имя тега, идентификатор тега), ...)} с тегами, упорядоченными по имени.
+        Теги ещё не закешированных файлов читаются одним запросом на каждые COUNT_FILES_IN_TAGS_QUERY файлов,
+        кеш на FILE_TAGS_CACHE_SIZE файлов сбрасывается при привязке и отвязке тегов.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        with self.tag_caches_lock:
+            tags_by_files = {}
+            missing_ids = []
+            for file_id in file_ids:
+                if file_id in self.file_tags:
+                    self.file_tags.move_to_end(file_id)
+                    tags_by_files[file_id] = self.file_tags[file_id]
+                else:
+                    missing_ids.append(file_id)
+
+            for start in range(0, len(missing_ids), self.COUNT_FILES_IN_TAGS_QUERY):
+                chunk = missing_ids[start:start + self.COUNT_FILES_IN_TAGS_QUERY]
+                sql = self.SQL_SELECT_TAGS_BY_FILES.format(', '.join('?' * len(chunk)))
+                rows = self.cu.execute(sql, chunk).fetchall()
+                for file_id in chunk:
+                    tags_by_files[file_id] = ()
+
+                for file_id, file_rows in groupby(rows, key=lambda row: row[0]):
+                    tags_by_files[file_id] = tuple((tag_name, tag_id) for _, tag_name, tag_id in file_rows)
+
+                for file_id in chunk:
+                    self.file_tags[file_id] = tags_by_files[file_id]
+
+            while len(self.file_tags) > self.FILE_TAGS_CACHE_SIZE:
+                self.file_tags.popitem(last=False)
+
+            return tags_by_files
+
+    def forget_file_tags(self, file_id) -> None:
+        with self.tag_caches_lock:
+            self.file_tags.pop(file_id, None)
+
+    def reset_file_tags(self) -> None:
+        with self.tag_caches_lock:
+            self.file_tags.clear()
+
+    @write_method
     def delete_tag(self, tag_id):
-        self.smart_reopen()
         self.cu.execute(self.SQL_DELETE_TAG, (tag_id,))
-        self.c.commit()
+        with self.tag_caches_lock:
+            if self.tag_counts is not None:
+                self.tag_counts.pop(tag_id, None)
 
-    def select_count_files_by_tag(self, tag_id):
-        self.smart_reopen()
-        for row in self.cu.execute(self.SQL_SELECT_COUNT_FILES_FOR_TAG, (tag_id,)).fetchall():
-            return row[0]
+            # дочерние теги удалённого становятся корневыми, и количества их прежних предков меняются
+            self.rolled_up_tag_counts = None
+
+        self.invalidate_tag_tree()
+        self.reset_file_tags()
+
+    def get_tag_counts(self) -> dict:
+        """Возвращает {идентификатор тега: количество файлов}, при первом обращении читая его одним запросом"""
+        with self.tag_caches_lock:
+            if self.tag_counts is None:
+                self.tag_counts = dict(self.cu.execute(self.SQL_SELECT_COUNT_FILES_FOR_TAGS).fetchall())
+
+            return self.tag_counts
+
+    def get_rolled_up_tag_counts(self) -> dict:
+        """
+        Возвращает {идентификатор тега: количество файлов с тегом или его потомками}, при первом обращении
+        читая все привязки одним запросом: каждый файл засчитывается своим тегам и их предкам по одному разу.
+        Привязка и отвязка тега забывают количества только у тега и его предков (см. change_tag_count),
+        и они пересчитываются по одному при следующем обращении.
+        """
+        tag_tree = self.get_tag_tree()
+        with self.tag_caches_lock:
+            if self.rolled_up_tag_counts is None:
+                rolled_up_tag_counts = Counter(dict.fromkeys(tag_tree.preorder, 0))
+                rows = self.cu.execute(self.SQL_SELECT_ALL_TAG_FILE_BY_FILE).fetchall()
+                for _, file_rows in groupby(rows, key=lambda row: row[0]):
+                    file_tag_ids = set()
+                    for _, tag_id in file_rows:
+                        if tag_id in tag_tree and tag_id not in file_tag_ids:
+                            file_tag_ids.add(tag_id)
+                            file_tag_ids.update(tag_tree.get_ancestors(tag_id))
+
+                    rolled_up_tag_counts.update(file_tag_ids)
+
+                self.rolled_up_tag_counts = dict(rolled_up_tag_counts)
+
+            return self.rolled_up_tag_counts
+
+    def change_tag_count(self, tag_id, delta) -> None:
+        with self.tag_caches_lock:
+            if self.tag_counts is not None:
+                self.tag_counts[tag_id] = self.tag_counts.get(tag_id, 0) + delta
+
+            if self.rolled_up_tag_counts is not None:
+                tag_tree = self.tag_tree
+                if tag_tree is None or tag_id not in tag_tree:
+                    self.rolled_up_tag_counts = None
+                else:
+                    for ancestor_id in (tag_id, *tag_tree.get_ancestors(tag_id)):
+                        self.rolled_up_tag_counts.pop(ancestor_id, None)
+
+    def reset_tag_counts(self) -> None:
+        with self.tag_caches_lock:
+            self.tag_counts = None
+            self.rolled_up_tag_counts = None
+
+    def select_count_files_by_tag(self, tag_id, with_descendants=False):
+        """
+        Возвращает количество файлов с тегом из кеша, который поддерживается при привязке и отвязке тегов.
+        :param with_descendants: считать и файлы с дочерними тегами (каждый файл один раз)
+        """
+        if not with_descendants:
+            return self.get_tag_counts().get(tag_id, 0)
+
+        rolled_up_tag_counts = self.get_rolled_up_tag_counts()
+        with self.tag_caches_lock:
+            if tag_id not in rolled_up_tag_counts:
+                # количество забыто после привязки или отвязки тега, либо тег новый
+                sql_params = (tag_id,)
+                count_files = self.cu.execute(self.SQL_SELECT_COUNT_FILES_FOR_TAG_TREE, sql_params).fetchone()[0]
+                rolled_up_tag_counts[tag_id] = count_files
+
+            return rolled_up_tag_counts[tag_id]
 
     def select_count_child_tags(self, tag_id):
-        self.smart_reopen()
         for row in self.cu.execute(self.SQL_SELECT_COUNT_CHILD_TAGS, (tag_id,)).fetchall():
             return row[0]
 
+    @write_method
     def assign_tag(self, tag_id, file_id):
-        self.smart_reopen()
         sql_params = (file_id, tag_id)
         if self.cu.execute(self.SQL_CHECK_TAG_FILE, sql_params).fetchone():
             return False
 
         self.cu.execute(self.SQL_INSERT_TAG_TO_FILE, sql_params)
-        self.c.commit()
+        self.change_tag_count(tag_id, 1)
+        self.forget_file_tags(file_id)
         return True
 
-    def import_tag_file(self, tag_id, file_id):
-        self.smart_reopen()
-        self.cu.execute(self.SQL_IMPORT_TAG_TO_FILE, (tag_id, file_id))
-        self.c.commit()
+    @write_method
+    def import_tag_file(self, file_id, tag_id):
+        self.cu.execute(self.SQL_IMPORT_TAG_TO_FILE, (file_id, tag_id))
+        self.change_tag_count(tag_id, 1)
+        self.forget_file_tags(file_id)
 
+    @write_method
     def unassign_tag(self, tag_id, file_id):
-        self.smart_reopen()
         sql_params = (file_id, tag_id)
         self.cu.execute(self.SQL_DELETE_TAG_FROM_FILE, sql_params)
-        self.c.commit()
+        if self.cu.rowcount:
+            self.change_tag_count(tag_id, -1)
+            self.forget_file_tags(file_id)
 
     def select_all_tag_files(self):
-        self.smart_reopen()
         for row in self.cu.execute(self.SQL_SELECT_ALL_TAG_FILE).fetchall():
             yield row
 
-    def __init__(self, db_path: Path) -> None:
+    def __init__(self, db_path: Path, count_rows_for_insert: int = None, pragmas: dict = None) -> None:
+        """
+        :param pragmas: дополняют и переопределяют PRAGMAS для всех соединений
+        """
         self.db_path = db_path
-        self.c = sqlite3.connect(db_path)
-        self.cu = self.c.cursor()
-        self.cu.executescript(self.SQL_CREATE_TABLE)
+        self.count_rows_for_insert = count_rows_for_insert or self.COUNT_ROWS_FOR_INSERT
+        self.pragmas = {**self.PRAGMAS, **(pragmas or {})}
+        self.is_memory = str(db_path) == ':memory:'
+        self.local = local()
+        self.read_connections = {}
+        self.read_connections_lock = Lock()
+        write_connection = self.connect()
+        if not self.is_memory:
+            for name, value in self.WRITE_PRAGMAS.items():
+                write_connection.execute('PRAGMA {}={}'.format(name, value))
+
+        self.writer = DBWriter(write_connection, is_threaded=not self.is_memory)
+        with self.writer.lease():
+            self.migrate()
+            self.has_fts = self.create_fts()
+
         self.seq_sql_params = []
+        self.seq_stat_params = []
         self.duplicates_by_hash = {}
-        self.ident = current_thread().ident
+        self.tag_counts = None
+        self.rolled_up_tag_counts = None
+        self.tag_caches_lock = RLock()
+        self.tag_tree = None
+        self.tag_tree_version = 0
+        self.file_tags = OrderedDict()
+        self.is_tracking_seen_files = False
+        self.is_bulk_mode = False
+
+    def migrate(self) -> None:
+        """
+        Приводит схему базы к последней версии. Версия схемы хранится в PRAGMA user_version,
+        каждая миграция из MIGRATIONS выполняется в своей транзакции вместе с повышением версии.
+        Новая база сразу создаётся по последней схеме.
+        """
+        version = self.cu.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0 and not self.cu.execute(self.SQL_CHECK_FILES_TABLE).fetchone():
+            self.cu.executescript(self.SQL_CREATE_TABLE)
+            self.cu.execute('PRAGMA user_version={}'.format(len(self.MIGRATIONS)))
+            return
+
+        for next_version, migration in enumerate(self.MIGRATIONS[version:], version + 1):
+            self.cu.execute('BEGIN')
+            getattr(self, migration)()
+            self.cu.execute('PRAGMA user_version={}'.format(next_version))
+            self.c.commit()
+
+    def migrate_hashes_to_blob(self) -> None:
+        """
+        Переводит хеши, записанные прежними версиями шестнадцатеричной строкой, в 32 байта.
+        Триггеры полнотекстового индекса удаляются вместе с таблицей и создаются заново в create_fts,
+        а сам индекс остаётся верным: идентификаторы и пути файлов не меняются.
+        """
+        self.c.create_function('hash_to_blob', 1, hash_to_blob, deterministic=True)
+        if self.cu.execute(self.SQL_SELECT_HASH_COLUMN_TYPE, ('files',)).fetchone()[0] != 'BLOB(32)':
+            for sql in self.SQL_MIGRATE_FILES_HASHES_TO_BLOB:
+                self.cu.execute(sql)
+
+        # базы старше кеша атрибутов файлов таблицы file_stats не имеют
+        file_stats_hash_type = self.cu.execute(self.SQL_SELECT_HASH_COLUMN_TYPE, ('file_stats',)).fetchone()
+        if file_stats_hash_type != ('BLOB(32)',):
+            self.cu.execute(self.SQL_CREATE_FILE_STATS_BLOB)
+            if file_stats_hash_type:
+                for sql in self.SQL_MIGRATE_FILE_STATS_HASHES_TO_BLOB:
+                    self.cu.execute(sql)
+
+            self.cu.execute(self.SQL_RENAME_FILE_STATS_BLOB)
+
+    def migrate_file_tag_and_indexes(self) -> None:
+        """
+        Даёт file_tag составной первичный ключ (повторные привязки при этом схлопываются) и обратный индекс,
+        а files - индексы под сортировки и выборку удалённых файлов.
+        """
+        for sql in self.SQL_MIGRATE_FILE_TAG_AND_INDEXES:
+            self.cu.execute(sql)
 
-    def reopen(self):
+    def create_fts(self) -> bool:
+        """
+        Создаёт полнотекстовый индекс по директориям и именам файлов. Изменения и удаления поддерживаются
+        триггерами, а новые файлы добавляются в индекс методами вставки.
+        Если SQLite собран без FTS5, то поиск выполняется через LIKE.
         """
-        Переоткрывает существующую базу.
-        Вызываем метод внутри дочернего потока и после выхода из дочернего потока - в родительском """
-        self.c = sqlite3.connect(self.db_path)
-        self.cu = self.c.cursor()
+        is_fts_existed = self.cu.execute(self.SQL_CHECK_FTS).fetchone()
+        try:
+            self.cu.executescript(self.SQL_CREATE_FTS)
+            self.cu.execute(self.SQL_DROP_FTS_INSERT_TRIGGER)
+        except sqlite3.OperationalError:
+            return False
+
+        if not is_fts_existed:
+            self.cu.execute(self.SQL_REBUILD_FTS)
+            self.c.commit()
+
+        return True
+
+    @staticmethod
+    def get_fts_query(search):
+        """Превращает строку поиска в запрос FTS5: каждое слово ищется как префикс слова в пути файла"""
+        return ' '.join('"{}"*'.format(word) for word in re.findall(r'[^\W_]+', search))
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute('PRAGMA {}={}'.format(name, value))
+
+        return connection
+
+    def get_read_connection(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение для чтения, принадлежащее текущему потоку.
+        Соединения завершившихся потоков закрываются при открытии нового.
+        База в памяти существует только в одном соединении, поэтому оно общее для всех потоков.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            if self.is_memory:
+                connection = self.writer.connection
+            else:
+                connection = self.connect()
+                with self.read_connections_lock:
+                    for thread in [thread for thread in self.read_connections if not thread.is_alive()]:
+                        self.read_connections.pop(thread).close()
+
+                    self.read_connections[current_thread()] = connection
+
+            self.local.connection = connection
+            self.local.cursor = connection.cursor()
+
+        return connection
+
+    @property
+    def c(self) -> sqlite3.Connection:
+        if current_thread() is self.writer.owner:
+            return self.writer.connection
+
+        return self.get_read_connection()
+
+    @property
+    def cu(self) -> sqlite3.Cursor:
+        if current_thread() is self.writer.owner:
+            return self.writer.cursor
+
+        self.get_read_connection()
+        return self.local.cursor
 
-    def smart_reopen(self):
-        ident = current_thread().ident
-        if self.ident != ident:
-            self.reopen()
-            self.ident = ident
-    
     def close(self):
-        self.smart_reopen()
-        self.c.close()
+        self.writer.close()
+        with self.read_connections_lock:
+            for connection in self.read_connections.values():
+                connection.close()
 
+            self.read_connections.clear()
+
+    @write_method
     def clear(self) -> None:
-        self.smart_reopen()
         self.cu.execute('DELETE FROM files WHERE 1=1')
-        self.c.commit()
+        self.reset_file_tags()
 
     def get_count_rows(self) -> int:
-        self.smart_reopen()
         total_rows_count = self.cu.execute(self.SQL_SELECT_COUNT_ROWS).fetchone()
         return total_rows_count[0]
 
+    def get_max_id(self):
+        return self.cu.execute(self.SQL_SELECT_MAX_ID).fetchone()[0]
+
     def get_count_pages(self) -> int:
         total_rows_count = self.get_count_rows()
         count_pages = total_rows_count // self.COUNT_ROWS_ON_PAGE
@@ -201,74 +1206,206 @@ class DBStorage:
     def append_row(self, row: tuple) -> None:
         self.seq_sql_params.append(row)
 
+    def append_file_stat(self, row: tuple) -> None:
+        """
+        Откладывает запись (directory, filename, size, mtime_ns, inode, hash, partial_hash)
+        до ближайшего insert_rows
+        """
+        self.seq_stat_params.append(row)
+
+    def select_file_stats(self) -> dict:
+        """
+        Возвращает закешированные атрибуты файлов:
+        {(directory, filename): (size, mtime_ns, inode, hash, partial_hash)}
+        """
+        return {
+            (directory, filename): (size, mtime_ns, inode, hash_to_hex(file_hash), hash_to_hex(partial_hash))
+            for directory, filename, size, mtime_ns, inode, file_hash, partial_hash
+            in self.cu.execute(self.SQL_SELECT_ALL_FILE_STATS).fetchall()
+        }
+
+    @write_method
+    def delete_file_stats(self, paths) -> None:
+        self.cu.executemany(self.SQL_DELETE_FILE_STAT, paths)
+
     def is_ready_for_insert(self) -> bool:
-        return len(self.seq_sql_params) == self.COUNT_ROWS_FOR_INSERT
+        return len(self.seq_sql_params) >= self.count_rows_for_insert
 
+    @exclusive_write_method
     def insert_rows(self, with_id: bool = True, func=None):
         """
-        Добавляет список файлов в базу
-        :param with_id:
-        :param func:
-        иначе - возбуждать исключение
+        Добавляет порцию файлов в базу.
+        Хеши порции загружаются во временную таблицу, уже известные файлы находятся одним JOIN,
+        отметка об удалении снимается одним UPDATE только с тех из них, что были отмечены,
+        а новые файлы вставляются одним executemany и затем одним запросом добавляются в полнотекстовый индекс
+        (в bulk_mode индекс перестраивается в конце). Во время сканирования идентификаторы всех файлов
+        порции запоминаются во временной таблице (см. start_tracking_seen_files).
+        :param with_id: строки содержат идентификатор файла (hash, id, directory, filename)
+        :param func: вызывается для каждого файла порции в порядке добавления с параметрами
+        (inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash)
         :return:
         """
-        self.smart_reopen()
         sql_insert = self.SQL_INSERT_ROW_WITH_ID if with_id else self.SQL_INSERT_ROW
-        for sql_params in self.seq_sql_params:
+        blob_rows = [(hash_to_blob(sql_params[0]), *sql_params[1:]) for sql_params in self.seq_sql_params]
+        self.cu.execute(self.SQL_CREATE_TEMP_PENDING_HASHES)
+        self.cu.executemany(self.SQL_INSERT_PENDING_HASH, ((sql_params[0],) for sql_params in blob_rows))
+        existed_files = {
+            file_hash: (existed_directory, existed_filename)
+            for file_hash, existed_directory, existed_filename
+            in self.cu.execute(self.SQL_SELECT_PENDING_EXISTED_FILES).fetchall()
+        }
+        self.cu.execute(self.SQL_UPDATE_SET_IS_NOT_DELETED_FOR_PENDING)
+
+        new_hashes = set()
+        new_rows = []
+        for sql_params in blob_rows:
             file_hash = sql_params[0]
-            row = self.cu.execute(self.SQL_SELECT_FILE, (file_hash,)).fetchone()
-            inserted_directory, inserted_filename = sql_params[2 if with_id else 1:]
-            if row:
-                existed_directory, existed_filename = row
-                self.set_is_not_deleted(file_hash)
-            else:
-                self.cu.execute(sql_insert, sql_params)
-                existed_directory, existed_filename = None, None
-
-            if func:
+            if file_hash not in existed_files and file_hash not in new_hashes:
+                new_hashes.add(file_hash)
+                new_rows.append(sql_params)
+
+        is_fts_updated = self.has_fts and not self.is_bulk_mode
+        if is_fts_updated and not with_id:
+            # без явного идентификатора новые строки получают идентификаторы больше текущего наибольшего
+            max_id = self.cu.execute(self.SQL_SELECT_MAX_ID).fetchone()[0] or 0
+
+        self.cu.executemany(sql_insert, new_rows)
+        if is_fts_updated and with_id:
+            self.cu.executemany(self.SQL_INSERT_FTS_ROW, (sql_params[1:] for sql_params in new_rows))
+        elif is_fts_updated:
+            self.cu.execute(self.SQL_INSERT_FTS_ROWS_AFTER_ID, (max_id,))
+
+        if self.is_tracking_seen_files:
+            self.cu.execute(self.SQL_INSERT_SEEN_PENDING_FILES)
+
+        self.cu.execute(self.SQL_DELETE_PENDING_HASHES)
+
+        if func:
+            processed_hashes = set()
+            for sql_params in blob_rows:
+                file_hash = sql_params[0]
+                inserted_directory, inserted_filename = sql_params[2 if with_id else 1:]
+                if file_hash in processed_hashes:
+                    # повтор хеша внутри порции: func для предыдущего файла могла обновить путь в базе
+                    existed_directory, existed_filename = self.cu.execute(self.SQL_SELECT_FILE, (file_hash,)).fetchone()
+                else:
+                    existed_directory, existed_filename = existed_files.get(file_hash, (None, None))
+
+                processed_hashes.add(file_hash)
                 func(
                     inserted_directory,
                     inserted_filename,
                     existed_directory,
                     existed_filename,
-                    file_hash,
+                    hash_to_hex(file_hash),
                 )
 
-        self.c.commit()
+        if self.seq_stat_params:
+            self.cu.executemany(self.SQL_REPLACE_FILE_STAT, (
+                (*stat, hash_to_blob(file_hash), hash_to_blob(partial_hash))
+                for *stat, file_hash, partial_hash in self.seq_stat_params
+            ))
+            self.seq_stat_params.clear()
+
         self.seq_sql_params.clear()
-    
-    def _sql_builder(self, tags=None, only_deleted=False, order_by='files.filename', only_count=False, search=''):
+
+    def build_tag_filter_conditions(self, tag_filter: TagFilter, sql_params: list) -> list:
+        """
+        Возвращает условия WHERE для отбора по тегам и дописывает их параметры в sql_params.
+        Теги раскрываются до потомков по закешированному дереву, а связи проверяются полусоединениями:
+        нужные файлы - пересечением (INTERSECT) выборок по индексу file_tag_tag_id, исключённые - через NOT IN.
+        Файлы не размножаются соединением, поэтому ни GROUP BY, ни DISTINCT не нужны.
+        """
+        required, excluded = tag_filter.get_groups(self.get_tag_tree())
+        conditions = []
+        if required:
+            subqueries = []
+            for tag_ids in required:
+                subqueries.append(self.SQL_SELECT_FILE_IDS_BY_TAGS.format(', '.join('?' * len(tag_ids))))
+                sql_params.extend(tag_ids)
+
+            conditions.append('files.id IN ({})'.format(' INTERSECT '.join(subqueries)))
+
+        if excluded:
+            conditions.append('files.id NOT IN ({})'.format(
+                self.SQL_SELECT_FILE_IDS_BY_TAGS.format(', '.join('?' * len(excluded))),
+            ))
+            sql_params.extend(excluded)
+
+        return conditions
+
+    def _sql_builder(
+            self,
+            tags=None,
+            only_deleted=False,
+            order_by='files.filename',
+            only_count=False,
+            search='',
+            last_key=None,
+            with_offset=False,
+    ):
+        """
+        Строит запрос списка файлов или их количества.
+        tags - TagFilter или список id тегов (файлы хотя бы с одним из них, без учёта потомков).
+        Страницы выбираются по ключу (order_by, files.id): last_key - ключ последней строки предыдущей страницы.
+        Параметры LIMIT и, при with_offset, OFFSET дописываются к sql_params вызывающим кодом.
+        """
         sql_params = []
         sql = ['SELECT']
         sql_where = []
         
         if only_count:
-            sql.append('COUNT(DISTINCT files.id)')
+            sql.append('COUNT(*)')
         else:
             sql.append('files.hash, files.id, files.directory, files.filename')
         
         sql.append('FROM files')
-        
-        if tags:
-            sql.append('JOIN file_tag ON files.id = file_tag.file_id')
-        
+
+        if tags and not isinstance(tags, TagFilter):
+            # простой список - любой из тегов без учёта потомков, как раньше
+            tags = TagFilter(any_of=tags, with_descendants=False)
+
         if tags:
-            sql_where.append('file_tag.tag_id IN (%s)' % ', '.join('?'*len(tags)))
-            sql_params.extend(tags)
+            sql_where.extend(self.build_tag_filter_conditions(tags, sql_params))
 
         if only_deleted:
             sql_where.append('files.is_deleted = 1')
 
-        if search:
+        fts_query = self.get_fts_query(search) if search and self.has_fts else ''
+        if fts_query and order_by == 'rank':
+            sql.append('JOIN files_fts ON files_fts.rowid = files.id')
+            sql_where.append('files_fts MATCH ?')
+            sql_params.append(fts_query)
+        elif fts_query:
+            sql_where.append('files.id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)')
+            sql_params.append(fts_query)
+        elif search:
             sql_where.append('(files.directory LIKE ? OR files.filename LIKE ?)')
             sql_params.extend((f'%{search}%', f'%{search}%'))
 
+        if last_key:
+            if order_by == 'files.id':
+                sql_where.append('files.id > ?')
+                sql_params.append(last_key[1])
+            else:
+                sql_where.append(f'({order_by}, files.id) > (?, ?)')
+                sql_params.extend(last_key)
+
         if sql_where:
             sql.append('WHERE')
             sql.append(' AND '.join(sql_where))
 
         if not only_count:
-            sql.append(f'GROUP BY files.id ORDER BY {order_by} LIMIT ?,?')
+            if order_by == 'rank':
+                order_columns = 'files_fts.rank, files.id'
+            elif order_by == 'files.id':
+                order_columns = order_by
+            else:
+                order_columns = f'{order_by}, files.id'
+
+            sql.append(f'ORDER BY {order_columns} LIMIT ?')
+            if with_offset:
+                sql.append('OFFSET ?')
 
         return ' '.join(sql), sql_params
 
@@ -277,25 +1414,92 @@ class DBStorage:
         rows = self.cu.execute(sql, sql_params).fetchall()
         return rows[0][0] if rows else 0
 
-    def select_rows(self, tags=None, only_deleted=False, order_by='files.filename', search=''):
-        self.smart_reopen()
-        count_files = self.select_count(tags, only_deleted, order_by, search)
-        sql, sql_params = self._sql_builder(tags, only_deleted, order_by, False, search)
+    def get_order_by(self, order_by, search):
+        """Порядок по релевантности возможен только при полнотекстовом поиске, иначе файлы идут по имени"""
+        if order_by == 'rank' and not (search and self.has_fts and self.get_fts_query(search)):
+            return 'files.filename'
 
-        count_pages = self.get_count_pages()
-        for page_num in range(count_pages):
-            all_sql_params = [*sql_params, page_num * self.COUNT_ROWS_ON_PAGE, self.COUNT_ROWS_ON_PAGE]
-            for row in self.cu.execute(sql, all_sql_params).fetchall():
-                yield row
+        return order_by
 
+    def select_rows_window(
+            self,
+            tags=None,
+            only_deleted=False,
+            order_by='files.filename',
+            search='',
+            count_rows=None,
+            last_key=None,
+            offset=0,
+    ) -> list:
+        """
+        Возвращает до count_rows файлов (hash, id, directory, filename), пропустив offset строк после ключа last_key.
+        Ключ - (значение order_by, files.id) строки, после которой начинается окно; для 'rank' ключ не применяется.
+        """
+        count_rows = count_rows or self.COUNT_ROWS_ON_PAGE
+        order_by = self.get_order_by(order_by, search)
+        last_key = None if order_by == 'rank' else last_key
+        sql, sql_params = self._sql_builder(tags, only_deleted, order_by, False, search, last_key, with_offset=True)
+        rows = self.cu.execute(sql, [*sql_params, count_rows, offset]).fetchall()
+        return [(hash_to_hex(file_hash), *row) for file_hash, *row in rows]
+
+    def select_rows(self, tags=None, only_deleted=False, order_by='files.filename', search='', fetch_size=None):
+        """
+        Возвращает файлы (hash, id, directory, filename) страницами по fetch_size строк.
+        Каждая следующая страница продолжается с ключа последней строки, а не пропускает предыдущие через OFFSET,
+        поэтому полный обход занимает линейное время.
+        order_by='rank' упорядочивает результаты поиска по релевантности.
+        """
+        fetch_size = fetch_size or self.COUNT_ROWS_ON_PAGE
+        order_by = self.get_order_by(order_by, search)
+        if order_by == 'rank':
+            # порядок по релевантности не продолжить по ключу, поэтому результаты поиска читаются одним запросом
+            sql, sql_params = self._sql_builder(tags, only_deleted, order_by, False, search)
+            cursor = self.c.cursor()
+            cursor.execute(sql, [*sql_params, -1])
+            while rows := cursor.fetchmany(fetch_size):
+                for file_hash, *row in rows:
+                    yield (hash_to_hex(file_hash), *row)
+
+            return
+
+        order_column = self.ORDER_BY_COLUMNS[order_by]
+        last_key = None
+        while True:
+            sql, sql_params = self._sql_builder(tags, only_deleted, order_by, False, search, last_key)
+            rows = self.cu.execute(sql, [*sql_params, fetch_size]).fetchall()
+            for file_hash, *row in rows:
+                yield (hash_to_hex(file_hash), *row)
+            if len(rows) < fetch_size:
+                break
+
+            last_key = (rows[-1][order_column], rows[-1][1])
+
+    @write_method
+    def start_tracking_seen_files(self) -> None:
+        """
+        Начинает запоминать идентификаторы файлов, проходящих через insert_rows, во временной таблице.
+        Вместо того чтобы отмечать удалёнными все файлы перед сканированием, удалёнными после него
+        отмечаются только не встреченные файлы (mark_unseen_files_deleted), поэтому повторное
+        сканирование без изменений почти ничего не пишет в базу.
+        """
+        self.cu.execute(self.SQL_DROP_SEEN_FILES)
+        self.cu.execute(self.SQL_CREATE_TEMP_SEEN_FILES)
+        self.is_tracking_seen_files = True
+
+    @write_method
+    def mark_unseen_files_deleted(self) -> None:
+        """Отмечает удалёнными не встреченные с start_tracking_seen_files файлы одним анти-соединением"""
+        self.cu.execute(self.SQL_UPDATE_SET_IS_DELETED_FOR_UNSEEN)
+        self.cu.execute(self.SQL_DROP_SEEN_FILES)
+        self.is_tracking_seen_files = False
+
+    @write_method
     def set_is_deleted_for_all(self):
-        self.smart_reopen()
         self.cu.execute(self.SQL_UPDATE_SET_IS_DELETED_FOR_ALL)
-        self.c.commit()
 
+    @write_method
     def set_is_not_deleted(self, file_hash):
-        self.smart_reopen()
-        self.cu.execute(self.SQL_UPDATE_SET_IS_DELETED, (file_hash,))
+        self.cu.execute(self.SQL_UPDATE_SET_IS_DELETED, (hash_to_blob(file_hash),))
 
     def process_deleted_files(self, func):
         for file_hash, file_id, existed_directory, existed_filename in self.select_rows(only_deleted=True):
@@ -304,33 +1508,233 @@ class DBStorage:
             if func:
                 func(STATUS_DELETED, existed_path, None, file_hash)
 
+    @write_method
     def delete_file(self, file_hash):
-        self.smart_reopen()
-        self.cu.execute(self.SQL_DELETE_FILE, (file_hash, ))
-        self.c.commit()
-
+        """Удаляет файл из базы вместе с его привязками к тегам"""
+        sql_params = (hash_to_blob(file_hash),)
+        tag_ids = self.cu.execute(self.SQL_SELECT_TAGS_OF_FILE_BY_HASH, sql_params).fetchall()
+        self.cu.execute(self.SQL_DELETE_TAGS_OF_FILE_BY_HASH, sql_params)
+        self.cu.execute(self.SQL_DELETE_FILE, sql_params)
+        for tag_id, in tag_ids:
+            self.change_tag_count(tag_id, -1)
+
+        if tag_ids:
+            # идентификатор удалённого файла может достаться новому файлу
+            self.reset_file_tags()
+
+    @write_method
     def insert_file(self, file_hash, file_id, inserted_file):
-        self.smart_reopen()
-        self.cu.execute(
-            self.SQL_INSERT_ROW_WITH_ID,
-            (file_hash, file_id, os.path.dirname(inserted_file), os.path.basename(inserted_file))
-        )
-        self.c.commit()
+        directory, filename = os.path.dirname(inserted_file), os.path.basename(inserted_file)
+        self.cu.execute(self.SQL_INSERT_ROW_WITH_ID, (hash_to_blob(file_hash), file_id, directory, filename))
+        if self.has_fts and not self.is_bulk_mode:
+            self.cu.execute(self.SQL_INSERT_FTS_ROW, (self.cu.lastrowid, directory, filename))
 
+    @write_method
     def update(self, file_hash, inserted_directory, inserted_filename):
-        self.smart_reopen()
-        self.cu.execute(self.SQL_UPDATE_FILE, (inserted_directory, inserted_filename, file_hash))
-        self.c.commit()
+        self.cu.execute(self.SQL_UPDATE_FILE, (inserted_directory, inserted_filename, hash_to_blob(file_hash)))
+
+    @contextmanager
+    def bulk_mode(self):
+        """
+        Выполняет всё внутри блока одной транзакцией без сброса на диск, заняв соединение записи.
+        Триггеры полнотекстового индекса снимаются, а сам индекс перестраивается один раз в конце.
+        При исключении изменения откатываются.
+        """
+        with self.writer.lease():
+            synchronous = self.cu.execute('PRAGMA synchronous').fetchone()[0]
+            journal_mode = self.cu.execute('PRAGMA journal_mode').fetchone()[0]
+            self.cu.execute('PRAGMA synchronous=OFF')
+            if journal_mode != 'wal':
+                # из WAL без монопольного доступа к базе не выйти, а писать в WAL и так дёшево
+                self.cu.execute('PRAGMA journal_mode=MEMORY')
+
+            try:
+                self.cu.execute('BEGIN')
+                self.is_bulk_mode = True
+                if self.has_fts:
+                    for sql in self.SQL_DROP_FTS_TRIGGERS:
+                        self.cu.execute(sql)
+
+                yield
+                if self.has_fts:
+                    self.cu.execute(self.SQL_REBUILD_FTS)
+
+                self.c.commit()
+            except BaseException:
+                self.c.rollback()
+                raise
+            finally:
+                self.is_bulk_mode = False
+                if self.has_fts:
+                    self.cu.executescript(self.SQL_CREATE_FTS)
+
+                self.cu.execute('PRAGMA journal_mode={}'.format(journal_mode))
+                self.cu.execute('PRAGMA synchronous={}'.format(synchronous))
+
+    def create_import_tables(self) -> None:
+        """Создаёт временные таблицы, куда складываются импортируемые строки до проверки целостности"""
+        for sql in (*self.SQL_DROP_TEMP_IMPORT_TABLES, *self.SQL_CREATE_TEMP_IMPORT_TABLES):
+            self.cu.execute(sql)
+
+    def drop_import_tables(self) -> None:
+        for sql in self.SQL_DROP_TEMP_IMPORT_TABLES:
+            self.cu.execute(sql)
+
+    def stage_import_files(self, rows) -> int:
+        self.cu.executemany(self.SQL_INSERT_IMPORT_FILE, ((hash_to_blob(file_hash), *row) for file_hash, *row in rows))
+        return self.cu.rowcount
+
+    def stage_import_tags(self, rows) -> None:
+        self.cu.executemany(self.SQL_INSERT_IMPORT_TAG, rows)
+
+    def stage_import_tag_files(self, rows) -> None:
+        self.cu.executemany(self.SQL_INSERT_IMPORT_TAG_FILE, rows)
+
+    def select_import_conflict(self):
+        """
+        Ищет импортируемый файл, хеш которого уже есть в базе или в импорте под другим именем,
+        либо идентификатор которого занят другим файлом.
+        :return: (директория, имя файла, директория, имя файла в базе) или None
+        """
+        self.cu.execute(self.SQL_CREATE_TEMP_IMPORT_FILES_INDEX)
+        return self.cu.execute(self.SQL_SELECT_IMPORT_CONFLICT).fetchone()
+
+    def select_import_tag_conflict(self):
+        """
+        Ищет импортируемый тег, идентификатор которого в базе или в импорте занят тегом с другим именем или родителем.
+        :return: (идентификатор, имя импортируемого тега, имя тега в базе) или None
+        """
+        return self.cu.execute(self.SQL_SELECT_IMPORT_TAG_CONFLICT).fetchone()
+
+    def apply_import(self) -> None:
+        """Переносит файлы и теги из временных таблиц. Уже существующие одинаковые файлы и теги пропускаются"""
+        for sql in self.SQL_APPLY_IMPORT:
+            self.cu.execute(sql)
+
+        self.reset_tag_counts()
+        self.invalidate_tag_tree()
+        self.reset_file_tags()
+
+    def select_import_dangling_tag(self):
+        """:return: (идентификатор тега, идентификатор несуществующего родителя) или None"""
+        return self.cu.execute(self.SQL_SELECT_IMPORT_DANGLING_TAG).fetchone()
+
+    def select_import_dangling_tag_file(self):
+        """:return: (идентификатор файла, идентификатор тега), где файла или тега не существует, или None"""
+        return self.cu.execute(self.SQL_SELECT_IMPORT_DANGLING_TAG_FILE).fetchone()
+
+
+class LazyRows:
+    """
+    Список файлов запроса с доступом по позиции, который читается из базы окнами по window_size строк.
+    Длина берётся из COUNT, а окно читается только при обращении к одной из его позиций; прочитанные окна
+    хранятся в LRU из max_windows окон. Окно продолжается по ключу последней строки предыдущего окна,
+    а если тот ещё не прочитан (переход через полосу прокрутки) - через OFFSET от ближайшего известного ключа.
+    Если окно оказалось короче, чем обещал COUNT (файлы удалены после подсчёта), позиция возвращает None,
+    а прочитанное забывается: следующий len() пересчитает строки.
+    :param make_item: преобразует строку (hash, id, directory, filename) в элемент списка
+    :param on_fetch: вызывается со строками каждого прочитанного окна, например чтобы заранее прочитать их теги
+    """
+    WINDOW_SIZE = 200
+    MAX_WINDOWS = 16
+
+    def __init__(
+            self,
+            db: DBStorage,
+            tags=None,
+            order_by='files.filename',
+            search='',
+            make_item=None,
+            window_size=None,
+            max_windows=None,
+            on_fetch=None,
+    ) -> None:
+        self.db = db
+        self.tags = tags
+        self.order_by = db.get_order_by(order_by, search)
+        self.search = search
+        self.make_item = make_item or tuple
+        self.window_size = window_size or self.WINDOW_SIZE
+        self.max_windows = max_windows or self.MAX_WINDOWS
+        self.on_fetch = on_fetch
+        self.count_rows = None
+        self.windows = OrderedDict()
+        # номер окна -> ключ строки, после которой окно начинается
+        self.window_keys = {0: None}
+
+    def __len__(self):
+        if self.count_rows is None:
+            self.count_rows = self.db.select_count(self.tags, order_by=self.order_by, search=self.search)
+
+        return self.count_rows
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+
+        window_index, index = divmod(position, self.window_size)
+        window = self.get_window(window_index)
+        if index < len(window):
+            return window[index]
+
+        self.reset()
+        return None
+
+    def reset(self) -> None:
+        """Забывает длину и прочитанные окна, чтобы перечитать изменившийся запрос"""
+        self.count_rows = None
+        self.windows.clear()
+        self.window_keys = {0: None}
+
+    def get_window(self, window_index) -> list:
+        window = self.windows.get(window_index)
+        if window is not None:
+            self.windows.move_to_end(window_index)
+            return window
+
+        rows = self.fetch_window(window_index)
+        if len(rows) == self.window_size and self.order_by != 'rank':
+            order_column = self.db.ORDER_BY_COLUMNS[self.order_by]
+            self.window_keys[window_index + 1] = (rows[-1][order_column], rows[-1][1])
+
+        if self.on_fetch:
+            self.on_fetch(rows)
+
+        window = [self.make_item(row) for row in rows]
+        self.windows[window_index] = window
+        if len(self.windows) > self.max_windows:
+            self.windows.popitem(last=False)
+
+        return window
+
+    def fetch_window(self, window_index) -> list:
+        known_index = max(index for index in self.window_keys if index <= window_index)
+        return self.db.select_rows_window(
+            self.tags,
+            order_by=self.order_by,
+            search=self.search,
+            count_rows=self.window_size,
+            last_key=self.window_keys[known_index],
+            offset=(window_index - known_index) * self.window_size,
+        )
 
 
 class LibraryStorage:
     CSV_COUNT_ROWS_ON_PAGE = 100
+    HASHING_QUEUE_SIZE_PER_WORKER = 4
+    EXPORT_QUEUE_SIZE_PER_WORKER = 2
+    # страниц на процесс, при которых запуск процесса (spawn заново импортирует модули) окупается
+    EXPORT_MIN_PAGES_PER_WORKER = 200
+    RE_PAGE_NAME = re.compile(r'^\d+\.csv$')
     ARCHIVE_DIFF_FILE_NAME = 'diff.csv'
     MESSAGE_DOUBLE = 'Обнаружен дубликат по хешу:\n   В базе: {}\n    Дубль: {}'
     MESSAGE_DOUBLE_IMPORT = (
         'Обнаружен дубликат файла с отличающимся именем среди порции вставляемых файлов: '
         '{}\n    В базе:{}'
     )
+    MESSAGE_TAG_CONFLICT_IMPORT = 'Идентификатор {} импортируемого тега "{}" занят другим тегом: "{}"'
+    MESSAGE_DANGLING_TAG = 'Тег {} ссылается на несуществующий родительский тег {}'
+    MESSAGE_DANGLING_TAG_FILE = 'Привязка файла {} к тегу {} ссылается на несуществующий файл или тег'
 
     def __init__(self) -> None:
         """Инициализирует класс сканера хранилища"""
@@ -354,115 +1758,432 @@ class LibraryStorage:
             progress_current_file=None,
             func_finished=None,
             func=None,
+            full_rehash=False,
+            workers=1,
+            quick_hash=False,
+            progress: Progress = None,
+            prewalk=False,
+            scan_archives=False,
+            ignore_patterns=(),
+            ignore_directories=IGNORE_DIRECTORIES,
     ):
-        """Сканирует информацию о файлах в директории и заносит её в базу"""
+        """
+        Сканирует информацию о файлах в директории и заносит её в базу.
+        Хеш файла, у которого совпали размер, время изменения и inode с сохранёнными при прошлом сканировании,
+        не пересчитывается. При full_rehash=True хеши пересчитываются для всех файлов.
+        При workers > 1 хеши считаются пулом потоков, но в базу файлы попадают в порядке обхода директорий,
+        поэтому идентификаторы и порядок вызовов func не зависят от числа потоков.
+        При quick_hash=True перемещённые и переименованные файлы не перечитываются целиком (см. _quick_hash_files).
+        Ход сканирования передаётся в progress; если он не задан, progress_count_scanned_files и
+        progress_current_file вызываются с той же ограниченной частотой. При prewalk=True хранилище
+        сначала обходится целиком, чтобы оставшееся время оценивалось по общему объёму файлов.
+        При scan_archives=True zip-архивы сканируются как директории (см. _get_archive_entries).
+        Файлы, подходящие под glob-шаблоны ignore_patterns, и директории из ignore_directories
+        не сканируются (см. Walker); файлы базы пропускаются всегда.
+        Существует ли ещё файл по пути из базы (дубликат или перемещение), решается по путям, встреченным
+        при обходе, без обращения к файловой системе. Если путь из базы ещё не встречался, статус файла
+        определяется и передаётся в func после обхода, поэтому такие файлы сообщаются последними.
+        """
+        def report_progress(progress):
+            if progress_count_scanned_files:
+                progress_count_scanned_files(progress.count_done)
+
+            if progress_current_file and progress.current is not None:
+                progress_current_file(progress.current)
+
         def process_file_status(inserted_directory,
                     inserted_filename,
                     existed_directory,
                     existed_filename,
                     file_hash,):
-            status, existed_path, inserted_path = self.get_file_status(inserted_directory, inserted_filename, existed_directory, existed_filename)
+            existed = (existed_directory, existed_filename)
+            if existed_directory is None or existed == (inserted_directory, inserted_filename) or existed in seen_paths:
+                report_file_status(inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash)
+            else:
+                # путь из базы может ещё встретиться при обходе, поэтому статус определяется в конце сканирования
+                unresolved_files.append((inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash))
+
+        def report_file_status(inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash):
+            is_exists = (existed_directory, existed_filename) in seen_paths
+            status, existed_path, inserted_path = self.get_file_status(
+                inserted_directory, inserted_filename, existed_directory, existed_filename, is_exists,
+            )
             if status != STATUS_NEW:
                 if process_dublicate == 'original':
                     if status in {STATUS_MOVED, STATUS_RENAMED, STATUS_MOVED_AND_RENAMED}:
                         self.db.update(file_hash, inserted_directory, inserted_filename)
+                        moved_files[file_hash] = (inserted_directory, inserted_filename)
 
             if func:
                 func(status, existed_path, inserted_path, file_hash)
 
-        self.db.set_is_deleted_for_all()
-        os.chdir(library_path)
-        total_count_files = 0
-        for directory, _, filenames in os.walk('./'):
-            directory = directory[2:]
-            if os.path.sep == '\\':
-                directory = directory.replace('\\', '/')
-
-            for filename in filenames:
-                if filename.split('.')[-1] in LIBRARY_IGNORE_EXTENSIONS:
-                    continue  # останется отмеченным как удалённый, а потому в структуру (экспорт) не попадёт
-
-                full_path = os.path.join(directory, filename)
-                if progress_current_file:
-                    progress_current_file(full_path)
-
-                file_hash = get_file_hash(full_path)
-                self.db.append_row((file_hash, directory, filename))
-                total_count_files += 1
-                if progress_count_scanned_files:
-                    progress_count_scanned_files(total_count_files)
-
-                if self.db.is_ready_for_insert():
-                    self.db.insert_rows(with_id=False, func=process_file_status)
+        seen_paths = set()
+        unresolved_files = []
+        moved_files = {}
+
+        self.db.start_tracking_seen_files()
+        file_stats = self.db.select_file_stats()
+        if progress is None:
+            progress = Progress(report_progress)
+
+        walker = Walker([*LIBRARY_IGNORE_PATTERNS, *ignore_patterns], ignore_directories)
+        files = walker.walk(library_path)
+        if prewalk:
+            files = list(files)
+            progress.set_total(len(files), sum(stat.st_size for _, _, _, stat in files))
+
+        hash_files = self._quick_hash_files if quick_hash else self._hash_files
+        hashed_files = hash_files(files, file_stats, full_rehash, workers, progress, scan_archives, walker)
+        for directory, filename, file_hash in hashed_files:
+            seen_paths.add((directory, filename))
+            self.db.append_row((file_hash, directory, filename))
+            progress.advance(current=os.path.join(directory, filename))
+            if self.db.is_ready_for_insert():
+                self.db.insert_rows(with_id=False, func=process_file_status)
 
         self.db.insert_rows(with_id=False, func=process_file_status)
+        for inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash in unresolved_files:
+            # путь мог смениться при разрешении статуса предыдущего файла с тем же хешем
+            existed_directory, existed_filename = moved_files.get(file_hash, (existed_directory, existed_filename))
+            report_file_status(inserted_directory, inserted_filename, existed_directory, existed_filename, file_hash)
+
+        self.db.mark_unseen_files_deleted()
+        self.db.delete_file_stats(file_stats.keys())  # файлов по этим путям больше нет
         self.db.process_deleted_files(func)
+        progress.finish()
         if func_finished:
             func_finished()
 
-    def export_db(self, exporter, progress_count_exported_files=None) -> None:
+    def _hash_files(
+            self,
+            files,
+            file_stats,
+            full_rehash=False,
+            workers=1,
+            progress=None,
+            scan_archives=False,
+            walker=None,
+            vanished=None,
+    ):
+        """
+        Возвращает (directory, filename, file_hash) в порядке обхода files - (directory, filename, full_path, stat).
+        Хеши изменившихся файлов считаются в пуле из workers потоков; в очереди держится не более
+        HASHING_QUEUE_SIZE_PER_WORKER файлов на поток, чтобы обход не убегал далеко вперёд.
+        :param vanished: {(size, mtime_ns, inode): [(полный хеш, частичный хеш)]} пропавших файлов кеша;
+        если задан, то изменившиеся файлы хешируются get_quick_file_hashes (см. _quick_hash_files)
+        :param walker: Walker обхода, шаблоны которого применяются и к файлам архивов
+        """
+        walker = walker or Walker(LIBRARY_IGNORE_PATTERNS)
+        queue = deque()
+        max_queue_size = workers * self.HASHING_QUEUE_SIZE_PER_WORKER
+        archive_stats = self._group_archive_stats(file_stats) if scan_archives else {}
+        with ThreadPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+            for directory, filename, full_path, stat in files:
+                archive_entries = None
+                if scan_archives and is_archive(filename):
+                    archive_entries = self._get_archive_entries(
+                        directory, filename, full_path, stat, file_stats, archive_stats, full_rehash, walker, executor,
+                    )
+
+                if archive_entries is not None:
+                    queue.extend(archive_entries)
+                else:
+                    stat_key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                    cached_stat = file_stats.pop((directory, filename), None)
+                    if cached_stat and not full_rehash and cached_stat[:3] == stat_key:
+                        queue.append((directory, filename, stat_key, cached_stat[3], False, stat.st_size))
+                    else:
+                        if vanished is None:
+                            hash_func, args = get_file_hash, (full_path,)
+                        else:
+                            hash_func, args = get_quick_file_hashes, (full_path, stat.st_size, vanished.get(stat_key, ()))
+
+                        file_hash = executor.submit(hash_func, *args) if executor else hash_func(*args)
+                        queue.append((directory, filename, stat_key, file_hash, True, stat.st_size))
+
+                while len(queue) > max_queue_size:
+                    hashed_file = self._pop_hashed_file(queue, progress)
+                    if hashed_file:
+                        yield hashed_file
+
+            while queue:
+                hashed_file = self._pop_hashed_file(queue, progress)
+                if hashed_file:
+                    yield hashed_file
+
+    def _quick_hash_files(
+            self, files, file_stats, full_rehash=False, workers=1, progress=None, scan_archives=False, walker=None,
+    ):
+        """
+        Возвращает (directory, filename, file_hash) в порядке обхода, не перечитывая целиком перемещённые файлы.
+        Хешем файла в базе всегда остаётся полный хеш, а частичный (размер, первые и последние
+        PARTIAL_HASH_BLOCKSIZE байт) считается за то же чтение и сохраняется в file_stats.
+        Сначала хранилище обходится без чтения файлов, чтобы найти файлы кеша, пропавшие со своих мест,
+        затем файлы хешируются в порядке обхода, как в _hash_files. Файл, которого нет в кеше по его пути,
+        сверяется с пропавшими: сначала по размеру, времени изменения и inode (при перемещении в пределах диска
+        они не меняются), затем - только у совпавших - по частичному хешу. Совпадение означает перемещение
+        или переименование, и полный хеш берётся из кеша. Частичный хеш лишь отсеивает случайные совпадения
+        атрибутов (например, inode удалённого файла достался новому), остальные файлы хешируются полностью.
+        """
+        files = list(files)
+        walked_paths = {(directory, filename) for directory, filename, _, _ in files}
+        vanished = defaultdict(list)
+        if not full_rehash:
+            for (directory, filename), (*stat_key, file_hash, partial_hash) in file_stats.items():
+                # файлы из архивов хранят атрибуты архива и хешируются только полностью
+                if (
+                    partial_hash is not None
+                    and (directory, filename) not in walked_paths
+                    and get_directory_archive_path(directory) is None
+                ):
+                    vanished[tuple(stat_key)].append((file_hash, partial_hash))
+
+        yield from self._hash_files(files, file_stats, full_rehash, workers, progress, scan_archives, walker, vanished)
+
+    def _group_archive_stats(self, file_stats) -> dict:
+        """Возвращает {путь архива: [(directory, filename) закешированных файлов архива]}"""
+        archive_stats = defaultdict(list)
+        for directory, filename in file_stats:
+            archive_path = get_directory_archive_path(directory)
+            if archive_path is not None:
+                archive_stats[archive_path].append((directory, filename))
+
+        return archive_stats
+
+    def _get_archive_entries(
+            self, directory, filename, full_path, stat, file_stats, archive_stats, full_rehash, walker, executor=None,
+    ):
+        """
+        Возвращает файлы zip-архива в виде элементов очереди хеширования
+        (directory, filename, stat_key, file_hash, is_hashed, size) или None, если файл не zip-архив.
+        Атрибутами файла из архива служат размер, время изменения и inode самого архива: файлы неизменившегося
+        архива берутся из кеша, и архив даже не открывается. Изменившийся архив открывается один раз,
+        а его файлы хешируются одной задачей (в пуле executor, если он есть). Размер архива для учёта
+        прогресса делится между его файлами поровну. Файлы архива, подпадающие под шаблоны walker
+        по имени или по директориям своего пути, пропускаются, как и при обходе хранилища; файлы, которые
+        перестали подпадать под шаблоны, появятся, когда архив изменится, или при full_rehash.
+        Архив, оглавление которого не прочитать или все файлы которого зашифрованы, хешируется как обычный файл,
+        а зашифрованные файлы архива пропускаются. Хеш файла архива, который не удалось прочитать, - None:
+        такой файл пропускается при разборе очереди.
+        """
+        stat_key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        archive_path = get_archive_path(directory, filename)
+        cached_paths = [
+            path for path in archive_stats.pop(archive_path, [])
+            if not walker.is_ignored_member(get_archive_member_name(archive_path, *path))
+        ]
+        if cached_paths and not full_rehash and all(file_stats[path][:3] == stat_key for path in cached_paths):
+            size = stat.st_size // len(cached_paths)
+            return [(*path, stat_key, file_stats.pop(path)[3], False, size) for path in cached_paths]
+
+        try:
+            with zipfile.ZipFile(full_path) as archive:
+                member_infos = [
+                    info for info in archive.infolist() if not info.is_dir() and not walker.is_ignored_member(info.filename)
+                ]
+        except ARCHIVE_READ_ERRORS:
+            return None
+
+        member_names = [info.filename for info in member_infos if not info.flag_bits & ZIP_FLAG_ENCRYPTED]
+        if member_infos and not member_names:
+            return None
+        if executor:
+            hashes = executor.submit(get_archive_members_hashes, full_path, member_names)
+        else:
+            hashes = get_archive_members_hashes(full_path, member_names)
+
+        entries = []
+        size = stat.st_size // max(len(member_names), 1)
+        for index, member_name in enumerate(member_names):
+            member_path = get_archive_member_path(archive_path, member_name)
+            file_stats.pop(member_path, None)
+            file_hash = ArchiveMemberHash(hashes, index) if executor else hashes[index]
+            entries.append((*member_path, stat_key, file_hash, True, size))
+
+        return entries
+
+    def _pop_hashed_file(self, queue, progress=None):
+        directory, filename, stat_key, file_hash, is_hashed, size = queue.popleft()
+        if isinstance(file_hash, (Future, ArchiveMemberHash)):
+            file_hash = file_hash.result()
+
+        partial_hash = hashed_size = None
+        if isinstance(file_hash, tuple):
+            file_hash, partial_hash, hashed_size = file_hash  # см. get_quick_file_hashes
+
+        if progress:
+            progress.add_bytes(size, hashed_size if is_hashed else 0)
+            progress.set_queue_depth('hashing', len(queue))
+
+        if file_hash is None:
+            return None  # файл архива не прочитался
+
+        if is_hashed:
+            self.db.append_file_stat((directory, filename, *stat_key, file_hash, partial_hash))
+
+        return directory, filename, file_hash
+
+    def get_export_workers(self) -> int:
+        """
+        Возвращает число процессов для export_db, при котором параллельный экспорт быстрее последовательного:
+        процессов не больше доступных процессору ядер и не больше, чем страниц на каждого по EXPORT_MIN_PAGES_PER_WORKER.
+        На одном ядре или на небольшой базе экспорт выполняется последовательно.
+        """
+        count_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+        count_pages = ((self.db.get_max_id() or 0) - 1) // self.CSV_COUNT_ROWS_ON_PAGE + 1
+        workers = min(count_cpus, count_pages // self.EXPORT_MIN_PAGES_PER_WORKER)
+        return workers if workers > 1 else 1
+
+    def export_db(self, exporter, progress_count_exported_files=None, workers=1, progress: Progress = None) -> dict:
         """
         Экспортирует из базы следующую информацию о файле:
         хэш,идентификатор,директория,имя файла
+        Файл попадает на страницу (id - 1) // CSV_COUNT_ROWS_ON_PAGE + 1, поэтому границы страниц известны заранее.
+        При workers > 1 страницы формируются и записываются параллельно в пуле процессов.
+        Страница перезаписывается, только если её содержимое изменилось с прошлого экспорта,
+        а страницы, которых больше нет, удаляются.
+        Ход экспорта (строки и текущая страница) передаётся в progress; если он не задан,
+        progress_count_exported_files(экспортировано строк, всего строк, страница) вызывается с той же ограниченной частотой.
+        :return: {'skipped': ..., 'rewritten': ..., 'deleted': ...} - количество страниц
         """
-        csv_current_page = 1
-        exporter.open_new_page(csv_current_page)
-        number_of_last_row_on_current_page = self.CSV_COUNT_ROWS_ON_PAGE
-        count_rows = self.db.get_count_rows()
-        index_of_current_row = None
-        for index_of_current_row, row in enumerate(self.db.select_rows(order_by='files.id')):
-            number_of_last_row_on_current_page = number_of_last_row_on_current_page - row[1] + 1
-            if index_of_current_row >= number_of_last_row_on_current_page:
-                exporter.close(is_last_page=index_of_current_row == count_rows - 1)
-                number_of_last_row_on_current_page += self.CSV_COUNT_ROWS_ON_PAGE
-                csv_current_page += 1
-                exporter.open_new_page(csv_current_page)
-                if progress_count_exported_files:
-                    progress_count_exported_files(index_of_current_row + 1, count_rows, csv_current_page)
-
-            exporter.write_row(row)
-            number_of_last_row_on_current_page += row[1]
-
-        if progress_count_exported_files and index_of_current_row is not None:
-            progress_count_exported_files(index_of_current_row + 1, count_rows, csv_current_page)
-
-        exporter.close(is_last_page=index_of_current_row is None or index_of_current_row == count_rows - 1)
-        
-        import csv
-        with open(os.path.join(exporter.storage_structure, 'tags.csv'), 'w', encoding='utf-8', newline='\n') as csv_file:
-            csv_writer = csv.writer(csv_file)
-            for row in self.db.select_all_tags():
-                csv_writer.writerow(row)
-
-        with open(os.path.join(exporter.storage_structure, 'tags-files.csv'), 'w', encoding='utf-8', newline='\n') as csv_file:
-            csv_writer = csv.writer(csv_file)
-            for row in self.db.select_all_tag_files():
-                csv_writer.writerow(row)
-
-    def import_csv_to_db(self, csv_path):
-        def process_file_status(*args):
-            status, existed_path, inserted_path = self.get_file_status(*args[:4])
-            if args[2]:
+        def report_progress(progress):
+            if progress_count_exported_files:
+                progress_count_exported_files(progress.count_done, progress.count_total, progress.current)
+
+        def account_exported_file(file_name, digest, is_written):
+            new_manifest[file_name] = digest
+            report['rewritten' if is_written else 'skipped'] += 1
+
+        def pop_exported_page():
+            current_page, count_page_rows, result = queue.popleft()
+            digest, is_written = result.result() if isinstance(result, Future) else result
+            account_exported_file(page_name(current_page), digest, is_written)
+            progress.set_queue_depth('export', len(queue))
+            progress.advance(count_page_rows, current=current_page)
+
+        def page_name(current_page):
+            return os.path.basename(exporter.get_page_path(current_page))
+
+        old_manifest = load_manifest(exporter.storage_structure)
+        new_manifest = {}
+        report = {'skipped': 0, 'rewritten': 0, 'deleted': 0}
+        if progress is None:
+            progress = Progress(report_progress)
+
+        progress.set_total(self.db.get_count_rows())
+        count_pages = max(((self.db.get_max_id() or 0) - 1) // self.CSV_COUNT_ROWS_ON_PAGE + 1, 1)
+        max_queue_size = workers * self.EXPORT_QUEUE_SIZE_PER_WORKER
+        queue = deque()
+        if workers > 1:
+            # пул процессов загружается, только когда нужен: консольный запуск должен стартовать быстро
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import get_context
+
+            # spawn, а не fork: экспорт запускается из потока GUI, а fork многопоточного процесса небезопасен
+            pool = ProcessPoolExecutor(workers, get_context('spawn'))
+        else:
+            pool = nullcontext()
+
+        with pool as executor:
+            for current_page, rows in self._iter_export_pages(count_pages):
+                is_last_page = current_page == count_pages
+                old_digest = old_manifest.get(page_name(current_page))
+                if executor:
+                    result = executor.submit(exporter.write_page, current_page, rows, is_last_page, old_digest)
+                else:
+                    result = exporter.write_page(current_page, rows, is_last_page, old_digest)
+
+                queue.append((current_page, len(rows), result))
+                while len(queue) > max_queue_size:
+                    pop_exported_page()
+
+            while queue:
+                pop_exported_page()
+
+        for file_name, rows in (('tags.csv', self.db.select_all_tags()), ('tags-files.csv', self.db.select_all_tag_files())):
+            csv_content = StringIO()
+            csv.writer(csv_content).writerows(rows)
+            file_path = os.path.join(exporter.storage_structure, file_name)
+            account_exported_file(file_name, *write_file_if_changed(file_path, csv_content.getvalue(), old_manifest.get(file_name)))
+
+        for file_name in old_manifest.keys() - new_manifest.keys():
+            file_path = os.path.join(exporter.storage_structure, file_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                report['deleted'] += 1
+
+        save_manifest(exporter.storage_structure, new_manifest)
+        progress.finish()
+        return report
+
+    def _iter_export_pages(self, count_pages):
+        """Возвращает (номер страницы, строки страницы) для всех страниц подряд, в том числе пустых"""
+        rows_by_page = groupby(
+            self.db.select_rows(order_by='files.id'),
+            key=lambda row: (row[1] - 1) // self.CSV_COUNT_ROWS_ON_PAGE + 1,
+        )
+        next_page, next_rows = next(rows_by_page, (None, None))
+        for current_page in range(1, count_pages + 1):
+            if current_page == next_page:
+                yield current_page, list(next_rows)
+                next_page, next_rows = next(rows_by_page, (None, None))
+            else:
+                yield current_page, []
+
+    def import_csv_to_db(self, csv_path, progress_count_imported_rows=None):
+        """
+        Импортирует экспорт из CSV одной транзакцией. Строки сначала складываются во временные таблицы,
+        затем целостность проверяется один раз набором запросов. При ошибке база остаётся нетронутой.
+        :param progress_count_imported_rows: функция (количество импортированных строк, строк в секунду)
+        """
+        def read_csv(file_name):
+            with open(os.path.join(csv_path, file_name), 'r', encoding='utf-8', newline='\n') as csv_file:
+                yield from csv.reader(csv_file)
+
+        def format_path(directory, filename):
+            path = '{}/{}'.format(directory, filename)
+            return path[1:] if path.startswith('/') else path
+
+        # кроме страниц в директории лежат файлы тегов и манифест экспорта
+        page_numbers = sorted(int(entry.name[:-4]) for entry in os.scandir(csv_path) if self.RE_PAGE_NAME.match(entry.name))
+        started_at = perf_counter()
+        count_imported_rows = 0
+        with self.db.bulk_mode():
+            self.db.create_import_tables()
+            for page_number in page_numbers:
+                count_imported_rows += self.db.stage_import_files(read_csv('{}.csv'.format(page_number)))
+                if progress_count_imported_rows:
+                    rows_per_second = count_imported_rows / max(perf_counter() - started_at, 1e-6)
+                    progress_count_imported_rows(count_imported_rows, rows_per_second)
+
+            self.db.stage_import_tags(read_csv('tags.csv'))
+            self.db.stage_import_tag_files(read_csv('tags-files.csv'))
+
+            conflict = self.db.select_import_conflict()
+            if conflict:
+                inserted_path, existed_path = format_path(*conflict[:2]), format_path(*conflict[2:])
                 raise Exception(self.MESSAGE_DOUBLE_IMPORT.format(inserted_path, existed_path))
 
-        for csv_filename in os.scandir(csv_path):
-            with open(csv_filename.path, 'r', encoding='utf-8', newline='\n') as csv_file:
-                for csv_row in csv.reader(csv_file):
-                    self.db.append_row(tuple(csv_row))
-                    if self.db.is_ready_for_insert():
-                        self.db.insert_rows(func=process_file_status)
+            tag_conflict = self.db.select_import_tag_conflict()
+            if tag_conflict:
+                raise Exception(self.MESSAGE_TAG_CONFLICT_IMPORT.format(*tag_conflict))
 
-        self.db.insert_rows(func=process_file_status)
+            self.db.apply_import()
+            dangling_tag = self.db.select_import_dangling_tag()
+            if dangling_tag:
+                raise Exception(self.MESSAGE_DANGLING_TAG.format(*dangling_tag))
 
-        with open(os.path.join(csv_path, 'tags.csv'), 'r', encoding='utf-8', newline='\n') as csv_file:
-            for csv_row in csv.reader(csv_file):
-                self.db.import_tag(*csv_row)
+            dangling_tag_file = self.db.select_import_dangling_tag_file()
+            if dangling_tag_file:
+                raise Exception(self.MESSAGE_DANGLING_TAG_FILE.format(*dangling_tag_file))
 
-        with open(os.path.join(csv_path, 'tags-files.csv'), 'r', encoding='utf-8', newline='\n') as csv_file:
-            for csv_row in csv.reader(csv_file):
-                self.db.import_tag_file(*csv_row)
+            self.db.drop_import_tables()
 
-    def get_file_status(self, inserted_directory, inserted_filename, existed_directory, existed_filename):
+    def get_file_status(self, inserted_directory, inserted_filename, existed_directory, existed_filename, is_exists=False):
+        """
+        Возвращает (статус, путь в базе, новый путь) файла.
+        :param is_exists: лежит ли ещё файл по пути из базы; если да, то новый файл - дубликат
+        """
         inserted_path = '{}/{}'.format(inserted_directory, inserted_filename)  # .removeprefix('/')
         inserted_path = inserted_path[1:] if inserted_path.startswith('/') else inserted_path
         if existed_directory is not None:
@@ -470,7 +2191,6 @@ class LibraryStorage:
             existed_path = existed_path[1:] if existed_path.startswith('/') else existed_path
             is_replaced = inserted_directory != existed_directory
             is_renamed = inserted_filename != existed_filename
-            is_exists = os.path.exists(existed_path)
             if is_replaced and not is_renamed:
                 return STATUS_DUPLICATE if is_exists else STATUS_MOVED, existed_path, inserted_path
             elif not is_replaced and is_renamed:
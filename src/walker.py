@@ -0,0 +1,78 @@
+import os
+import re
+from fnmatch import translate
+
+IGNORE_DIRECTORIES = ('.git', '.obsidian', '@eaDir')
+
+
+def compile_patterns(patterns):
+    """Собирает glob-шаблоны имён в одно регулярное выражение; без шаблонов возвращает None"""
+    if not patterns:
+        return None
+
+    return re.compile('|'.join(translate(pattern) for pattern in patterns))
+
+
+class Walker:
+    """
+    Обходит хранилище через os.scandir, не меняя текущую директорию процесса.
+    Шаблоны ignore_patterns и ignore_directories сверяются с именем файла или директории (как в fnmatch,
+    с учётом регистра). Игнорируемые директории не обходятся вовсе, а игнорируемые файлы пропускаются.
+    """
+    def __init__(self, ignore_patterns=(), ignore_directories=IGNORE_DIRECTORIES):
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.ignore_directories = tuple(ignore_directories)
+        self.re_ignore_file = compile_patterns(self.ignore_patterns)
+        self.re_ignore_directory = compile_patterns(self.ignore_directories)
+
+    def is_ignored_file(self, filename):
+        return self.re_ignore_file is not None and self.re_ignore_file.match(filename) is not None
+
+    def is_ignored_directory(self, name):
+        return self.re_ignore_directory is not None and self.re_ignore_directory.match(name) is not None
+
+    def is_ignored_member(self, member_name):
+        """Игнорируется ли файл архива sub/file.pdf: по имени файла или по имени любой директории его пути"""
+        *directories, filename = member_name.split('/')
+        return self.is_ignored_file(filename) or any(self.is_ignored_directory(name) for name in directories)
+
+    def walk(self, library_path):
+        """
+        Возвращает (directory, filename, full_path, stat) для каждого файла хранилища в том же порядке, что и os.walk:
+        сначала файлы директории, затем её поддиректории в глубину. directory отсчитывается от корня хранилища
+        и разделяется '/', full_path ведёт от library_path. stat - результат DirEntry.stat(), повторно файл
+        не опрашивается. Ссылки на директории, как и в os.walk, не обходятся; директории, которые
+        не удалось прочитать, и файлы, исчезнувшие во время обхода, пропускаются.
+        """
+        stack = [('', os.fspath(library_path))]
+        while stack:
+            directory, directory_path = stack.pop()
+            subdirectories = []
+            try:
+                with os.scandir(directory_path) as entries:
+                    for entry in entries:
+                        name = entry.name
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+
+                        if is_dir:
+                            if not self.is_ignored_directory(name) and not entry.is_symlink():
+                                subdirectories.append((f'{directory}/{name}' if directory else name, entry.path))
+
+                            continue
+
+                        if self.is_ignored_file(name):
+                            continue  # останется отмеченным как удалённый, а потому в структуру (экспорт) не попадёт
+
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+
+                        yield directory, name, entry.path, stat
+            except OSError:
+                continue
+
+            stack.extend(reversed(subdirectories))
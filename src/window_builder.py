@@ -1,19 +1,47 @@
+import os
+import xml.etree.ElementTree as ET
+from threading import Lock
+
 import gi
 gi.require_version('Gtk', '4.0')
 from gi.repository import Gtk
 
 from jinja2 import Template
 
+# путь к файлу -> (время изменения файла, шаблон, дерево шаблона, отрисованного без контекста)
+templates = {}
+templates_lock = Lock()
+
+
+def load_template(path_to_xml):
+    """
+    Возвращает скомпилированный шаблон и его разобранное дерево для пустого контекста.
+    Файл читается заново, только если изменилось время его изменения.
+    """
+    path_to_xml = os.fspath(path_to_xml)
+    mtime = os.stat(path_to_xml).st_mtime_ns
+    with templates_lock:
+        cached = templates.get(path_to_xml)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+
+    with open(path_to_xml, encoding='utf-8') as file_xml:
+        template = Template(file_xml.read())
+
+    root = ET.fromstring(template.render({}))
+    with templates_lock:
+        templates[path_to_xml] = (mtime, template, root)
+
+    return template, root
+
 
 class WindowBuilder:
     def __init__(self, path_to_xml, context, parent_window=None):
-        import xml.etree.ElementTree as ET
         self.parent_window = parent_window
-        with open(path_to_xml, encoding='utf-8') as file_xml:
-            template = Template(file_xml.read())
-            templated_xml: str = template.render(context)
+        template, root = load_template(path_to_xml)
+        if context:
+            root = ET.fromstring(template.render(context))
 
-        root = ET.fromstring(templated_xml)
         self.parents = []
         self.root_widget = None
         self._go(root)
@@ -35,6 +63,8 @@ class WindowBuilder:
                 gtkclass = getattr(Gtk, tag)
 
             kwargs = {}
+            # дерево шаблона закешировано и используется повторно, поэтому атрибуты узла не изменяются
+            attrib = dict(node.attrib)
 
             if tag in ('Label', 'Button', 'CheckButton'):
                 kwargs['label'] = node.text
@@ -42,22 +72,22 @@ class WindowBuilder:
                 kwargs['text'] = node.text if node.text else ''
             #elif tag == 'EntityColumnView':
             #    kwargs['parent_window'] = self.parent_window
-            #    kwargs['item_type'] = globals()[node.attrib.pop('item_type')]
-            #    kwargs['linking_table'] = getattr(db, node.attrib.pop('linking_table'))
-            #    kwargs['item_main'] = node.attrib.pop('item_main')
-            #    kwargs['item_slave'] = node.attrib.pop('item_slave')
-            #    if 'same' in node.attrib:
+            #    kwargs['item_type'] = globals()[attrib.pop('item_type')]
+            #    kwargs['linking_table'] = getattr(db, attrib.pop('linking_table'))
+            #    kwargs['item_main'] = attrib.pop('item_main')
+            #    kwargs['item_slave'] = attrib.pop('item_slave')
+            #    if 'same' in attrib:
             #        kwargs['same'] = True
-            #        node.attrib.pop('same')
+            #        attrib.pop('same')
             elif tag == 'Picture':
-                kwargs['filename'] = node.attrib.pop('filename')
+                kwargs['filename'] = attrib.pop('filename')
             elif tag == 'Box':
-                kwargs['orientation'] = getattr(Gtk.Orientation, node.attrib.pop('orientation', 'VERTICAL'))
+                kwargs['orientation'] = getattr(Gtk.Orientation, attrib.pop('orientation', 'VERTICAL'))
             
-            colspan = int(node.attrib.pop('colspan', '1'))
+            colspan = int(attrib.pop('colspan', '1'))
 
             gtkelem = gtkclass(**kwargs)
-            for attr_name, attr_value in node.attrib.items():
+            for attr_name, attr_value in attrib.items():
                 if attr_name == 'id':
                     setattr(self, attr_value, gtkelem)
                 elif attr_name == 'markup' and tag == 'Label':
@@ -2,6 +2,10 @@ import os.path
 import random
 
 
+def make_hash(number):
+    return f'{number:064x}'
+
+
 class LibraryStorageFabric:
     hashes = {}
 
@@ -0,0 +1,120 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.__main__ import main
+from src.scanner import STATUS_DELETED, STATUS_MOVED, STATUS_NEW, STATUS_UNTOUCHED
+
+LIBRARY_FS = (
+    ('file01.txt', 'content01'),
+    ('directory01/file02.txt', 'content02'),
+)
+
+
+class CLITestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.library_path = os.path.join(self.tmp_dir.name, 'books')
+        for file_path, file_content in LIBRARY_FS:
+            file_path = os.path.join(self.library_path, file_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w') as afile:
+                afile.write(file_content)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_cli(self, *argv, with_library=True):
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            exit_code = main([*argv, '--library', self.library_path] if with_library else list(argv))
+
+        events = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        return exit_code, events
+
+    def test_scan_events_and_summary(self):
+        exit_code, events = self.run_cli('scan')
+        self.assertEqual(0, exit_code)
+        self.assertEqual(
+            [(STATUS_NEW, 'file01.txt'), (STATUS_NEW, 'directory01/file02.txt')],
+            [(event['status'], event['inserted_path']) for event in events if event['event'] == 'file'],
+        )
+        summary = events[-1]
+        self.assertEqual('summary', summary['event'])
+        self.assertEqual({STATUS_NEW: 2}, summary['count_by_status'])
+        self.assertEqual(2, summary['progress']['count_done'])
+
+        os.rename(os.path.join(self.library_path, 'file01.txt'), os.path.join(self.library_path, 'directory01/file01.txt'))
+        os.remove(os.path.join(self.library_path, 'directory01/file02.txt'))
+        _, events = self.run_cli('scan', '--only-changed')
+        self.assertEqual(
+            [(STATUS_MOVED, 'file01.txt', 'directory01/file01.txt'), (STATUS_DELETED, 'directory01/file02.txt', None)],
+            [(event['status'], event['existed_path'], event['inserted_path']) for event in events if event['event'] == 'file'],
+        )
+
+    def test_export_import_and_stats(self):
+        self.run_cli('scan')
+        csv_path = os.path.join(self.tmp_dir.name, 'csv')
+        exit_code, events = self.run_cli('export', '--format', 'csv', '--output', csv_path)
+        self.assertEqual(0, exit_code)
+        self.assertEqual(2, events[-1]['progress']['count_done'])
+
+        db_path = os.path.join(self.tmp_dir.name, 'imported.db')
+        exit_code, events = self.run_cli('import', '--input', csv_path, '--db', db_path)
+        self.assertEqual((0, 2), (exit_code, events[-1]['count_files']))
+
+        _, events = self.run_cli('stats', '--db', db_path)
+        self.assertEqual((2, 0, 0), (events[-1]['count_files'], events[-1]['count_deleted'], events[-1]['count_tags']))
+
+    def test_scan_settings_default_to_config(self):
+        with zipfile.ZipFile(os.path.join(self.library_path, 'bundle.zip'), 'w') as archive:
+            archive.writestr('book.pdf', 'content03')
+
+        with open(os.path.join(self.library_path, 'file04.tmp'), 'w') as afile:
+            afile.write('content04')
+
+        config = SimpleNamespace(
+            storage_books=Path(self.library_path),
+            db_pragmas={},
+            scan_archives=True,
+            ignore_patterns=['*.tmp'],
+            ignore_directories=['directory01'],
+        )
+        with patch('src.__main__.get_config', return_value=config):
+            _, events = self.run_cli('scan', with_library=False)
+            self.assertEqual(
+                ['bundle.zip!/book.pdf', 'file01.txt'],
+                sorted(event['inserted_path'] for event in events if event['event'] == 'file'),
+            )
+            _, events = self.run_cli('scan', '--no-scan-archives', '--ignore-directory', '.git', with_library=False)
+            self.assertEqual(
+                {
+                    (STATUS_DELETED, 'bundle.zip!/book.pdf'),
+                    (STATUS_NEW, 'bundle.zip'),
+                    (STATUS_NEW, 'directory01/file02.txt'),
+                },
+                set(
+                    (event['status'], event['inserted_path'] or event['existed_path'])
+                    for event in events if event['event'] == 'file' and event['status'] != STATUS_UNTOUCHED
+                ),
+            )
+
+    def test_error_is_reported(self):
+        exit_code, events = self.run_cli('import', '--input', os.path.join(self.tmp_dir.name, 'missing'))
+        self.assertEqual(1, exit_code)
+        self.assertEqual(['error', 'summary'], [event['event'] for event in events])
+        self.assertFalse(events[-1]['is_ok'])
+
+    def test_gui_modules_are_not_loaded(self):
+        code = 'import sys, src.__main__; print(any(name.split(".")[0] in ("gi", "jinja2") for name in sys.modules))'
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual('False', result.stdout.strip())
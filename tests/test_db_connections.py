@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+from threading import Thread
+from unittest import TestCase
+
+from src.scanner import DBStorage
+from tests.library_storage_fabric import make_hash
+
+
+def run_in_thread(func, *args):
+    result = []
+    thread = Thread(target=lambda: result.append(func(*args)))
+    thread.start()
+    thread.join()
+    return result[0] if result else None
+
+
+class ConnectionsTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DBStorage(os.path.join(self.tmp_dir.name, 'sqlite3.db'), pragmas={'cache_size': -1000})
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_pragmas(self):
+        self.assertEqual('wal', self.db.cu.execute('PRAGMA journal_mode').fetchone()[0])
+        self.assertEqual(-1000, self.db.cu.execute('PRAGMA cache_size').fetchone()[0])
+        self.assertEqual(2, self.db.cu.execute('PRAGMA temp_store').fetchone()[0])
+
+    def test_each_thread_reads_through_own_connection(self):
+        connection = self.db.c
+        self.assertIs(connection, self.db.c)
+        self.assertIsNot(connection, run_in_thread(lambda: self.db.c))
+
+    def test_connections_of_finished_threads_are_closed(self):
+        finished_connection = run_in_thread(lambda: self.db.c)
+        run_in_thread(lambda: self.db.c)
+        self.assertNotIn(finished_connection, self.db.read_connections.values())
+        with self.assertRaises(sqlite3.ProgrammingError):
+            finished_connection.execute('SELECT 1')
+
+    def test_reading_while_writing(self):
+        self.db.append_row((make_hash(1), 1, 'Книги', 'книга 1.pdf'))
+        self.db.insert_rows()
+        self.db.append_row((make_hash(2), 2, 'Книги', 'книга 2.pdf'))
+        counts = []
+
+        def func(*args):
+            # соединение записи занято незафиксированной порцией, а другой поток читает без ожидания
+            counts.append(run_in_thread(self.db.get_count_rows))
+
+        self.db.insert_rows(func=func)
+        self.assertEqual([1], counts)
+        self.assertEqual(2, self.db.get_count_rows())
+
+    def test_concurrent_writes(self):
+        threads = [Thread(target=self.db.insert_tag, args=(f'тег {number}',)) for number in range(50)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(50, len(list(self.db.select_all_tags())))
+
+    def test_failed_job_does_not_affect_group(self):
+        tag_id = self.db.insert_tag('тег')
+        errors = []
+
+        def import_tag(*args):
+            try:
+                self.db.import_tag(*args)
+            except sqlite3.IntegrityError as error:
+                errors.append(error)
+
+        with self.db.writer.lease():
+            # пока соединение записи занято, задания копятся в очереди и выполняются одной пачкой
+            threads = [
+                Thread(target=import_tag, args=(100, 'новый', None)),
+                Thread(target=import_tag, args=(tag_id, 'дубль', None)),
+                Thread(target=import_tag, args=(101, 'ещё новый', None)),
+            ]
+            for thread in threads:
+                thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(
+            [(tag_id, 'тег', None), (100, 'новый', None), (101, 'ещё новый', None)],
+            sorted(self.db.select_all_tags()),
+        )
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from src.scanner import DBStorage
+from tests.library_storage_fabric import make_hash
+
+
+# схема баз, созданных до появления миграций
+OLD_SCHEMA = '''
+    CREATE TABLE files (
+        hash VARCHAR(64) UNIQUE,
+        id INTEGER PRIMARY KEY,
+        directory VARCHAR(255),
+        filename VARCHAR(255),
+        is_deleted INT NOT NULL DEFAULT 0
+    );
+    CREATE TABLE tags (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(255),
+        parent_id INTEGER DEFAULT NULL
+    );
+    CREATE TABLE file_tag (
+        file_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL
+    );'''
+OLD_FILE_STATS_SCHEMA = '''
+    CREATE TABLE file_stats (
+        directory VARCHAR(255) NOT NULL,
+        filename VARCHAR(255) NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        inode INTEGER NOT NULL,
+        hash VARCHAR(64) NOT NULL,
+        partial_hash VARCHAR(64),
+        PRIMARY KEY (directory, filename)
+    );'''
+
+
+class MigrationsTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sqlite3.db')
+        self.db = None
+
+    def tearDown(self):
+        if self.db:
+            self.db.close()
+
+        self.tmp_dir.cleanup()
+
+    def open_old_db(self, with_file_stats=False):
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript(OLD_SCHEMA)
+        connection.executemany(
+            'INSERT INTO files (hash, id, directory, filename) VALUES (?, ?, ?, ?)',
+            [(make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf') for file_id in range(1, 11)],
+        )
+        connection.execute("INSERT INTO tags (id, name) VALUES (1, 'Фантастика')")
+        connection.executemany('INSERT INTO file_tag VALUES (?, ?)', [(3, 1), (3, 1), (4, 1)])
+        if with_file_stats:
+            connection.executescript(OLD_FILE_STATS_SCHEMA)
+            connection.execute(
+                'INSERT INTO file_stats VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ('Книги', 'книга 1.pdf', 100, 200, 300, make_hash(1), None),
+            )
+
+        connection.commit()
+        connection.close()
+        self.db = DBStorage(self.db_path)
+
+    def test_new_db_has_last_version(self):
+        self.db = DBStorage(self.db_path)
+        self.assertEqual(len(DBStorage.MIGRATIONS), self.db.cu.execute('PRAGMA user_version').fetchone()[0])
+
+    def test_old_db_is_upgraded(self):
+        self.open_old_db()
+        self.assertEqual(len(DBStorage.MIGRATIONS), self.db.cu.execute('PRAGMA user_version').fetchone()[0])
+        self.assertEqual([('blob',)], self.db.cu.execute('SELECT DISTINCT typeof(hash) FROM files').fetchall())
+        self.assertEqual(
+            [(make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf') for file_id in range(1, 11)],
+            list(self.db.select_rows(order_by='files.id')),
+        )
+        self.assertEqual([(3, 1), (4, 1)], list(self.db.select_all_tag_files()))
+        indexes = {row[0] for row in self.db.cu.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        self.assertLessEqual({'file_tag_tag_id', 'tags_parent_id', 'files_filename', 'files_deleted'}, indexes)
+
+    def test_old_file_stats_are_upgraded(self):
+        self.open_old_db(with_file_stats=True)
+        self.assertEqual({('Книги', 'книга 1.pdf'): (100, 200, 300, make_hash(1), None)}, self.db.select_file_stats())
+
+    def test_upgraded_db_is_searched_and_updated(self):
+        self.open_old_db()
+        self.assertEqual(1, self.db.select_count(search='книга 7'))
+        self.db.update(make_hash(7), 'Книги', 'роман.pdf')
+        self.assertEqual(1, self.db.select_count(search='роман'))
+        self.db.delete_file(make_hash(8))
+        self.assertEqual(9, self.db.get_count_rows())
+
+    def test_migrations_run_once(self):
+        self.open_old_db()
+        self.db.close()
+        self.db = DBStorage(self.db_path)
+        self.assertEqual(10, self.db.get_count_rows())
+
+    def test_fts_insert_trigger_is_dropped(self):
+        self.db = DBStorage(self.db_path)
+        self.db.close()
+        connection = sqlite3.connect(self.db_path)
+        connection.execute(
+            'CREATE TRIGGER files_fts_insert AFTER INSERT ON files BEGIN '
+            'INSERT INTO files_fts (rowid, directory, filename) VALUES (new.id, new.directory, new.filename); END'
+        )
+        connection.commit()
+        connection.close()
+        self.db = DBStorage(self.db_path)
+        sql = "SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name='files' ORDER BY name"
+        self.assertEqual([('files_fts_delete',), ('files_fts_update',)], self.db.c.execute(sql).fetchall())
+        self.db.append_row((make_hash(1), 'Книги', 'книга 1.pdf'))
+        self.db.insert_rows(with_id=False)
+        self.assertEqual(1, self.db.select_count(search='книга'))
@@ -0,0 +1,141 @@
+from unittest import TestCase
+
+from src.scanner import DBStorage
+from tests.library_storage_fabric import make_hash
+
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
+
+class InsertRowsTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:', count_rows_for_insert=4)
+        self.results = []
+
+    def tearDown(self):
+        self.db.close()
+
+    def func(self, *args):
+        self.results.append(args)
+
+    def insert(self, rows):
+        for row in rows:
+            self.db.append_row(row)
+            if self.db.is_ready_for_insert():
+                self.db.insert_rows(with_id=False, func=self.func)
+
+        self.db.insert_rows(with_id=False, func=self.func)
+
+    def test_existed_and_new_files_in_one_batch(self):
+        self.insert([(make_hash(1), 'dir', 'file01'), (make_hash(2), 'dir', 'file02')])
+        self.db.set_is_deleted_for_all()
+        self.results.clear()
+        self.insert([
+            (make_hash(3), 'dir', 'file03'),
+            (make_hash(1), 'moved', 'file01'),
+            (make_hash(3), 'dir', 'copy03'),
+        ])
+        self.assertEqual(
+            [
+                ('dir', 'file03', None, None, make_hash(3)),
+                ('moved', 'file01', 'dir', 'file01', make_hash(1)),
+                ('dir', 'copy03', 'dir', 'file03', make_hash(3)),
+            ],
+            self.results,
+        )
+        self.assertEqual(
+            [(make_hash(1), 1, 'dir', 'file01', 0), (make_hash(2), 2, 'dir', 'file02', 1), (make_hash(3), 3, 'dir', 'file03', 0)],
+            self.db.cu.execute(SQL_SELECT_FILES).fetchall(),
+        )
+
+    def test_result_does_not_depend_on_batch_size(self):
+        rows = [(make_hash(number % 7), 'dir', f'file{number:02}') for number in range(20)]
+        self.insert(rows)
+        data = self.db.cu.execute(SQL_SELECT_FILES).fetchall()
+        results = list(self.results)
+
+        self.db.close()
+        self.db = DBStorage(':memory:', count_rows_for_insert=1000)
+        self.results.clear()
+        self.insert(rows)
+        self.assertEqual(data, self.db.cu.execute(SQL_SELECT_FILES).fetchall())
+        self.assertEqual(results, self.results)
+
+
+class SelectRowsTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        for number in range(1, 26):
+            self.db.append_row((make_hash(number), f'dir{number % 3}', f'file{number % 4}'))
+
+        self.db.insert_rows(with_id=False)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_keyset_pages_equal_to_one_query(self):
+        for order_by in ('files.filename', 'files.directory', 'files.id'):
+            expected = self.db.cu.execute(
+                f'SELECT lower(hex(hash)), id, directory, filename FROM files ORDER BY {order_by}, id',
+            ).fetchall()
+            self.assertEqual(expected, list(self.db.select_rows(order_by=order_by, fetch_size=4)))
+
+    def test_filtered_rows(self):
+        self.db.cu.execute('UPDATE files SET is_deleted=1 WHERE id > 20')
+        rows = list(self.db.select_rows(only_deleted=True, search='file1', fetch_size=2))
+        self.assertEqual([21, 25], [row[1] for row in rows])
+        self.assertEqual(2, self.db.select_count(only_deleted=True, search='file1'))
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        for number, (directory, filename) in enumerate((
+            ('Программирование/Python', 'Лутц_Изучаем_Python.pdf'),
+            ('Программирование', 'python_cookbook.djvu'),
+            ('Художественная', 'Война и мир.fb2'),
+            ('Художественная', 'Мир приключений.pdf'),
+        ), 1):
+            self.db.append_row((make_hash(number), directory, filename))
+
+        self.db.insert_rows(with_id=False)
+
+    def tearDown(self):
+        self.db.close()
+
+    def search(self, search, **kwargs):
+        return [row[3] for row in self.db.select_rows(search=search, order_by='files.id', **kwargs)]
+
+    def test_case_insensitive_for_cyrillic_and_latin(self):
+        self.assertEqual(['Война и мир.fb2', 'Мир приключений.pdf'], self.search('МИР'))
+        self.assertEqual(['Лутц_Изучаем_Python.pdf', 'python_cookbook.djvu'], self.search('PYTHON'))
+
+    def test_prefix_of_every_word(self):
+        self.assertEqual(['Лутц_Изучаем_Python.pdf'], self.search('изуч pyth'))
+        self.assertEqual(['python_cookbook.djvu'], self.search('програм cook'))
+        self.assertEqual(2, self.db.select_count(search='художеств'))
+
+    def test_index_follows_updates(self):
+        self.db.update(make_hash(3), 'Классика', 'Анна Каренина.fb2')
+        self.assertEqual(['Мир приключений.pdf'], self.search('мир'))
+        self.assertEqual(['Анна Каренина.fb2'], self.search('классика'))
+        self.db.delete_file(make_hash(4))
+        self.assertEqual([], self.search('мир'))
+
+    def test_rank(self):
+        self.db.assign_tag(1, 1)
+        self.db.assign_tag(1, 2)
+        self.assertEqual(
+            ['Лутц_Изучаем_Python.pdf', 'python_cookbook.djvu'],
+            [row[3] for row in self.db.select_rows(tags=['1'], search='python', order_by='rank')],
+        )
+        self.assertEqual(['python_cookbook.djvu'], self.search('cookbook', fetch_size=1))
+
+    def test_index_of_batch_inserts(self):
+        self.db.append_row((make_hash(5), 7, 'Фантастика', 'Солярис.fb2'))
+        self.db.insert_rows(with_id=True)
+        self.db.append_row((make_hash(6), 'Фантастика', 'Пикник на обочине.fb2'))
+        self.db.append_row((make_hash(1), 'Программирование/Python', 'Лутц_Изучаем_Python.pdf'))
+        self.db.insert_rows(with_id=False)
+        self.assertEqual(['Солярис.fb2', 'Пикник на обочине.fb2'], self.search('фантаст'))
+        self.assertEqual(['Лутц_Изучаем_Python.pdf'], self.search('лутц'))
+        self.db.c.execute("INSERT INTO files_fts (files_fts) VALUES ('integrity-check')")
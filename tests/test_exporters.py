@@ -0,0 +1,103 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.exporters import MANIFEST_FILE_NAME, CSVExporter, MarkdownExporter
+from src.scanner import DBStorage, LibraryStorage
+from tests.library_storage_fabric import make_hash
+
+
+class ExportPagesTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ls = LibraryStorage()
+        self.ls.set_db(DBStorage(':memory:'))
+        for file_id in (*range(1, 151), *range(301, 321)):
+            self.ls.db.append_row((make_hash(file_id), file_id, 'Книги [1]', f'книга ({file_id}).pdf'))
+
+        self.ls.db.insert_rows()
+
+    def tearDown(self):
+        self.ls.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def export(self, exporter_class, name, workers=1):
+        storage_structure = os.path.join(self.tmp_dir.name, name)
+        self.ls.export_db(exporter_class(storage_structure, self.tmp_dir.name), workers=workers)
+        pages = {}
+        for filename in sorted(os.listdir(storage_structure)):
+            if filename == MANIFEST_FILE_NAME:
+                continue
+
+            with open(os.path.join(storage_structure, filename), encoding='utf-8') as page_file:
+                pages[filename] = page_file.read()
+
+        return pages
+
+    def test_pages_by_id_ranges(self):
+        pages = self.export(CSVExporter, 'csv')
+        self.assertEqual(['1.csv', '2.csv', '3.csv', '4.csv', 'tags-files.csv', 'tags.csv'], list(pages))
+        self.assertEqual(100, pages['1.csv'].count('\n'))
+        self.assertEqual(50, pages['2.csv'].count('\n'))
+        self.assertEqual('', pages['3.csv'])
+        self.assertTrue(pages['4.csv'].startswith(f'{make_hash(301)},301,'))
+
+    def test_markdown_page(self):
+        pages = self.export(MarkdownExporter, 'md')
+        self.assertIn(
+            f'1 | [{make_hash(1)}](книга_1) | [книга 1.pdf](file://../%D0%9A%D0%BD%D0%B8%D0%B3%D0%B8%20%5B1%5D/'
+            '%D0%BA%D0%BD%D0%B8%D0%B3%D0%B0%20%281%29.pdf)\n',
+            pages['список_книг_1.md'],
+        )
+        self.assertTrue(pages['список_книг_4.md'].endswith('[<< Предыдщая страница](список_книг_3) | 4 | \n--- | --- | ---\n'))
+
+    def test_result_does_not_depend_on_workers(self):
+        self.assertEqual(self.export(MarkdownExporter, 'md1'), self.export(MarkdownExporter, 'md2', workers=2))
+
+    def test_export_workers_pay_off(self):
+        self.assertEqual(1, self.ls.get_export_workers())
+        with patch.object(LibraryStorage, 'EXPORT_MIN_PAGES_PER_WORKER', 2):
+            with patch('os.sched_getaffinity', return_value=set(range(8)), create=True):
+                self.assertEqual(2, self.ls.get_export_workers())
+
+            with patch('os.sched_getaffinity', return_value={0}, create=True):
+                self.assertEqual(1, self.ls.get_export_workers())
+
+
+class IncrementalExportTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ls = LibraryStorage()
+        self.ls.set_db(DBStorage(':memory:'))
+        for file_id in range(1, 251):
+            self.ls.db.append_row((make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf'))
+
+        self.ls.db.insert_rows()
+        self.exporter = CSVExporter(self.tmp_dir.name, None)
+        self.first_report = self.ls.export_db(self.exporter)
+
+    def tearDown(self):
+        self.ls.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def test_first_export_writes_everything(self):
+        self.assertEqual({'skipped': 0, 'rewritten': 5, 'deleted': 0}, self.first_report)
+
+    def test_unchanged_export_skips_all_files(self):
+        mtimes = {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(self.tmp_dir.name)}
+        self.assertEqual({'skipped': 5, 'rewritten': 0, 'deleted': 0}, self.ls.export_db(self.exporter))
+        del mtimes[MANIFEST_FILE_NAME]
+        for name, mtime_ns in mtimes.items():
+            self.assertEqual(mtime_ns, os.stat(os.path.join(self.tmp_dir.name, name)).st_mtime_ns)
+
+    def test_changed_row_rewrites_only_its_page(self):
+        self.ls.db.c.execute('UPDATE files SET filename=? WHERE id=?', ('переименована.pdf', 150))
+        self.assertEqual({'skipped': 4, 'rewritten': 1, 'deleted': 0}, self.ls.export_db(self.exporter))
+        with open(os.path.join(self.tmp_dir.name, '2.csv'), encoding='utf-8') as page_file:
+            self.assertIn('переименована.pdf', page_file.read())
+
+    def test_vanished_pages_are_deleted(self):
+        self.ls.db.c.execute('DELETE FROM files WHERE id > 100')
+        self.assertEqual({'skipped': 3, 'rewritten': 0, 'deleted': 2}, self.ls.export_db(self.exporter))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, '3.csv')))
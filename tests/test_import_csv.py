@@ -0,0 +1,94 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.exporters import CSVExporter
+from src.scanner import DBStorage, LibraryStorage
+from tests.library_storage_fabric import make_hash
+
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
+
+class BulkImportTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+        for file_id in range(1, 251):
+            self.origin_ls.db.append_row((make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf'))
+
+        self.origin_ls.db.insert_rows()
+        parent_tag_id = self.origin_ls.db.insert_tag('Жанр')
+        tag_id = self.origin_ls.db.insert_tag('Фантастика', parent_tag_id)
+        self.origin_ls.db.assign_tag(tag_id, 7)
+        self.origin_ls.export_db(CSVExporter(self.tmp_dir.name, None))
+
+        self.copy_ls = LibraryStorage()
+        self.copy_ls.set_db(DBStorage(':memory:'))
+        self.progress = []
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+        self.copy_ls.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def select_all(self, ls):
+        return (
+            ls.db.cu.execute(SQL_SELECT_FILES + ' order by id').fetchall(),
+            ls.db.cu.execute('select * from tags order by id').fetchall(),
+            ls.db.cu.execute('select * from file_tag').fetchall(),
+        )
+
+    def import_csv(self):
+        self.copy_ls.import_csv_to_db(self.tmp_dir.name, lambda *args: self.progress.append(args))
+
+    def test_import_restores_export(self):
+        self.import_csv()
+        self.assertEqual(self.select_all(self.origin_ls), self.select_all(self.copy_ls))
+        self.assertEqual([100, 200, 250], [count_rows for count_rows, _ in self.progress])
+        self.assertTrue(all(rows_per_second > 0 for _, rows_per_second in self.progress))
+
+    def test_fts_is_rebuilt_and_maintained(self):
+        self.import_csv()
+        self.assertEqual(1, self.copy_ls.db.select_count(search='книга 42.pdf'))
+        self.copy_ls.db.update(make_hash(42), 'Книги', 'роман.pdf')
+        self.assertEqual(1, self.copy_ls.db.select_count(search='роман'))
+
+    def test_same_rows_are_skipped(self):
+        self.copy_ls.db.append_row((make_hash(1), 1, 'Книги', 'книга 1.pdf'))
+        self.copy_ls.db.insert_rows()
+        self.import_csv()
+        self.assertEqual(self.select_all(self.origin_ls), self.select_all(self.copy_ls))
+
+    def test_same_export_imported_twice(self):
+        self.import_csv()
+        self.import_csv()
+        self.assertEqual(self.select_all(self.origin_ls), self.select_all(self.copy_ls))
+
+    def test_tag_with_differing_name_rolls_back(self):
+        self.copy_ls.db.import_tag(1, 'Жанры', None)
+        data_before = self.select_all(self.copy_ls)
+        with self.assertRaisesRegex(Exception, 'Жанры'):
+            self.import_csv()
+
+        self.assertEqual(data_before, self.select_all(self.copy_ls))
+
+    def test_duplicate_with_differing_name_rolls_back(self):
+        self.copy_ls.db.append_row((make_hash(5), 1000, 'Другие', 'другая.pdf'))
+        self.copy_ls.db.insert_rows()
+        data_before = self.select_all(self.copy_ls)
+        with self.assertRaisesRegex(Exception, 'Другие/другая.pdf'):
+            self.import_csv()
+
+        self.assertEqual(data_before, self.select_all(self.copy_ls))
+        self.copy_ls.db.update(make_hash(5), 'Другие', 'роман.pdf')
+        self.assertEqual(1, self.copy_ls.db.select_count(search='роман'))
+
+    def test_dangling_tag_file(self):
+        with open(os.path.join(self.tmp_dir.name, 'tags-files.csv'), 'a', encoding='utf-8') as csv_file:
+            csv_file.write('9999,1\n')
+
+        with self.assertRaisesRegex(Exception, '9999'):
+            self.import_csv()
+
+        self.assertEqual(([], [], []), self.select_all(self.copy_ls))
@@ -0,0 +1,102 @@
+from unittest import TestCase
+
+from src.scanner import DBStorage, LazyRows, TagFilter
+from tests.library_storage_fabric import make_hash
+
+
+class CountingDBStorage(DBStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.windows_args = []
+
+    def select_rows_window(self, *args, **kwargs):
+        self.windows_args.append((kwargs['last_key'], kwargs['offset']))
+        return super().select_rows_window(*args, **kwargs)
+
+
+class LazyRowsTestCase(TestCase):
+    def setUp(self):
+        self.db = CountingDBStorage(':memory:')
+        for file_id in range(1, 51):
+            self.db.append_row((make_hash(file_id), file_id, f'Книги/{file_id % 3}', f'книга {file_id:02}.pdf'))
+
+        self.db.insert_rows()
+        self.tag_id = self.db.insert_tag('Прочитано')
+        for file_id in range(2, 51, 2):
+            self.db.assign_tag(self.tag_id, file_id)
+
+        self.expected_rows = list(self.db.select_rows())
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_rows_match_select_rows(self):
+        rows = LazyRows(self.db, window_size=7)
+        self.assertEqual(50, len(rows))
+        self.assertEqual(self.expected_rows, [rows[position] for position in range(len(rows))])
+        with self.assertRaises(IndexError):
+            rows[50]
+
+    def test_windows_are_read_on_demand(self):
+        rows = LazyRows(self.db, window_size=10)
+        len(rows)
+        self.assertEqual([], self.db.windows_args)
+        rows[0]
+        rows[9]
+        self.assertEqual([(None, 0)], self.db.windows_args)
+
+    def test_sequential_windows_continue_by_key(self):
+        rows = LazyRows(self.db, window_size=10)
+        rows[0]
+        rows[10]
+        last_row = self.expected_rows[9]
+        self.assertEqual([(None, 0), ((last_row[3], last_row[1]), 0)], self.db.windows_args)
+
+    def test_short_window_recounts_rows(self):
+        rows = LazyRows(self.db, window_size=10)
+        self.assertEqual(50, len(rows))
+        for file_id in range(41, 51):
+            self.db.delete_file(make_hash(file_id))
+
+        self.assertIsNone(rows[45])
+        self.assertEqual(40, len(rows))
+        self.assertEqual(list(self.db.select_rows()), [rows[position] for position in range(len(rows))])
+
+    def test_jump_uses_offset_from_nearest_key(self):
+        rows = LazyRows(self.db, window_size=10)
+        rows[0]
+        self.assertEqual(self.expected_rows[45], rows[45])
+        last_row = self.expected_rows[9]
+        self.assertEqual(((last_row[3], last_row[1]), 30), self.db.windows_args[-1])
+
+    def test_lru(self):
+        rows = LazyRows(self.db, window_size=10, max_windows=2)
+        rows[0]
+        rows[10]
+        rows[0]
+        rows[20]
+        self.assertEqual([0, 2], list(rows.windows))
+        count_queries = len(self.db.windows_args)
+        rows[10]
+        self.assertEqual(count_queries + 1, len(self.db.windows_args))
+
+    def test_filter_and_make_item(self):
+        tags = TagFilter(all_of=[self.tag_id])
+        rows = LazyRows(self.db, tags=tags, order_by='files.directory', make_item=lambda row: row[1], window_size=4)
+        expected_ids = [row[1] for row in self.db.select_rows(tags, order_by='files.directory')]
+        self.assertEqual(25, len(rows))
+        self.assertEqual(expected_ids, [rows[position] for position in range(len(rows))])
+
+    def test_rank_is_read_by_offset(self):
+        rows = LazyRows(self.db, order_by='rank', search='книга', window_size=10)
+        expected_rows = list(self.db.select_rows(order_by='rank', search='книга'))
+        self.assertEqual(expected_rows, [rows[position] for position in range(len(rows))])
+        self.assertEqual({None}, {last_key for last_key, _ in self.db.windows_args})
+
+    def test_on_fetch_gets_each_read_window(self):
+        fetched = []
+        rows = LazyRows(self.db, window_size=10, on_fetch=lambda window: fetched.append([row[1] for row in window]))
+        rows[0]
+        rows[5]
+        rows[25]
+        self.assertEqual([[row[1] for row in self.expected_rows[0:10]], [row[1] for row in self.expected_rows[20:30]]], fetched)
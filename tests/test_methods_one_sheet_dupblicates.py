@@ -6,6 +6,8 @@ from src.exporters import CSVExporter
 from src.scanner import DBStorage, LibraryStorage, STATUS_DUPLICATE
 from tests.library_storage_fabric import LibraryStorageFabric
 
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
 ORIGIN_DIFF_CSV = (
     'Новый,,file01.txt,4256508e9e2099aa72050b5e00d01745153971e915fa190e4a86079a13ab8e73,1\n'
     'Новый,,file02.txt,982dfb44d32c54183e5399ae180a701d70c1434736645eea98c23e6a81b99d1b,2\n'
@@ -66,7 +68,7 @@ class CoreTestCase(TestCase):
         self.create_files(origin_fs, library_path)
 
         self.origin_ls.scan_to_db(library_path=library_path, process_dublicate='original', func=self.func)
-        data_origin = self.origin_ls.db.cu.execute('select * from files').fetchall()
+        data_origin = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(origin_storage.db, data_origin)
         self.assertIn((STATUS_DUPLICATE, 'directory01/file04.txt', 'directory01111/duplicate.txt'), self.results)
 
@@ -124,7 +126,7 @@ class CoreTestCase(TestCase):
         self.create_files(copy_fs)
 
         self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original')
-        data_origin = self.origin_ls.db.cu.execute('select * from files').fetchall()
+        data_origin = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(origin_db, data_origin)
 
         self.origin_ls.export_db(CSVExporter('/struct', None))
@@ -132,10 +134,10 @@ class CoreTestCase(TestCase):
             self.assertEqual(origin_struct_1, struct.read())
 
         self.copy_ls.import_csv_to_db(csv_path='/struct')
-        data_copy = self.copy_ls.db.cu.execute('select * from files').fetchall()
+        data_copy = self.copy_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(origin_db, data_copy)
 
         self.copy_ls.scan_to_db(library_path='/copy', process_dublicate='copy', func=self.func)
-        data_copy = self.copy_ls.db.cu.execute('select * from files').fetchall()
+        data_copy = self.copy_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(copy_db, data_copy)
         self.assertIn((STATUS_DUPLICATE, 'file05.txt', 'directory01/duplicate.txt'), self.results)
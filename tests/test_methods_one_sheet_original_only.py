@@ -6,6 +6,8 @@ from pyfakefs.fake_filesystem_unittest import TestCase
 from src.exporters import CSVExporter
 from src.scanner import DBStorage, LibraryStorage
 
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
 ORIGIN_FS = (
     ('/origin/file01.txt', 'content01'),
     ('/origin/file02.txt', 'content02'),
@@ -58,7 +60,7 @@ class CoreTestCase(TestCase):
     def check_second_scanning(self, origin_db_after_second_scanning, origin_struct_after_second_scanning):
         """Общий для тестов метод. Выполяет для оригинальной базы: сканирование хранилища, экспорт"""
         self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original')
-        data_origin = self.origin_ls.db.cu.execute('select * from files').fetchall()
+        data_origin = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(origin_db_after_second_scanning, data_origin)
 
         self.origin_ls.export_db(CSVExporter('/struct', None))
@@ -66,7 +68,7 @@ class CoreTestCase(TestCase):
             self.assertEqual(origin_struct_after_second_scanning, struct.read())
 
     def test_first_scanning(self):
-        data_origin = self.origin_ls.db.cu.execute('select * from files').fetchall()
+        data_origin = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
         self.assertEqual(ORIGIN_DB, data_origin)
 
         self.origin_ls.export_db(CSVExporter('/struct', None))
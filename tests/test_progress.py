@@ -0,0 +1,97 @@
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage, Progress
+
+ORIGIN_FS = (
+    ('/origin/file01.txt', 'content01'),
+    ('/origin/file02.txt', 'content0002'),
+    ('/origin/directory01/file03.txt', 'content000003'),
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProgressTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.notified = []
+        self.progress = Progress(lambda progress: self.notified.append(progress.count_done), clock=self.clock)
+
+    def test_rate_limit_by_time(self):
+        for _ in range(10):
+            self.progress.advance()
+            self.clock.now += 0.1
+
+        self.assertEqual([1, 4, 7, 10], self.notified)
+        self.progress.finish()
+        self.assertEqual([1, 4, 7, 10, 10], self.notified)
+
+    def test_rate_limit_by_count(self):
+        progress = Progress(lambda progress: self.notified.append(progress.count_done), interval=0, step=3)
+        for _ in range(7):
+            progress.advance()
+
+        self.assertEqual([3, 6], self.notified)
+
+    def test_speed_and_eta(self):
+        self.progress.set_total(count_total=4, bytes_total=4 * 2 ** 20)
+        self.assertIsNone(self.progress.eta)
+        self.clock.now = 2
+        self.progress.add_bytes(2 ** 20)
+        self.progress.add_bytes(2 ** 20, hashed_size=0)
+        self.progress.advance(2)
+        self.assertEqual(1, self.progress.files_per_second)
+        self.assertEqual(0.5, self.progress.mb_per_second)
+        self.assertEqual(2, self.progress.eta)
+        self.assertEqual('2/4 файлов, 1 файлов/с, 0.5 МБ/с, осталось 2 с', self.progress.format())
+
+    def test_eta_by_count(self):
+        self.progress.set_total(count_total=10)
+        self.clock.now = 1
+        self.progress.advance(5)
+        self.assertEqual(1, self.progress.eta)
+        self.assertEqual(5, self.progress.as_dict()['count_done'])
+
+
+class ScanProgressTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for file_path, content in ORIGIN_FS:
+            self.fs.create_file(file_path=file_path, contents=content)
+
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def test_prewalk_totals_and_bytes(self):
+        snapshots = []
+        progress = Progress(lambda progress: snapshots.append(progress.as_dict()))
+        self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', progress=progress, prewalk=True)
+        total_size = sum(len(content) for _, content in ORIGIN_FS)
+        self.assertEqual(3, snapshots[-1]['count_total'])
+        self.assertEqual(total_size, snapshots[-1]['bytes_total'])
+        self.assertEqual(total_size, snapshots[-1]['bytes_hashed'])
+        self.assertTrue(snapshots[-1]['is_finished'])
+
+        progress = Progress()
+        self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', progress=progress)
+        self.assertEqual((3, total_size, 0), (progress.count_done, progress.bytes_done, progress.bytes_hashed))
+
+    def test_legacy_callbacks(self):
+        counts, current_files = [], []
+        self.origin_ls.scan_to_db(
+            library_path='/origin',
+            process_dublicate='original',
+            progress_count_scanned_files=counts.append,
+            progress_current_file=current_files.append,
+        )
+        self.assertEqual(3, counts[-1])
+        self.assertEqual(len(counts), len(current_files))
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from src.scanner import DBStorage, TagFilter
+
+
+class QueryPlanTestCase(TestCase):
+    """Запросы списка файлов и тегов должны идти по индексам, а не полным просмотром таблиц"""
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+
+    def tearDown(self):
+        self.db.close()
+
+    def get_plan(self, sql, sql_params=()):
+        return [row[3] for row in self.db.cu.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params).fetchall()]
+
+    def get_list_plan(self, **kwargs):
+        sql, sql_params = self.db._sql_builder(**kwargs)
+        return self.get_plan(sql, [*sql_params, 100])
+
+    def test_file_tag_queries(self):
+        self.assertEqual(
+            ['SEARCH file_tag USING PRIMARY KEY (file_id=? AND tag_id=?)'],
+            self.get_plan(DBStorage.SQL_CHECK_TAG_FILE, (1, 1)),
+        )
+        self.assertEqual(
+            ['SEARCH file_tag USING COVERING INDEX file_tag_tag_id (tag_id=?)'],
+            self.get_plan(DBStorage.SQL_SELECT_COUNT_FILES_FOR_TAG, (1,)),
+        )
+        self.assertIn(
+            'SEARCH file_tag USING PRIMARY KEY (file_id=?)',
+            self.get_plan(DBStorage.SQL_SELECT_TAGS_BY_FILE, (1,)),
+        )
+        self.assertEqual(
+            ['SEARCH tags USING COVERING INDEX tags_parent_id (parent_id=?)'],
+            self.get_plan(DBStorage.SQL_SELECT_TAGS, (1,)),
+        )
+
+    def test_list_by_filename_is_covered(self):
+        self.assertEqual(['SCAN files USING COVERING INDEX files_filename'], self.get_list_plan())
+        self.assertEqual(
+            ['SEARCH files USING COVERING INDEX files_filename (filename>?)'],
+            self.get_list_plan(last_key=('книга.pdf', 1)),
+        )
+
+    def test_list_by_directory(self):
+        plan = self.get_list_plan(order_by='files.directory', last_key=('Книги', 1))
+        self.assertEqual(['SEARCH files USING INDEX files_directory (directory>?)'], plan)
+
+    def test_deleted_files(self):
+        self.assertEqual(['SCAN files USING INDEX files_deleted'], self.get_list_plan(only_deleted=True))
+
+    def test_tag_filter(self):
+        plan = self.get_list_plan(tags=[1, 2])
+        self.assertIn('SEARCH file_tag USING COVERING INDEX file_tag_tag_id (tag_id=?)', plan)
+        self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+
+    def test_tag_filter_uses_semi_joins(self):
+        plan = self.get_list_plan(tags=TagFilter(all_of=[1, 2], none_of=[3]))
+        self.assertIn('SEARCH files USING INTEGER PRIMARY KEY (rowid=?)', plan)
+        self.assertIn('INTERSECT USING TEMP B-TREE', plan)
+        self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+        self.assertFalse([step for step in plan if 'GROUP BY' in step], plan)
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import zipfile
+from unittest.mock import patch
+
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage, STATUS_DELETED, STATUS_NEW, STATUS_UNTOUCHED
+
+SQL_SELECT_FILES = 'select lower(hex(hash)), directory, filename from files where is_deleted = 0 order by id'
+
+MEMBERS = (
+    ('book01.pdf', b'content01'),
+    ('sub/book02.pdf', b'content02'),
+    ('sub/', b''),
+)
+
+
+def make_zip(members):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as archive:
+        for name, member_content in members:
+            archive.writestr(name, member_content)
+
+    return content.getvalue()
+
+
+def make_broken_zip(members, encrypted=(), corrupted=()):
+    """Архив, где файлы encrypted отмечены зашифрованными, а содержимое файлов corrupted не сходится с CRC"""
+    content = bytearray(make_zip(members))
+    with zipfile.ZipFile(io.BytesIO(bytes(content))) as archive:
+        infos = archive.infolist()
+
+    central_offset = content.index(b'PK\x01\x02')
+    for info in infos:
+        central_offset = content.index(b'PK\x01\x02', central_offset)
+        if info.filename in encrypted:
+            content[info.header_offset + 6] |= 0x1
+            content[central_offset + 8] |= 0x1
+
+        if info.filename in corrupted:
+            data_offset = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+            content[data_offset] ^= 0xff
+
+        central_offset += 4
+
+    return bytes(content)
+
+
+def blake2s(content):
+    return hashlib.blake2s(content).hexdigest()
+
+
+class ScanArchivesTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        self.fs.create_file('/origin/file01.txt', contents='content00')
+        self.fs.create_file('/origin/books/bundle.zip', contents=make_zip(MEMBERS))
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+        self.results = []
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def func(self, status, existed_path, inserted_path, file_hash):
+        self.results.append((status, inserted_path or existed_path))
+
+    def scan(self, **kwargs):
+        self.results.clear()
+        kwargs.setdefault('scan_archives', True)
+        self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', func=self.func, **kwargs)
+        return self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
+
+    def test_members_are_files_of_virtual_directories(self):
+        expected = [
+            (blake2s(b'content00'), '', 'file01.txt'),
+            (blake2s(b'content01'), 'books/bundle.zip!', 'book01.pdf'),
+            (blake2s(b'content02'), 'books/bundle.zip!/sub', 'book02.pdf'),
+        ]
+        self.assertEqual(expected, self.scan())
+        self.assertEqual(expected, self.scan(workers=2, full_rehash=True))
+
+    def test_unchanged_archive_is_not_opened(self):
+        self.scan()
+        with patch('src.scanner.zipfile.ZipFile', side_effect=AssertionError('архив открыт')):
+            self.scan()
+
+        self.assertEqual({STATUS_UNTOUCHED}, {status for status, _ in self.results})
+
+    def test_changed_archive(self):
+        self.scan()
+        self.fs.remove('/origin/books/bundle.zip')
+        self.fs.create_file('/origin/books/bundle.zip', contents=make_zip((MEMBERS[0], ('book03.pdf', b'content03'))))
+        rows = self.scan()
+        self.assertIn((blake2s(b'content03'), 'books/bundle.zip!', 'book03.pdf'), rows)
+        self.assertIn((STATUS_NEW, 'books/bundle.zip!/book03.pdf'), self.results)
+        self.assertIn((STATUS_DELETED, 'books/bundle.zip!/sub/book02.pdf'), self.results)
+        self.assertNotIn(('books/bundle.zip!/sub', 'book02.pdf'), self.origin_ls.db.select_file_stats())
+
+    def test_quick_hash(self):
+        self.assertEqual(self.scan(), self.scan(quick_hash=True, full_rehash=True))
+
+    def test_archives_are_files_by_default(self):
+        rows = self.scan(scan_archives=False)
+        self.assertEqual(['file01.txt', 'bundle.zip'], [filename for _, _, filename in rows])
+
+    def test_broken_archive_is_file(self):
+        self.fs.create_file('/origin/broken.zip', contents='not a zip')
+        rows = self.scan()
+        self.assertIn((blake2s(b'not a zip'), '', 'broken.zip'), rows)
+
+    def test_unreadable_members_are_skipped(self):
+        self.fs.create_file('/origin/mixed.zip', contents=make_broken_zip(
+            (('good.pdf', b'content05'), ('secret.pdf', b'content06'), ('corrupt.pdf', b'content07')),
+            encrypted=('secret.pdf',),
+            corrupted=('corrupt.pdf',),
+        ))
+        expected_member = (blake2s(b'content05'), 'mixed.zip!', 'good.pdf')
+        for kwargs in ({}, {'workers': 2}, {'quick_hash': True}):
+            rows = self.scan(full_rehash=True, **kwargs)
+            self.assertIn(expected_member, rows)
+            self.assertEqual(['good.pdf'], [filename for _, directory, filename in rows if directory == 'mixed.zip!'])
+
+    def test_encrypted_archive_is_file(self):
+        content = make_broken_zip((('secret.pdf', b'content06'),), encrypted=('secret.pdf',))
+        self.fs.create_file('/origin/secret.zip', contents=content)
+        for kwargs in ({}, {'workers': 2}, {'quick_hash': True}):
+            self.assertIn((blake2s(content), '', 'secret.zip'), self.scan(full_rehash=True, **kwargs))
+
+    def test_ignore_rules_apply_to_members(self):
+        self.fs.create_file('/origin/ignored.zip', contents=make_zip((
+            ('book05.pdf', b'content05'),
+            ('draft.tmp', b'content06'),
+            ('.git/config', b'content07'),
+            ('sub/.git/HEAD', b'content08'),
+            ('sqlite3.db', b'content09'),
+        )))
+        for kwargs in ({'full_rehash': True}, {'workers': 2, 'full_rehash': True}, {'quick_hash': True}, {}):
+            rows = self.scan(ignore_patterns=['*.tmp'], ignore_directories=['.git'], **kwargs)
+            self.assertEqual(['book05.pdf'], [filename for _, directory, filename in rows if directory == 'ignored.zip!'])
+
+        # неизменившийся архив не открывается, поэтому снятый шаблон учитывается при полном пересчёте
+        rows = self.scan(full_rehash=True)
+        self.assertIn((blake2s(b'content06'), 'ignored.zip!', 'draft.tmp'), rows)
+        rows = self.scan(ignore_patterns=['*.tmp'])
+        self.assertNotIn((blake2s(b'content06'), 'ignored.zip!', 'draft.tmp'), rows)
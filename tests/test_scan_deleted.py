@@ -0,0 +1,65 @@
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage, STATUS_DELETED
+
+SQL_SELECT_DELETED = 'select filename from files where is_deleted = 1 order by filename'
+SQL_COUNT_FILE_WRITES = '''
+    CREATE TEMP TABLE file_writes (file_id INTEGER);
+    CREATE TEMP TRIGGER count_file_updates AFTER UPDATE ON main.files BEGIN
+        INSERT INTO file_writes VALUES (new.id);
+    END;
+    CREATE TEMP TRIGGER count_file_inserts AFTER INSERT ON main.files BEGIN
+        INSERT INTO file_writes VALUES (new.id);
+    END;'''
+
+ORIGIN_FS = (
+    ('/origin/file01.txt', 'content01'),
+    ('/origin/file02.txt', 'content02'),
+    ('/origin/directory01/file03.txt', 'content03'),
+)
+
+
+class DeletedFilesTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for file_path, content in ORIGIN_FS:
+            self.fs.create_file(file_path=file_path, contents=content)
+
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+        self.origin_ls.db.writer.connection.executescript(SQL_COUNT_FILE_WRITES)
+        self.scan()
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def scan(self):
+        self.deleted = []
+        self.origin_ls.db.cu.execute('DELETE FROM temp.file_writes')
+        self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', func=self.func)
+        return [row[0] for row in self.origin_ls.db.cu.execute('select file_id from temp.file_writes')]
+
+    def func(self, status, existed_path, inserted_path, file_hash):
+        if status == STATUS_DELETED:
+            self.deleted.append(existed_path)
+
+    def select_deleted(self):
+        return [row[0] for row in self.origin_ls.db.cu.execute(SQL_SELECT_DELETED)]
+
+    def test_rescan_without_changes_writes_no_files(self):
+        self.assertEqual([], self.scan())
+        self.assertEqual([], self.deleted)
+
+    def test_only_changed_rows_are_written(self):
+        self.fs.remove('/origin/file02.txt')
+        self.assertEqual([2], self.scan())
+        self.assertEqual(['file02.txt'], self.select_deleted())
+        self.assertEqual(['file02.txt'], self.deleted)
+
+        # удалённый ранее файл сообщается снова, но не перезаписывается
+        self.assertEqual([], self.scan())
+        self.assertEqual(['file02.txt'], self.deleted)
+
+        self.fs.create_file('/origin/file02.txt', contents='content02')
+        self.assertEqual([2], self.scan())
+        self.assertEqual([], self.select_deleted())
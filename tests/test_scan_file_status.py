@@ -0,0 +1,62 @@
+import os
+from unittest.mock import patch
+
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage, STATUS_DUPLICATE, STATUS_MOVED, STATUS_UNTOUCHED
+
+ORIGIN_FS = (
+    ('/origin/file01.txt', 'content01'),
+    ('/origin/z/book02.pdf', 'content02'),
+    ('/origin/z/book03.pdf', 'content03'),
+)
+
+
+class FileStatusTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for file_path, file_content in ORIGIN_FS:
+            self.fs.create_file(file_path=file_path, contents=file_content)
+
+        self.origin_ls = LibraryStorage()
+        # каждый файл вставляется отдельной порцией, чтобы путь из базы ещё не встречался при обходе
+        self.origin_ls.set_db(DBStorage(':memory:', count_rows_for_insert=1))
+        self.results = []
+        self.scan()
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def func(self, status, existed_path, inserted_path, file_hash):
+        self.results.append((status, existed_path, inserted_path))
+
+    def scan(self):
+        self.results.clear()
+        with patch.object(os.path, 'exists') as exists:
+            self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', func=self.func)
+
+        exists.assert_not_called()
+
+    def select_path(self, filename):
+        sql = 'select directory, filename from files where filename = ?'
+        return self.origin_ls.db.cu.execute(sql, (filename,)).fetchall()
+
+    def test_copy_walked_before_original_is_duplicate(self):
+        self.fs.create_file(file_path='/origin/copy.pdf', contents='content02')
+        self.scan()
+        self.assertIn((STATUS_DUPLICATE, 'z/book02.pdf', 'copy.pdf'), self.results)
+        self.assertIn((STATUS_UNTOUCHED, 'z/book02.pdf', 'z/book02.pdf'), self.results)
+
+    def test_moved_file(self):
+        self.fs.rename('/origin/z/book02.pdf', '/origin/book02.pdf')
+        self.scan()
+        self.assertIn((STATUS_MOVED, 'z/book02.pdf', 'book02.pdf'), self.results)
+        self.assertEqual([('', 'book02.pdf')], self.select_path('book02.pdf'))
+
+    def test_copy_of_moved_file_is_duplicate_of_new_path(self):
+        self.fs.create_dir('/origin/a')
+        self.fs.rename('/origin/z/book03.pdf', '/origin/a/book03.pdf')
+        self.fs.create_file(file_path='/origin/b/book03.pdf', contents='content03')
+        self.scan()
+        self.assertIn((STATUS_MOVED, 'z/book03.pdf', 'a/book03.pdf'), self.results)
+        self.assertIn((STATUS_DUPLICATE, 'a/book03.pdf', 'b/book03.pdf'), self.results)
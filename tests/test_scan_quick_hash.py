@@ -0,0 +1,111 @@
+import os
+from unittest.mock import patch
+
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import (
+    DBStorage, LibraryStorage, PARTIAL_HASH_BLOCKSIZE, STATUS_DELETED, STATUS_DUPLICATE, STATUS_MOVED, STATUS_NEW,
+    STATUS_UNTOUCHED, Progress, get_file_hash, get_file_hashes, get_file_partial_hash,
+)
+
+HEAD = 'h' * PARTIAL_HASH_BLOCKSIZE
+TAIL = 't' * PARTIAL_HASH_BLOCKSIZE
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
+
+class QuickHashTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        self.fs.create_file(file_path='/origin/book01.pdf', contents=f'{HEAD}middle01{TAIL}')
+        self.fs.create_file(file_path='/origin/book02.pdf', contents=f'{HEAD}middle0002{TAIL}')
+        self.fs.create_file(file_path='/origin/note.txt', contents='small file')
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+        self.results = []
+        self.hashed_files = []
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def func(self, status, existed_path, inserted_path, file_hash):
+        self.results.append((status, existed_path, inserted_path))
+
+    def counting_get_file_hashes(self, file_path):
+        self.hashed_files.append(os.path.relpath(file_path, '/origin'))
+        return get_file_hashes(file_path)
+
+    def counting_get_file_hash(self, file_path):
+        self.hashed_files.append(os.path.relpath(file_path, '/origin'))
+        return get_file_hash(file_path)
+
+    def scan(self, quick_hash=True, **kwargs):
+        self.results.clear()
+        self.hashed_files.clear()
+        with patch('src.scanner.get_file_hashes', self.counting_get_file_hashes), \
+                patch('src.scanner.get_file_hash', self.counting_get_file_hash):
+            self.origin_ls.scan_to_db(
+                library_path='/origin', process_dublicate='original', func=self.func, quick_hash=quick_hash, **kwargs,
+            )
+
+    def select_hash(self, filename):
+        sql = 'select lower(hex(hash)) from files where filename=? and is_deleted=0'
+        return self.origin_ls.db.cu.execute(sql, (filename,)).fetchone()[0]
+
+    def test_new_files_are_keyed_by_full_hash(self):
+        self.scan()
+        self.assertEqual(['book01.pdf', 'book02.pdf', 'note.txt'], self.hashed_files)
+        self.assertEqual(get_file_hash('/origin/book01.pdf'), self.select_hash('book01.pdf'))
+        file_stats = self.origin_ls.db.select_file_stats()
+        self.assertEqual(get_file_partial_hash('/origin/book01.pdf'), file_stats[('', 'book01.pdf')][4])
+
+    def test_moved_file_is_not_hashed_fully(self):
+        self.scan()
+        self.fs.create_dir('/origin/moved')
+        self.fs.rename('/origin/book02.pdf', '/origin/moved/book02.pdf')
+        self.scan()
+        self.assertEqual([], self.hashed_files)
+        self.assertIn((STATUS_MOVED, 'book02.pdf', 'moved/book02.pdf'), self.results)
+        self.assertEqual(get_file_hash('/origin/moved/book02.pdf'), self.select_hash('book02.pdf'))
+
+    def test_moved_file_with_other_content_is_hashed_fully(self):
+        self.scan()
+        stat = os.stat('/origin/book02.pdf')
+        self.fs.remove('/origin/book02.pdf')
+        self.fs.create_file(file_path='/origin/book03.pdf', contents=f'{HEAD}middle0003{TAIL}')
+        os.utime('/origin/book03.pdf', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.scan()
+        self.assertEqual(['book03.pdf'], self.hashed_files)
+        self.assertIn((STATUS_NEW, None, 'book03.pdf'), self.results)
+
+    def test_edit_in_the_middle_is_detected(self):
+        self.scan()
+        self.fs.remove('/origin/book01.pdf')
+        self.fs.create_file(file_path='/origin/book01.pdf', contents=f'{HEAD}middle99{TAIL}')
+        self.scan()
+        self.assertIn((STATUS_NEW, None, 'book01.pdf'), self.results)
+        self.assertEqual(get_file_hash('/origin/book01.pdf'), self.select_hash('book01.pdf'))
+
+    def test_full_rehash_after_quick_scan_keeps_files(self):
+        self.scan()
+        files = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
+        self.scan(quick_hash=False, full_rehash=True)
+        self.assertEqual({STATUS_UNTOUCHED}, {status for status, _, _ in self.results})
+        self.assertEqual(files, self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall())
+
+    def test_copy_after_quick_scan_is_duplicate(self):
+        self.scan()
+        self.fs.create_file(file_path='/origin/copy/book01.pdf', contents=f'{HEAD}middle01{TAIL}')
+        self.scan(quick_hash=False)
+        self.assertIn((STATUS_DUPLICATE, 'book01.pdf', 'copy/book01.pdf'), self.results)
+        self.assertNotIn(STATUS_DELETED, {status for status, _, _ in self.results})
+        self.assertEqual(3, self.origin_ls.db.get_count_rows())
+
+    def test_files_are_yielded_while_hashing(self):
+        for number in range(20):
+            self.fs.create_file(file_path=f'/origin/many/book{number:02}.pdf', contents=f'content{number:02}')
+
+        hashed_before_progress = []
+        progress = Progress(lambda progress: hashed_before_progress.append(len(self.hashed_files)), step=1, interval=0)
+        self.scan(progress=progress)
+        self.assertEqual(23, len(self.hashed_files))
+        self.assertLess(hashed_before_progress[0], 10)
@@ -0,0 +1,66 @@
+import os
+from unittest.mock import patch
+
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage, STATUS_NEW, STATUS_UNTOUCHED, get_file_hash
+
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
+ORIGIN_FS = (
+    ('/origin/file01.txt', 'content01'),
+    ('/origin/file02.txt', 'content02'),
+    ('/origin/directory01/file03.txt', 'content03'),
+)
+
+
+class StatCacheTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for file_path, content in ORIGIN_FS:
+            self.fs.create_file(file_path=file_path, contents=content)
+
+        self.origin_ls = LibraryStorage()
+        self.origin_ls.set_db(DBStorage(':memory:'))
+        self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original')
+        self.results = []
+        self.hashed_files = []
+
+    def tearDown(self):
+        self.origin_ls.__exit__(None, None, None)
+
+    def func(self, status, existed_path, inserted_path, file_hash):
+        self.results.append((status, inserted_path))
+
+    def counting_get_file_hash(self, file_path):
+        self.hashed_files.append(os.path.relpath(file_path, '/origin'))
+        return get_file_hash(file_path)
+
+    def rescan(self, **kwargs):
+        with patch('src.scanner.get_file_hash', self.counting_get_file_hash):
+            self.origin_ls.scan_to_db(library_path='/origin', process_dublicate='original', func=self.func, **kwargs)
+
+    def test_rescan_without_changing_skips_hashing(self):
+        data_before = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
+        self.rescan()
+        data_after = self.origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
+        self.assertEqual([], self.hashed_files)
+        self.assertEqual(data_before, data_after)
+        self.assertEqual({STATUS_UNTOUCHED}, {status for status, _ in self.results})
+
+    def test_rescan_rehashes_changed_file(self):
+        self.fs.remove('/origin/file02.txt')
+        self.fs.create_file(file_path='/origin/file02.txt', contents='content02 changed')
+        self.rescan()
+        self.assertEqual(['file02.txt'], self.hashed_files)
+        self.assertIn((STATUS_NEW, 'file02.txt'), self.results)
+
+    def test_full_rehash(self):
+        self.rescan(full_rehash=True)
+        self.assertEqual(len(ORIGIN_FS), len(self.hashed_files))
+        self.assertEqual({STATUS_UNTOUCHED}, {status for status, _ in self.results})
+
+    def test_stats_of_removed_files_are_pruned(self):
+        self.fs.remove('/origin/directory01/file03.txt')
+        self.rescan()
+        self.assertNotIn(('directory01', 'file03.txt'), self.origin_ls.db.select_file_stats())
@@ -0,0 +1,33 @@
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LibraryStorage
+
+SQL_SELECT_FILES = 'select lower(hex(hash)), id, directory, filename, is_deleted from files'
+
+
+class ScanWorkersTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for number in range(1, 41):
+            self.fs.create_file(
+                file_path=f'/origin/directory{number % 4:02}/file{number:02}.txt',
+                contents=f'content{number % 35:02}',  # часть файлов - дубликаты
+            )
+
+    def scan(self, workers):
+        results = []
+        with LibraryStorage() as origin_ls:
+            origin_ls.set_db(DBStorage(':memory:'))
+            origin_ls.scan_to_db(
+                library_path='/origin',
+                process_dublicate='original',
+                func=lambda *args: results.append(args),
+                workers=workers,
+            )
+            data_origin = origin_ls.db.cu.execute(SQL_SELECT_FILES).fetchall()
+
+        return data_origin, results
+
+    def test_result_does_not_depend_on_workers(self):
+        data_origin, results = self.scan(workers=1)
+        self.assertEqual((data_origin, results), self.scan(workers=4))
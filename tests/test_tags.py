@@ -0,0 +1,239 @@
+from unittest import TestCase
+
+from src.scanner import DBStorage, TagFilter
+from tests.library_storage_fabric import make_hash
+
+
+class TagCountsTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        for file_id in range(1, 6):
+            self.db.append_row((make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf'))
+
+        self.db.insert_rows()
+        self.genre_id = self.db.insert_tag('Жанр')
+        self.fiction_id = self.db.insert_tag('Фантастика', self.genre_id)
+        self.detective_id = self.db.insert_tag('Детектив', self.genre_id)
+        self.db.assign_tag(self.fiction_id, 1)
+        self.db.assign_tag(self.fiction_id, 2)
+        self.db.assign_tag(self.detective_id, 2)
+        self.db.assign_tag(self.detective_id, 3)
+
+    def tearDown(self):
+        self.db.close()
+
+    def assertCountsMatchDB(self):
+        for tag_id in (self.genre_id, self.fiction_id, self.detective_id):
+            expected = self.db.cu.execute(DBStorage.SQL_SELECT_COUNT_FILES_FOR_TAG, (tag_id,)).fetchone()[0]
+            self.assertEqual(expected, self.db.select_count_files_by_tag(tag_id))
+
+    def test_counts_are_loaded_at_once(self):
+        self.assertEqual({self.fiction_id: 2, self.detective_id: 2}, self.db.get_tag_counts())
+        self.assertEqual(0, self.db.select_count_files_by_tag(self.genre_id))
+
+    def test_assign_and_unassign(self):
+        self.db.get_tag_counts()
+        self.assertFalse(self.db.assign_tag(self.fiction_id, 1))
+        self.db.assign_tag(self.fiction_id, 3)
+        self.db.unassign_tag(self.detective_id, 2)
+        self.db.unassign_tag(self.detective_id, 2)
+        self.assertEqual(3, self.db.select_count_files_by_tag(self.fiction_id))
+        self.assertEqual(1, self.db.select_count_files_by_tag(self.detective_id))
+        self.assertCountsMatchDB()
+
+    def test_delete_file_removes_its_tags(self):
+        self.db.get_tag_counts()
+        self.db.delete_file(make_hash(2))
+        self.assertEqual([(1, self.fiction_id), (3, self.detective_id)], list(self.db.select_all_tag_files()))
+        self.assertCountsMatchDB()
+
+    def test_rolled_up_counts(self):
+        self.assertEqual(3, self.db.select_count_files_by_tag(self.genre_id, with_descendants=True))
+        self.assertEqual(2, self.db.select_count_files_by_tag(self.fiction_id, with_descendants=True))
+        child_id = self.db.insert_tag('Космос', self.fiction_id)
+        self.db.assign_tag(child_id, 4)
+        self.assertEqual(4, self.db.select_count_files_by_tag(self.genre_id, with_descendants=True))
+        self.db.unassign_tag(child_id, 4)
+        self.assertEqual(3, self.db.select_count_files_by_tag(self.genre_id, with_descendants=True))
+
+
+    def test_rolled_up_counts_are_loaded_at_once(self):
+        self.db.assign_tag(self.genre_id, 2)
+        expected = {
+            tag_id: self.db.cu.execute(DBStorage.SQL_SELECT_COUNT_FILES_FOR_TAG_TREE, (tag_id,)).fetchone()[0]
+            for tag_id in (self.genre_id, self.fiction_id, self.detective_id)
+        }
+        self.assertEqual(expected, self.db.get_rolled_up_tag_counts())
+        self.db.assign_tag(self.fiction_id, 4)
+        self.assertEqual({self.detective_id: 2}, self.db.get_rolled_up_tag_counts())
+        self.assertEqual(4, self.db.select_count_files_by_tag(self.genre_id, with_descendants=True))
+        self.assertEqual(3, self.db.select_count_files_by_tag(self.fiction_id, with_descendants=True))
+
+
+class TagTreeTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        self.genre_id = self.db.insert_tag('Жанр')
+        self.fiction_id = self.db.insert_tag('Фантастика', self.genre_id)
+        self.space_id = self.db.insert_tag('Космос', self.fiction_id)
+        self.detective_id = self.db.insert_tag('Детектив', self.genre_id)
+        self.author_id = self.db.insert_tag('Автор')
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_preorder(self):
+        self.assertEqual(
+            [
+                (self.genre_id, 'Жанр', None, 0),
+                (self.fiction_id, 'Фантастика', self.genre_id, 1),
+                (self.space_id, 'Космос', self.fiction_id, 2),
+                (self.detective_id, 'Детектив', self.genre_id, 1),
+                (self.author_id, 'Автор', None, 0),
+            ],
+            list(self.db.get_tag_tree()),
+        )
+
+    def test_ancestors_and_descendants(self):
+        tree = self.db.get_tag_tree()
+        self.assertEqual([self.fiction_id, self.space_id, self.detective_id], tree.get_descendants(self.genre_id))
+        self.assertEqual([], tree.get_descendants(self.space_id))
+        self.assertEqual([self.fiction_id, self.genre_id], tree.get_ancestors(self.space_id))
+        self.assertTrue(tree.is_ancestor(self.genre_id, self.space_id))
+        self.assertFalse(tree.is_ancestor(self.space_id, self.genre_id))
+        self.assertFalse(tree.is_ancestor(self.detective_id, self.space_id))
+        self.assertFalse(tree.is_ancestor(self.genre_id, self.genre_id))
+        self.assertEqual(2, tree.get_depth(self.space_id))
+
+    def test_tree_is_cached_until_tags_change(self):
+        tree = self.db.get_tag_tree()
+        self.assertIs(tree, self.db.get_tag_tree())
+        child_id = self.db.insert_tag('Роботы', self.fiction_id)
+        tree = self.db.get_tag_tree()
+        self.assertIn(child_id, tree)
+        self.assertTrue(tree.is_ancestor(self.genre_id, child_id))
+        self.db.update_tag(child_id, 'Андроиды')
+        self.assertEqual('Андроиды', self.db.get_tag_tree().names[child_id])
+        self.db.delete_tag(child_id)
+        self.assertNotIn(child_id, self.db.get_tag_tree())
+
+
+class TagFilterTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        for file_id in range(1, 6):
+            self.db.append_row((make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf'))
+
+        self.db.insert_rows()
+        self.genre_id = self.db.insert_tag('Жанр')
+        self.fiction_id = self.db.insert_tag('Фантастика', self.genre_id)
+        self.space_id = self.db.insert_tag('Космос', self.fiction_id)
+        self.detective_id = self.db.insert_tag('Детектив', self.genre_id)
+        self.paper_id = self.db.insert_tag('Бумажная')
+        for tag_id, file_id in (
+            (self.fiction_id, 1),
+            (self.space_id, 2),
+            (self.detective_id, 3),
+            (self.paper_id, 1),
+            (self.paper_id, 2),
+            (self.paper_id, 4),
+        ):
+            self.db.assign_tag(tag_id, file_id)
+
+    def tearDown(self):
+        self.db.close()
+
+    def select_file_ids(self, tags):
+        file_ids = [row[1] for row in self.db.select_rows(tags, fetch_size=2)]
+        self.assertEqual(len(file_ids), self.db.select_count(tags))
+        return file_ids
+
+    def test_list_means_any_tag_without_descendants(self):
+        self.assertEqual([1], self.select_file_ids([str(self.fiction_id)]))
+        self.assertEqual([1, 3], self.select_file_ids([self.fiction_id, self.detective_id]))
+        self.assertEqual([], self.select_file_ids([self.genre_id]))
+
+    def test_descendants(self):
+        self.assertEqual([1, 2, 3], self.select_file_ids(TagFilter(all_of=[self.genre_id])))
+        self.assertEqual([1, 2], self.select_file_ids(TagFilter(any_of=[self.fiction_id])))
+        self.assertEqual([], self.select_file_ids(TagFilter(all_of=[self.genre_id], with_descendants=False)))
+
+    def test_all_of(self):
+        self.assertEqual([1, 2], self.select_file_ids(TagFilter(all_of=[self.genre_id, self.paper_id])))
+        self.assertEqual([2], self.select_file_ids(TagFilter(all_of=[self.space_id, self.paper_id])))
+
+    def test_none_of(self):
+        self.assertEqual([3, 5], self.select_file_ids(TagFilter(none_of=[self.paper_id])))
+        self.assertEqual([1, 3], self.select_file_ids(TagFilter(all_of=[self.genre_id], none_of=[self.space_id])))
+        self.assertEqual(
+            [4],
+            self.select_file_ids(TagFilter(all_of=[self.paper_id], none_of=[self.genre_id])),
+        )
+
+    def test_any_of_with_all_of(self):
+        tag_filter = TagFilter(all_of=[self.paper_id], any_of=[self.space_id, self.detective_id])
+        self.assertEqual([2], self.select_file_ids(tag_filter))
+
+    def test_new_child_tag_is_included(self):
+        tag_filter = TagFilter(all_of=[self.genre_id])
+        self.assertEqual([1, 2, 3], self.select_file_ids(tag_filter))
+        classic_id = self.db.insert_tag('Классика', self.detective_id)
+        self.db.assign_tag(classic_id, 5)
+        self.assertEqual([1, 2, 3, 5], self.select_file_ids(tag_filter))
+
+
+class FileTagsCacheTestCase(TestCase):
+    def setUp(self):
+        self.db = DBStorage(':memory:')
+        for file_id in range(1, 6):
+            self.db.append_row((make_hash(file_id), file_id, 'Книги', f'книга {file_id}.pdf'))
+
+        self.db.insert_rows()
+        self.fiction_id = self.db.insert_tag('Фантастика')
+        self.detective_id = self.db.insert_tag('Детектив')
+        self.db.assign_tag(self.fiction_id, 1)
+        self.db.assign_tag(self.detective_id, 1)
+        self.db.assign_tag(self.detective_id, 2)
+        self.queries = []
+        self.db.writer.connection.set_trace_callback(self.queries.append)
+
+    def tearDown(self):
+        self.db.close()
+
+    def count_tag_queries(self):
+        return len([sql for sql in self.queries if 'FROM file_tag INNER JOIN tags' in sql])
+
+    def test_tags_of_many_files_in_one_query(self):
+        self.assertEqual(
+            {
+                1: (('Детектив', self.detective_id), ('Фантастика', self.fiction_id)),
+                2: (('Детектив', self.detective_id),),
+                3: (),
+            },
+            self.db.get_tags_by_files([1, 2, 3]),
+        )
+        self.assertEqual([('Детектив', self.detective_id)], list(self.db.select_tags_by_file(2)))
+        self.assertEqual([], list(self.db.select_tags_by_file(3)))
+        self.assertEqual(1, self.count_tag_queries())
+
+    def test_queries_are_chunked(self):
+        self.db.COUNT_FILES_IN_TAGS_QUERY = 2
+        self.assertEqual(5, len(self.db.get_tags_by_files(range(1, 6))))
+        self.assertEqual(3, self.count_tag_queries())
+
+    def test_invalidation(self):
+        self.db.get_tags_by_files([1, 2, 3])
+        self.db.assign_tag(self.fiction_id, 3)
+        self.db.unassign_tag(self.detective_id, 1)
+        self.assertEqual((('Фантастика', self.fiction_id),), self.db.get_tags_by_files([3])[3])
+        self.assertEqual((('Фантастика', self.fiction_id),), self.db.get_tags_by_files([1])[1])
+        self.db.update_tag(self.detective_id, 'Детективы')
+        self.assertEqual((('Детективы', self.detective_id),), self.db.get_tags_by_files([2])[2])
+
+    def test_cache_size(self):
+        self.db.FILE_TAGS_CACHE_SIZE = 2
+        self.db.get_tags_by_files([1, 2, 3])
+        self.assertEqual([2, 3], list(self.db.file_tags))
+        self.db.get_tags_by_files([2])
+        self.db.get_tags_by_files([4])
+        self.assertEqual([2, 4], list(self.db.file_tags))
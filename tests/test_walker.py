@@ -0,0 +1,77 @@
+import os
+
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+from src.scanner import DBStorage, LIBRARY_IGNORE_PATTERNS, LibraryStorage
+from src.walker import Walker
+
+ORIGIN_FS = (
+    ('/origin/file01.txt', 'content01'),
+    ('/origin/sqlite3.db', 'database'),
+    ('/origin/directory01/file02.txt', 'content02'),
+    ('/origin/directory01/sub/file03.txt', 'content03'),
+    ('/origin/directory02/file04.tmp', 'content04'),
+    ('/origin/.git/objects/file05', 'content05'),
+    ('/origin/notes/.obsidian/file06.json', 'content06'),
+    ('/origin/notes/@eaDir/file07.txt', 'content07'),
+)
+
+
+class WalkerTestCase(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        for file_path, file_content in ORIGIN_FS:
+            self.fs.create_file(file_path=file_path, contents=file_content)
+
+    def legacy_walk(self):
+        for directory, _, filenames in os.walk('/origin'):
+            directory = os.path.relpath(directory, '/origin').replace(os.path.sep, '/')
+            for filename in filenames:
+                yield '' if directory == '.' else directory, filename
+
+    def test_order_matches_os_walk(self):
+        walker = Walker(ignore_directories=())
+        paths = [(directory, filename) for directory, filename, _, _ in walker.walk('/origin')]
+        self.assertEqual(list(self.legacy_walk()), paths)
+
+    def test_full_path_and_stat(self):
+        cwd = os.getcwd()
+        for directory, filename, full_path, stat in Walker().walk('/origin'):
+            self.assertEqual(os.path.join('/origin', directory, filename), full_path)
+            self.assertEqual(os.stat(full_path).st_size, stat.st_size)
+
+        self.assertEqual(cwd, os.getcwd())
+
+    def test_ignore_patterns_and_directories(self):
+        walker = Walker([*LIBRARY_IGNORE_PATTERNS, '*.tmp'])
+        paths = [f'{directory}/{filename}' for directory, filename, _, _ in walker.walk('/origin')]
+        self.assertEqual(['/file01.txt', 'directory01/file02.txt', 'directory01/sub/file03.txt'], paths)
+
+    def test_ignored_archive_members(self):
+        walker = Walker(['*.tmp'], ['.git'])
+        self.assertEqual(
+            [False, True, True, False],
+            [
+                walker.is_ignored_member(name)
+                for name in ('book.pdf', 'sub/draft.tmp', '.git/sub/config', 'sub.git/book.pdf')
+            ],
+        )
+
+    def test_scan_skips_ignored(self):
+        with LibraryStorage() as lib_storage:
+            lib_storage.set_db(DBStorage(':memory:'))
+            lib_storage.scan_to_db(
+                library_path='/origin', process_dublicate='original', ignore_patterns=['*.tmp'],
+                ignore_directories=['.git', 'sub'],
+            )
+            rows = lib_storage.db.cu.execute('select directory, filename from files order by id').fetchall()
+
+        self.assertEqual(
+            [
+                ('', 'file01.txt'),
+                ('directory01', 'file02.txt'),
+                ('notes/.obsidian', 'file06.json'),
+                ('notes/@eaDir', 'file07.txt'),
+            ],
+            rows,
+        )